@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import os
+from typing import Dict
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from before_commit import git
+
+StatT = Optional[Tuple[int, int, int, int, int]]
+SnapshotT = Dict[str, StatT]
+
+
+def _stat(filename: str) -> StatT:
+    try:
+        st = os.lstat(filename)
+    except OSError:
+        return None
+    else:
+        return (
+            st.st_mode, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino,
+        )
+
+
+class ChangeDetector:
+    """Detects modifications to a set of files without diffing the whole
+    working tree.
+
+    Like `git diff`, only files tracked in the index are considered.  Files
+    are compared by `stat` and only hashed when their `stat` changed: the
+    index provides the object name of files which were clean when the
+    detector was first used.
+    """
+
+    def __init__(self) -> None:
+        self._index: dict[str, str] | None = None
+        self._unstaged: set[str] = set()
+        # filename => (stat, object name) last observed
+        self._known: dict[str, tuple[StatT, str | None]] = {}
+
+    def _load(self) -> dict[str, str]:
+        if self._index is None:
+            self._index = {
+                filename: object_name
+                for filename, (mode, object_name)
+                in git.get_index_entries().items()
+                # only regular files, `hash-object` reads paths per line
+                if mode in {'100644', '100755'} and '\n' not in filename
+            }
+            self._unstaged = set(git.get_unstaged_files())
+        return self._index
+
+    def invalidate(self) -> None:
+        """Forget which files are clean, something else changed the tree."""
+        self._index = None
+        self._unstaged = set()
+
+    def _hash(self, filenames: Sequence[str]) -> list[str | None]:
+        # `hash-object` fails on a file which became a directory (or the like)
+        files = [f for f in filenames if os.path.isfile(f)]
+        hashed = dict(zip(files, git.hash_objects(files)))
+        return [hashed.get(filename) for filename in filenames]
+
+    def snapshot(self, filenames: Sequence[str]) -> SnapshotT:
+        """Record the state of `filenames` before they may be modified."""
+        index = self._load()
+        ret = {}
+        to_hash = []
+        for filename in filenames:
+            if filename not in index:
+                continue
+            st = ret[filename] = _stat(filename)
+            known = self._known.get(filename)
+            if known is not None and known[0] == st:
+                continue
+            elif known is not None or filename in self._unstaged:
+                to_hash.append(filename)
+            else:
+                self._known[filename] = (st, index[filename])
+        for filename, object_name in zip(to_hash, self._hash(to_hash)):
+            self._known[filename] = (ret[filename], object_name)
+        return ret
+
+    def modified(self, snapshot: SnapshotT) -> bool:
+        """Whether any of the files in `snapshot` changed since it was taken"""
+        changed = {
+            filename: st
+            for filename, st in ((f, _stat(f)) for f in snapshot)
+            if st != snapshot[filename]
+        }
+        ret = False
+        for filename, object_name in zip(changed, self._hash(tuple(changed))):
+            ret |= object_name != self._known[filename][1]
+            self._known[filename] = (changed[filename], object_name)
+        if ret:
+            # the files which were clean may have been modified as well
+            self.invalidate()
+        return ret
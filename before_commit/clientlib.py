@@ -41,9 +41,11 @@ from before_commit.config import ValidationError
 from before_commit.config import WarnAdditionalKeys
 from before_commit.errors import FatalError
 from before_commit.languages.all import all_languages
+from before_commit.languages.helpers import PASS_FILENAMES_MODES
 from before_commit.logging_handler import logging_handler
 from before_commit.util import parse_version
 from before_commit.util import yaml_load
+from before_commit.xargs import PARTITION_STRATEGIES
 
 logger = logging.getLogger('before_commit')
 
@@ -58,6 +60,19 @@ def check_type_tag(tag: str) -> None:
         )
 
 
+def check_pass_filenames(v: Any) -> None:
+    if not isinstance(v, bool) and v not in PASS_FILENAMES_MODES:
+        modes_s = ', '.join(PASS_FILENAMES_MODES)
+        raise ValidationError(f'Expected bool or one of {modes_s} got {v!r}')
+
+
+def check_timeout(v: Any) -> None:
+    if isinstance(v, bool) or not isinstance(v, (int, float)) or v < 0:
+        raise ValidationError(
+            f'Expected a non-negative number of seconds got {v!r}',
+        )
+
+
 def check_min_version(version: str) -> None:
     if parse_version(version) > parse_version(C.VERSION):
         raise ValidationError(
@@ -96,12 +111,21 @@ MANIFEST_HOOK_DICT = Map(
     Optional('args', check_array(check_string), []),
     Optional('always_run', check_bool, False),
     Optional('fail_fast', check_bool, False),
-    Optional('pass_filenames', check_bool, True),
+    Optional('pass_filenames', check_pass_filenames, True),
+    Optional('read_only', check_bool, False),
+    Optional('cacheable', check_bool, False),
     Optional('description', check_string, ''),
     Optional('language_version', check_string, C.DEFAULT),
     Optional('log_file', check_string, ''),
     Optional('minimum_pre_commit_version', check_string, '0'),
     Optional('require_serial', check_bool, False),
+    Optional(
+        'partition_strategy', check_one_of(tuple(PARTITION_STRATEGIES)),
+        'count',
+    ),
+    Optional('worker', check_bool, False),
+    # seconds a partition of the files may run for, 0 for no limit
+    Optional('timeout', check_timeout, 0),
     Optional('stages', check_array(check_one_of(C.STAGES)), []),
     Optional('verbose', check_bool, False),
 )
@@ -100,6 +100,8 @@ def _ns(
         hook=None,
         verbose=False,
         show_diff_on_failure=False,
+        jobs=None,
+        trace_file=None,
     )
 
 
@@ -1,31 +1,53 @@
 from __future__ import annotations
 
 import argparse
+import bisect
+import concurrent.futures
 import contextlib
 import functools
+import hashlib
+import itertools
 import logging
+import multiprocessing
 import os
 import re
+import signal
 import subprocess
 import time
 import unicodedata
+from typing import AbstractSet
 from typing import Any
 from typing import Collection
+from typing import FrozenSet
+from typing import Mapping
 from typing import MutableMapping
+from typing import NoReturn
 from typing import Sequence
+from typing import Tuple
 
 from identify.identify import tags_from_path
 
 from before_commit import color
+from before_commit import concurrency
+from before_commit import costs
 from before_commit import git
+from before_commit import jobserver
 from before_commit import output
+from before_commit import trace
+from before_commit import worker
+from before_commit import xargs
+from before_commit.change_detector import ChangeDetector
+from before_commit.change_detector import SnapshotT
 from before_commit.clientlib import load_config
+from before_commit.costs import HookCosts
 from before_commit.hook import Hook
+from before_commit.languages import pygrep
 from before_commit.languages.all import languages
 from before_commit.repository import all_hooks
 from before_commit.repository import install_hook_envs
 from before_commit.staged_files_only import staged_files_only
 from before_commit.store import Store
+from before_commit.tag_index import TagIndex
 from before_commit.util import cmd_output_b
 
 
@@ -56,26 +78,216 @@ def _full_msg(
     return f'{start}{dots}{postfix}{end}\n'
 
 
+# a character which only matches itself
+_LITERAL = r'(?:[^\\.^$*+?{}\[\]|()]|\\[^0-9A-Za-z])'
+_LITERAL_RE = re.compile(_LITERAL)
+_LITERALS_RE = re.compile(f'{_LITERAL}*')
+_GROUP_RE = re.compile(rf'\((?:\?:)?({_LITERAL}*(?:\|{_LITERAL}*)*)\)')
+_QUANTIFIERS = frozenset('*+?{')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _split_alternatives(pattern: str) -> list[str]:
+    """Split `pattern` on its top-level `|`."""
+    ret = []
+    depth = start = i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            # a `]` directly after the opening bracket is a literal
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            ret.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    ret.append(pattern[start:])
+    return ret
+
+
+def _literal_prefixes(pattern: str) -> tuple[list[tuple[str, bool]], bool]:
+    """Find the literals which anchor every match of `pattern`.
+
+    Returns `(literal, whole)` pairs where `whole` means the match must be
+    exactly the literal (`^literal$`) rather than start with it.  The second
+    value tells whether the pattern matches exactly the filenames described
+    by the literals, in which case the regex never needs to be searched.
+    An empty list of literals means the pattern could not be analyzed.
+    """
+    if not pattern:
+        return [('', False)], True
+
+    ret: list[tuple[str, bool]] = []
+    exact = True
+    for branch in _split_alternatives(pattern):
+        if not branch.startswith('^'):
+            return [], False
+
+        prefixes = ['']
+        pos = 1
+        while pos < len(branch):
+            group = _GROUP_RE.match(branch, pos)
+            char = _LITERAL_RE.match(branch, pos)
+            match = group or char
+            if match is None or branch[match.end():][:1] in _QUANTIFIERS:
+                break
+            elif group is not None:
+                alternatives = []
+                alt_pos = 0
+                while True:
+                    alt = _LITERALS_RE.match(group[1], alt_pos)
+                    assert alt is not None
+                    alternatives.append(_UNESCAPE_RE.sub(r'\1', alt[0]))
+                    alt_pos = alt.end() + 1
+                    if alt_pos > len(group[1]):
+                        break
+                prefixes = [p + alt for p in prefixes for alt in alternatives]
+            else:
+                literal = _UNESCAPE_RE.sub(r'\1', match[0])
+                prefixes = [p + literal for p in prefixes]
+            pos = match.end()
+
+        if branch[pos:] == '$':
+            # `$` also matches before a trailing newline
+            ret.extend((p, True) for p in prefixes)
+            ret.extend((f'{p}\n', True) for p in prefixes)
+        else:
+            ret.extend((p, False) for p in prefixes)
+            exact &= pos == len(branch)
+    return ret, exact
+
+
+class _PathTable:
+    """Filenames sorted so the files under a literal prefix can be found with
+    `bisect` and whole directories included or excluded at once.
+
+    Selections of files are sorted lists of positions in the table.
+    """
+
+    def __init__(self, filenames: Sequence[str]) -> None:
+        self._filenames = filenames
+        # filenames are usually already sorted which makes this linear
+        self._order = sorted(range(len(filenames)), key=filenames.__getitem__)
+        self._names = [filenames[i] for i in self._order]
+        self.everything: Sequence[int] = range(len(filenames))
+
+    def name(self, position: int) -> str:
+        return self._names[position]
+
+    def names(self, positions: Sequence[int]) -> list[str]:
+        """The filenames at `positions`, in their original order."""
+        return [
+            self._filenames[i]
+            for i in sorted(self._order[position] for position in positions)
+        ]
+
+    def _range(self, literal: str, whole: bool) -> tuple[int, int]:
+        start = bisect.bisect_left(self._names, literal)
+        if whole:
+            return start, bisect.bisect_right(self._names, literal, start)
+        elif literal:
+            # the first string greater than all those starting with `literal`
+            after = f'{literal[:-1]}{chr(ord(literal[-1]) + 1)}'
+            return start, bisect.bisect_left(self._names, after, start)
+        else:
+            return 0, len(self._names)
+
+    def search(
+            self,
+            pattern: str,
+            positions: Sequence[int],
+            *,
+            exclude: bool = False,
+    ) -> list[int]:
+        """Select the `positions` whose filename matches `pattern`, or does not
+        match it when `exclude` is set.
+        """
+        literals, exact = _literal_prefixes(pattern)
+        search = re.compile(pattern).search
+        if not literals:
+            return [
+                position for position in positions
+                if bool(search(self._names[position])) is not exclude
+            ]
+
+        ranges = sorted(self._range(lit, whole) for lit, whole in literals)
+        ret: list[int] = []
+        # `positions` are split on the ranges which may match without ever
+        # looking at the filenames outside of them
+        done = 0
+        for lo, hi in ranges:
+            start = bisect.bisect_left(positions, lo, done)
+            end = max(bisect.bisect_left(positions, hi, start), start)
+            if exclude:
+                ret.extend(positions[done:start])
+            if not exact:
+                ret.extend(
+                    position for position in positions[start:end]
+                    if bool(search(self._names[position])) is not exclude
+                )
+            elif not exclude:
+                ret.extend(positions[start:end])
+            done = end
+        if exclude:
+            ret.extend(positions[done:])
+        return ret
+
+
 def filter_by_include_exclude(
         names: Collection[str],
         include: str,
         exclude: str,
 ) -> list[str]:
-    include_re, exclude_re = re.compile(include), re.compile(exclude)
-    return [
-        filename for filename in names
-        if include_re.search(filename)
-        if not exclude_re.search(filename)
-    ]
+    table = _PathTable(list(names))
+    included = table.search(include, table.everything)
+    return table.names(table.search(exclude, included, exclude=True))
+
+
+# `types`, `types_or` and `exclude_types` of a hook
+_TypesT = Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]
 
 
 class Classifier:
-    def __init__(self, filenames: Collection[str]) -> None:
+    def __init__(
+            self,
+            filenames: Collection[str],
+            tag_index: TagIndex | None = None,
+    ) -> None:
         self.filenames = [f for f in filenames if os.path.lexists(f)]
+        self._tag_index = tag_index
+        self._table = _PathTable(self.filenames)
 
     @functools.lru_cache(maxsize=None)
-    def _types_for_file(self, filename: str) -> set[str]:
-        return tags_from_path(filename)
+    def _types_for_file(self, filename: str) -> AbstractSet[str]:
+        if self._tag_index is not None:
+            return self._tag_index.tags(filename)
+        else:
+            return tags_from_path(filename)
+
+    def _has_types(
+            self,
+            filename: str,
+            types: frozenset[str],
+            types_or: frozenset[str],
+            exclude_types: frozenset[str],
+    ) -> bool:
+        tags = self._types_for_file(filename)
+        return (
+            tags >= types and
+            bool(not types_or or tags & types_or) and
+            not tags & exclude_types
+        )
 
     def by_types(
             self,
@@ -87,27 +299,51 @@ class Classifier:
         types = frozenset(types)
         types_or = frozenset(types_or)
         exclude_types = frozenset(exclude_types)
-        ret = []
-        for filename in names:
-            tags = self._types_for_file(filename)
-            if (
-                    tags >= types and
-                    (not types_or or tags & types_or) and
-                    not tags & exclude_types
-            ):
-                ret.append(filename)
-        return ret
+        return [
+            filename for filename in names
+            if self._has_types(filename, types, types_or, exclude_types)
+        ]
+
+    def filenames_for_hooks(
+            self,
+            hooks: Sequence[Hook],
+    ) -> list[tuple[str, ...]]:
+        """Compute the filenames of every hook at once.
+
+        Hooks are grouped by `files`, then `exclude`, then type filters so
+        each distinct pattern is searched at most once per filename and hooks
+        with identical filters share their results.  Patterns anchored by
+        literal prefixes (such as `^vendor/`) select or prune whole
+        directories without searching the files within.
+        """
+        tree: dict[str, dict[str, dict[_TypesT, list[int]]]] = {}
+        hook_positions = []
+        for hook in hooks:
+            by_exclude = tree.setdefault(hook.files, {})
+            by_types = by_exclude.setdefault(hook.exclude, {})
+            types_key = (
+                frozenset(hook.types),
+                frozenset(hook.types_or),
+                frozenset(hook.exclude_types),
+            )
+            hook_positions.append(by_types.setdefault(types_key, []))
+
+        table = self._table
+        for include, by_exclude in tree.items():
+            included = table.search(include, table.everything)
+            for exclude, by_types in by_exclude.items():
+                candidates = table.search(exclude, included, exclude=True)
+                for types_key, positions in by_types.items():
+                    positions.extend(
+                        position for position in candidates
+                        if self._has_types(table.name(position), *types_key)
+                    )
+
+        return [tuple(table.names(positions)) for positions in hook_positions]
 
     def filenames_for_hook(self, hook: Hook) -> tuple[str, ...]:
-        names = self.filenames
-        names = filter_by_include_exclude(names, hook.files, hook.exclude)
-        names = self.by_types(
-            names,
-            hook.types,
-            hook.types_or,
-            hook.exclude_types,
-        )
-        return tuple(names)
+        ret, = self.filenames_for_hooks((hook,))
+        return ret
 
     @classmethod
     def from_config(
@@ -115,6 +351,7 @@ class Classifier:
             filenames: Collection[str],
             include: str,
             exclude: str,
+            tag_index: TagIndex | None = None,
     ) -> Classifier:
         # on windows we normalize all filenames to use forward slashes
         # this makes it easier to filter using the `files:` regex
@@ -123,7 +360,7 @@ class Classifier:
         if os.altsep == '/' and os.sep == '\\':
             filenames = [f.replace(os.sep, os.altsep) for f in filenames]
         filenames = filter_by_include_exclude(filenames, include, exclude)
-        return Classifier(filenames)
+        return Classifier(filenames, tag_index)
 
 
 def _get_skips(environ: MutableMapping[str, str]) -> set[str]:
@@ -137,24 +374,66 @@ def _get_skips(environ: MutableMapping[str, str]) -> set[str]:
 
 SKIPPED = 'Skipped'
 NO_FILES = '(no files to check)'
+CACHED = '(cached)'
 
 
 def _subtle_line(s: str, use_color: bool) -> None:
     output.write_line(color.format_color(s, color.SUBTLE, use_color))
 
 
+def _is_skipped(hook: Hook, skips: set[str]) -> bool:
+    return hook.id in skips or hook.alias in skips
+
+
+def _executes(hook: Hook, filenames: Sequence[str], skips: set[str]) -> bool:
+    return not _is_skipped(hook, skips) and bool(filenames or hook.always_run)
+
+
+def _hooks_to_install(
+        hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
+        skips: set[str],
+) -> list[Hook]:
+    """Only hooks which will actually run need their environment installed:
+    hooks which are skipped or have no files to check are never executed.
+    """
+    return [
+        hook
+        for hook, filenames in zip(hooks, hook_filenames)
+        if _executes(hook, filenames, skips)
+    ]
+
+
+def _execute_hook(
+        hook: Hook,
+        filenames: Sequence[str],
+        use_color: bool,
+) -> tuple[int, bytes, float]:
+    if not hook.pass_filenames:
+        filenames = ()
+    time_before = time.time()
+    language = languages[hook.language]
+    with trace.span(
+            hook.id, hook=hook.name, key=hook.key, files=len(filenames),
+    ) as args:
+        retcode, out = language.run_hook(hook, filenames, use_color)
+        args['returncode'] = retcode
+    duration = round(time.time() - time_before, 2) or 0
+    return retcode, out, duration
+
+
 def _run_single_hook(
-        classifier: Classifier,
         hook: Hook,
+        filenames: Sequence[str],
         skips: set[str],
         cols: int,
-        diff_before: bytes,
+        tracker: _ModificationTracker,
         verbose: bool,
         use_color: bool,
-) -> tuple[bool, bytes]:
-    filenames = classifier.filenames_for_hook(hook)
-
-    if hook.id in skips or hook.alias in skips:
+        executed: tuple[int, bytes, float, bool] | None = None,
+        all_cached: bool = False,
+) -> bool:
+    if _is_skipped(hook, skips):
         output.write(
             _full_msg(
                 start=hook.name,
@@ -166,7 +445,21 @@ def _run_single_hook(
         )
         duration = None
         retcode = 0
-        diff_after = diff_before
+        files_modified = False
+        out = b''
+    elif all_cached:
+        output.write(
+            _full_msg(
+                start=hook.name,
+                postfix=CACHED,
+                end_msg='Passed',
+                end_color=color.GREEN,
+                use_color=use_color,
+                cols=cols,
+            ),
+        )
+        duration = None
+        retcode = 0
         files_modified = False
         out = b''
     elif not filenames and not hook.always_run:
@@ -182,23 +475,21 @@ def _run_single_hook(
         )
         duration = None
         retcode = 0
-        diff_after = diff_before
         files_modified = False
         out = b''
     else:
         # print hook and dots first in case the hook takes a while to run
         output.write(_start_msg(start=hook.name, end_len=6, cols=cols))
 
-        if not hook.pass_filenames:
-            filenames = ()
-        time_before = time.time()
-        language = languages[hook.language]
-        retcode, out = language.run_hook(hook, filenames, use_color)
-        duration = round(time.time() - time_before, 2) or 0
-        diff_after = _get_diff()
+        if executed is None:
+            state = tracker.before((hook,), (filenames,))
+            retcode, out, duration = _execute_hook(hook, filenames, use_color)
 
-        # if the hook makes changes, fail the commit
-        files_modified = diff_before != diff_after
+            # if the hook makes changes, fail the commit
+            files_modified, = tracker.after(state)
+        else:
+            # the hook already ran concurrently with others
+            retcode, out, duration, files_modified = executed
 
         if retcode or files_modified:
             print_color = color.RED
@@ -209,25 +500,35 @@ def _run_single_hook(
 
         output.write_line(color.format_color(status, print_color, use_color))
 
-    if verbose or hook.verbose or retcode or files_modified:
-        _subtle_line(f'- hook id: {hook.id}', use_color)
+    # the output past what `xargs` keeps in memory is copied from its file
+    with xargs.spilled(out) as (out, spill):
+        if verbose or hook.verbose or retcode or files_modified:
+            _subtle_line(f'- hook id: {hook.id}', use_color)
 
-        if (verbose or hook.verbose) and duration is not None:
-            _subtle_line(f'- duration: {duration}s', use_color)
+            if (verbose or hook.verbose) and duration is not None:
+                _subtle_line(f'- duration: {duration}s', use_color)
 
-        if retcode:
-            _subtle_line(f'- exit code: {retcode}', use_color)
+            if retcode:
+                _subtle_line(f'- exit code: {retcode}', use_color)
 
-        # Print a message if failing due to file modifications
-        if files_modified:
-            _subtle_line('- files were modified by this hook', use_color)
+            # Print a message if failing due to file modifications
+            if files_modified:
+                _subtle_line('- files were modified by this hook', use_color)
 
-        if out.strip():
-            output.write_line()
-            output.write_line_b(out.strip(), logfile_name=hook.log_file)
-            output.write_line()
+            if spill is not None:
+                output.write_line()
+                chunks = iter(functools.partial(spill.read, 2 ** 16), b'')
+                output.write_chunks_b(
+                    itertools.chain((out.lstrip(),), chunks),
+                    logfile_name=hook.log_file,
+                )
+                output.write_line()
+            elif out.strip():
+                output.write_line()
+                output.write_line_b(out.strip(), logfile_name=hook.log_file)
+                output.write_line()
 
-    return files_modified or bool(retcode), diff_after
+    return files_modified or bool(retcode)
 
 
 def _compute_cols(hooks: Sequence[Hook]) -> int:
@@ -266,35 +567,428 @@ def _all_filenames(args: argparse.Namespace) -> Collection[str]:
 
 
 def _get_diff() -> bytes:
-    _, out, _ = cmd_output_b(
-        'git', 'diff', '--no-ext-diff', '--ignore-submodules', retcode=None,
-    )
+    with trace.span('git_diff'):
+        _, out, _ = cmd_output_b(
+            'git', 'diff', '--no-ext-diff', '--ignore-submodules',
+            retcode=None,
+        )
     return out
 
 
+def _is_cacheable(hook: Hook) -> bool:
+    # hooks which do not receive filenames may look at anything
+    return (
+        hook.cacheable and bool(hook.pass_filenames) and not hook.always_run
+    )
+
+
+def _filter_passed(
+        store: Store,
+        hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
+        skips: set[str],
+) -> tuple[list[Sequence[str]], dict[int, dict[str, str]]]:
+    """Remove the files which already passed `cacheable` hooks with their
+    current contents.
+
+    Returns the remaining filenames and, for each cacheable hook, the digests
+    of its remaining files so they can be recorded once the hook passes.
+    """
+    ret = list(hook_filenames)
+    digests = {}
+    for i, (hook, filenames) in enumerate(zip(hooks, hook_filenames)):
+        if not _is_cacheable(hook) or not _executes(hook, filenames, skips):
+            continue
+        hook_digests = {
+            filename: digest
+            for filename, digest in _file_digests(filenames).items()
+            if digest is not None
+        }
+        passed = store.select_passed_files(hook.key, hook_digests)
+        ret[i] = tuple(f for f in filenames if f not in passed)
+        digests[i] = {
+            filename: digest
+            for filename, digest in hook_digests.items()
+            if filename not in passed
+        }
+    return ret, digests
+
+
+def _footprint(hook: Hook, filenames: Sequence[str]) -> frozenset[str] | None:
+    """The files a hook operates on, `None` if they cannot be known."""
+    if hook.pass_filenames and filenames:
+        return frozenset(filenames)
+    else:
+        return None
+
+
+class _ModificationTracker:
+    """Detects which hooks modify files.
+
+    Hooks which receive filenames are checked by looking at those files
+    only.  The full `git diff` is used for the others.
+    """
+
+    def __init__(self) -> None:
+        self._detector = ChangeDetector()
+        # the diff is reused while nothing could have changed it
+        self._diff: bytes | None = None
+
+    def before(
+            self,
+            hooks: Sequence[Hook],
+            hook_filenames: Sequence[Sequence[str]],
+    ) -> tuple[list[SnapshotT | None], bytes | None]:
+        snapshots = [
+            None
+            if _footprint(hook, filenames) is None else
+            self._detector.snapshot(filenames)
+            for hook, filenames in zip(hooks, hook_filenames)
+        ]
+        if None in snapshots:
+            if self._diff is None:
+                self._diff = _get_diff()
+            return snapshots, self._diff
+        else:
+            return snapshots, None
+
+    def after(
+            self,
+            state: tuple[list[SnapshotT | None], bytes | None],
+    ) -> list[bool]:
+        snapshots, diff_before = state
+        modified = [
+            snapshot is not None and self._detector.modified(snapshot)
+            for snapshot in snapshots
+        ]
+        if diff_before is None:
+            self._diff = None
+        else:
+            self._diff = _get_diff()
+            if self._diff != diff_before:
+                self._detector.invalidate()
+                if not any(modified):
+                    modified = [snapshot is None for snapshot in snapshots]
+        return modified
+
+
+def _read_only(hook: Hook) -> bool:
+    # pygrep hooks only ever read their files
+    return hook.read_only or hook.language == 'pygrep'
+
+
+def _conflicts(
+        hook_a: Hook,
+        footprint_a: frozenset[str] | None,
+        hook_b: Hook,
+        footprint_b: frozenset[str] | None,
+) -> bool:
+    if _read_only(hook_a) and _read_only(hook_b):
+        return False
+    elif footprint_a is None or footprint_b is None:
+        return True
+    else:
+        return not footprint_a.isdisjoint(footprint_b)
+
+
+def _schedule(
+        hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
+        skips: set[str],
+        *,
+        fail_fast: bool,
+) -> list[list[int]]:
+    """Group consecutive hooks into batches which may run concurrently.
+
+    Two hooks may share a batch when both are `read_only` or when they operate
+    on disjoint sets of files.  A hook which may stop the run (`fail_fast`)
+    can only be followed by `read_only` hooks in its batch so a failure never
+    lets a later hook modify files.
+    """
+    footprints = [
+        _footprint(hook, filenames)
+        for hook, filenames in zip(hooks, hook_filenames)
+    ]
+
+    def _can_join(i: int, batch: list[int]) -> bool:
+        if not _executes(hooks[i], hook_filenames[i], skips):
+            return True
+        for j in batch:
+            if not _executes(hooks[j], hook_filenames[j], skips):
+                continue
+            elif _conflicts(hooks[i], footprints[i], hooks[j], footprints[j]):
+                return False
+            elif (
+                    (fail_fast or hooks[j].fail_fast) and
+                    not _read_only(hooks[i])
+            ):
+                return False
+        return True
+
+    batches: list[list[int]] = []
+    for i in range(len(hooks)):
+        if batches and _can_join(i, batches[-1]):
+            batches[-1].append(i)
+        else:
+            batches.append([i])
+    return batches
+
+
+def _fail_fast_order(
+        hooks: Sequence[Hook],
+        hook_costs: Mapping[str, HookCosts],
+) -> list[Hook]:
+    """Reorder hooks so those which failed the most per second of running in
+    previous runs run first.
+
+    Only consecutive `read_only` hooks are reordered: they don't modify files
+    so the order they run in does not change the files they see.
+    """
+    def _key(hook: Hook) -> float:
+        return -hook_costs.get(hook.key, HookCosts()).failures_per_second()
+
+    ret: list[Hook] = []
+    read_only: list[Hook] = []
+    for hook in hooks:
+        if _read_only(hook):
+            read_only.append(hook)
+        else:
+            ret.extend(sorted(read_only, key=_key))
+            read_only = []
+            ret.append(hook)
+    ret.extend(sorted(read_only, key=_key))
+    return ret
+
+
+def _file_digests(filenames: Sequence[str]) -> dict[str, str | None]:
+    ret: dict[str, str | None] = {}
+    for filename in filenames:
+        try:
+            with open(filename, 'rb') as f:
+                ret[filename] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            ret[filename] = None
+    return ret
+
+
+def _unchanged(digests: dict[str, str]) -> dict[str, str]:
+    """The files which still have the contents they were hashed with.
+
+    The files are hashed before any hook runs: the hook did not check the
+    contents an earlier hook (or itself) replaced them with.
+    """
+    return {
+        filename: digest
+        for filename, digest in _file_digests(tuple(digests)).items()
+        if digest == digests[filename]
+    }
+
+
+def _mp_context() -> multiprocessing.context.BaseContext:
+    # languages patch `os.environ` while running so hooks are isolated in
+    # their own processes.  `fork` (where available) inherits the current
+    # working directory and environment exactly as they are now.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    else:  # pragma: no cover (windows)
+        return multiprocessing.get_context('spawn')
+
+
+class _Cancelled(BaseException):
+    """Raised in a worker process to stop the hook it runs."""
+
+
+# for each hook of a batch, the pid of the worker process running it (0 when
+# it is not running) or `_CANCELLED`
+_CANCELLED = -1
+_running: Any = None  # the `multiprocessing.Array` of the worker process
+
+
+def _init_worker(running: Any) -> None:
+    global _running
+    _running = running
+    # only a running hook is stopped by `SIGTERM`
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _raise_cancelled(signum: int, frame: object) -> NoReturn:
+    raise _Cancelled
+
+
+def _execute_cancellable_hook(
+        i: int,
+        hook: Hook,
+        filenames: Sequence[str],
+        use_color: bool,
+) -> tuple[int, bytes, float]:
+    with _running.get_lock():
+        if _running[i] == _CANCELLED:
+            raise _Cancelled
+        _running[i] = os.getpid()
+    # unwinding kills the processes of the hook (see `xargs.xargs`)
+    signal.signal(signal.SIGTERM, _raise_cancelled)
+    try:
+        return _execute_hook(hook, filenames, use_color)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        with _running.get_lock():
+            _running[i] = 0
+
+
+def _cancel(
+        futures: Sequence[concurrent.futures.Future[Any]],
+        running: Any,
+        indices: Sequence[int],
+) -> None:
+    for i in indices:
+        futures[i].cancel()
+    # a worker is only signalled while it runs one of the cancelled hooks
+    with running.get_lock():
+        for i in indices:
+            if running[i] > 0 and os.name != 'nt':  # pragma: win32 no cover
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(running[i], signal.SIGTERM)
+            running[i] = _CANCELLED
+
+
+def _run_concurrently(
+        hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
+        tracker: _ModificationTracker,
+        *,
+        use_color: bool,
+) -> list[tuple[int, bytes, float, bool] | None]:
+    """Run hooks concurrently, returning their results in order.
+
+    Once a `fail_fast` hook fails, the `read_only` hooks after it are
+    cancelled: they would not have run had the hooks run one at a time.  The
+    hooks before it finish.  The result of a cancelled hook is `None`.
+    """
+    state = tracker.before(hooks, hook_filenames)
+
+    mp_context = _mp_context()
+    running = mp_context.Array('i', len(hooks))
+    max_workers = min(len(hooks), concurrency.cpu_count())
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(running,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _execute_cancellable_hook, i, hook, filenames, use_color,
+            )
+            for i, (hook, filenames) in enumerate(zip(hooks, hook_filenames))
+        ]
+        fail_fast = {
+            future: i
+            for i, (future, hook) in enumerate(zip(futures, hooks))
+            if hook.fail_fast
+        }
+        for future in concurrent.futures.as_completed(fail_fast):
+            if (
+                    not future.cancelled() and
+                    future.exception() is None and
+                    future.result()[0]
+            ):
+                later = range(fail_fast[future] + 1, len(hooks))
+                _cancel(
+                    futures, running,
+                    [i for i in later if _read_only(hooks[i])],
+                )
+
+        executed: list[tuple[int, bytes, float] | None] = []
+        for future in futures:
+            try:
+                executed.append(future.result())
+            except (_Cancelled, concurrent.futures.CancelledError):
+                executed.append(None)
+
+    return [
+        None if result is None else (*result, modified)
+        for result, modified in zip(executed, tracker.after(state))
+    ]
+
+
 def _run_hooks(
         config: dict[str, Any],
         hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
         skips: set[str],
         args: argparse.Namespace,
+        store: Store,
+        digests: dict[int, dict[str, str]],
 ) -> int:
     """Actually run the hooks."""
+    if config['fail_fast'] or args.fail_fast:
+        # a failing hook also stops its other processes (see `xargs.xargs`)
+        hooks = [hook._replace(fail_fast=True) for hook in hooks]
     cols = _compute_cols(hooks)
-    classifier = Classifier.from_config(
-        _all_filenames(args), config['files'], config['exclude'],
-    )
-    retval = 0
-    prior_diff = _get_diff()
-    for hook in hooks:
-        current_retval, prior_diff = _run_single_hook(
-            classifier, hook, skips, cols, prior_diff,
-            verbose=args.verbose, use_color=args.color,
+    if 'PRE_COMMIT_NO_CONCURRENCY' in os.environ:
+        batches = [[i] for i in range(len(hooks))]
+    else:
+        batches = _schedule(
+            hooks, hook_filenames, skips,
+            fail_fast=config['fail_fast'] or args.fail_fast,
         )
-        retval |= current_retval
-        if retval and \
-                (config['fail_fast'] or hook.fail_fast or args.fail_fast):
+    retval = 0
+    tracker = _ModificationTracker()
+    for batch in batches:
+        executing = [
+            i for i in batch
+            if _executes(hooks[i], hook_filenames[i], skips)
+        ]
+        if len(executing) > 1:
+            batch_hooks = [hooks[i] for i in executing]
+            batch_filenames = [hook_filenames[i] for i in executing]
+            # the hooks of a batch do not modify the files the others read
+            with trace.span('pygrep_scan'):
+                scanned = pygrep.scan(batch_hooks, batch_filenames)
+            with pygrep.using(scanned):
+                executed = _run_concurrently(
+                    batch_hooks, batch_filenames, tracker,
+                    use_color=args.color,
+                )
+            results = {
+                i: result
+                for i, result in zip(executing, executed)
+                if result is not None
+            }
+            cancelled = set(executing) - set(results)
+        else:
+            results = {}
+            cancelled = set()
+
+        stop = False
+        for i in batch:
+            if i in cancelled:
+                # only the hooks after a failing `fail_fast` hook are
+                # cancelled: they are neither reported nor marked passed
+                break
+            hook = hooks[i]
+            current_retval = _run_single_hook(
+                hook, hook_filenames[i], skips, cols, tracker,
+                verbose=args.verbose, use_color=args.color,
+                executed=results.get(i),
+                all_cached=i in digests and not hook_filenames[i],
+            )
+            retval |= current_retval
+            if i in digests and not current_retval:
+                store.mark_files_passed(
+                    hook.key, hook.prefix.prefix_dir, _unchanged(digests[i]),
+                )
+            if retval and \
+                    (config['fail_fast'] or hook.fail_fast or args.fail_fast):
+                stop = True
+                break
+        if stop:
             break
-    if retval and args.show_diff_on_failure and prior_diff:
+    if (
+            retval and
+            args.show_diff_on_failure and
+            git.has_diff('--ignore-submodules')
+    ):
         if args.all_files:
             output.write_line(
                 'pre-commit hook(s) made changes.\n'
@@ -396,17 +1090,32 @@ def run(
     # Set pre_commit flag
     environ['PRE_COMMIT'] = '1'
 
+    events: list[dict[str, Any]] = []
+    hooks: list[Hook] = []
     with contextlib.ExitStack() as exit_stack:
+        # recorded once every process of the run is done
+        exit_stack.callback(costs.record, store, hooks, events)
+        if args.trace_file:
+            exit_stack.callback(trace.write, args.trace_file, events)
+        exit_stack.enter_context(trace.recording(events))
+        exit_stack.enter_context(jobserver.jobs(args.jobs, environ))
+        exit_stack.enter_context(worker.persistent())
         if stash:
             exit_stack.enter_context(staged_files_only(store.directory))
 
-        config = load_config(config_file)
-        hooks = [
-            hook
-            for hook in all_hooks(config, store)
-            if not args.hook or hook.id == args.hook or hook.alias == args.hook
-            if args.hook_stage in hook.stages
-        ]
+        with trace.span('load_config', config=config_file):
+            config = load_config(config_file)
+        with trace.span('load_hooks'):
+            hooks.extend(
+                hook
+                for hook in all_hooks(config, store)
+                if (
+                    not args.hook or
+                    hook.id == args.hook or
+                    hook.alias == args.hook
+                )
+                if args.hook_stage in hook.stages
+            )
 
         if args.hook and not hooks:
             output.write_line(
@@ -414,11 +1123,37 @@ def run(
             )
             return 1
 
+        hook_costs = store.select_hook_costs()
+        if config['fail_fast'] or args.fail_fast:
+            hooks[:] = _fail_fast_order(hooks, hook_costs)
+        exit_stack.enter_context(costs.using(hook_costs))
+
         skips = _get_skips(environ)
-        to_install = [hook for hook in hooks if hook.id not in skips]
-        install_hook_envs(to_install, store)
+        # classify before installing so environments are only installed for
+        # hooks which will actually run
+        with trace.span('classify') as span_args:
+            filenames = _all_filenames(args)
+            span_args['files'] = len(filenames)
+            # `run` is always called from the root of the repository
+            tag_index = TagIndex(store, os.getcwd())
+            classifier = Classifier.from_config(
+                filenames, config['files'], config['exclude'], tag_index,
+            )
+            classified = classifier.filenames_for_hooks(hooks)
+            tag_index.save()
+        with trace.span('filter_passed'):
+            hook_filenames, digests = _filter_passed(
+                store, hooks, classified, skips,
+            )
+        with trace.span('install_hook_envs'):
+            install_hook_envs(
+                _hooks_to_install(hooks, hook_filenames, skips), store,
+            )
 
-        return _run_hooks(config, hooks, skips, args)
+        with trace.span('run_hooks'):
+            return _run_hooks(
+                config, hooks, hook_filenames, skips, args, store, digests,
+            )
 
     # https://github.com/python/mypy/issues/7726
     raise AssertionError('unreachable')
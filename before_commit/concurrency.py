@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import functools
+import math
+import multiprocessing
+import os
+from typing import Generator
+
+
+def _read(filename: str) -> str | None:
+    try:
+        with open(filename) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroups(root: str) -> dict[str, str]:
+    """The cgroup of this process for each controller, the unified (v2)
+    hierarchy is listed with an empty controller.
+    """
+    ret = {}
+    contents = _read(os.path.join(root, 'proc/self/cgroup')) or ''
+    for line in contents.splitlines():
+        _, controllers, path = line.split(':', 2)
+        for controller in controllers.split(','):
+            ret[controller] = path
+    return ret
+
+
+def _ancestors(mount: str, path: str) -> Generator[str, None, None]:
+    # in a container the cgroup of the process is frequently mounted as the
+    # root of the hierarchy so every ancestor is considered
+    path = path.strip('/')
+    while True:
+        yield os.path.join(mount, path)
+        if not path:
+            return
+        path = os.path.dirname(path)
+
+
+def _cgroup_v2_cpus(root: str, path: str) -> float | None:
+    limits = []
+    for dirname in _ancestors(os.path.join(root, 'sys/fs/cgroup'), path):
+        cpu_max = _read(os.path.join(dirname, 'cpu.max'))
+        if cpu_max is not None:
+            quota, period = cpu_max.split()
+            if quota != 'max':
+                limits.append(int(quota) / int(period))
+    return min(limits, default=None)
+
+
+def _cgroup_v1_cpus(root: str, path: str) -> float | None:
+    limits = []
+    for mount in ('cpu,cpuacct', 'cpu'):
+        mount = os.path.join(root, 'sys/fs/cgroup', mount)
+        for dirname in _ancestors(mount, path):
+            quota = _read(os.path.join(dirname, 'cpu.cfs_quota_us'))
+            period = _read(os.path.join(dirname, 'cpu.cfs_period_us'))
+            if quota is not None and period is not None and int(quota) > 0:
+                limits.append(int(quota) / int(period))
+        if limits:
+            break
+    return min(limits, default=None)
+
+
+def _cgroup_cpus(root: str = '/') -> float | None:
+    """The number of CPUs allowed by the cgroup cpu quota, if any."""
+    limits = []
+    try:
+        cgroups = _cgroups(root)
+        # both hierarchies are in use on "hybrid" systems
+        if '' in cgroups:
+            limits.append(_cgroup_v2_cpus(root, cgroups['']))
+        if 'cpu' in cgroups:
+            limits.append(_cgroup_v1_cpus(root, cgroups['cpu']))
+    except ValueError:  # unexpected contents, ignore the quota
+        return None
+    return min((limit for limit in limits if limit is not None), default=None)
+
+
+def _available_cpus() -> int:
+    if hasattr(os, 'sched_getaffinity'):  # pragma: no branch (platform)
+        return len(os.sched_getaffinity(0))
+    try:  # pragma: no cover (platform specific)
+        return multiprocessing.cpu_count()
+    except NotImplementedError:  # pragma: no cover (platform specific)
+        return 1
+
+
+@functools.lru_cache(maxsize=1)
+def _detected_cpus() -> int:
+    cpus = _available_cpus()
+    quota = _cgroup_cpus()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def cpu_count() -> int:
+    """The number of CPUs this process may use.
+
+    This takes the CPU affinity and cgroup quotas (as used by containers)
+    into account and can be set explicitly with `BEFORE_COMMIT_CONCURRENCY`.
+    """
+    try:
+        override = int(os.environ.get('BEFORE_COMMIT_CONCURRENCY', ''))
+    except ValueError:
+        return _detected_cpus()
+    else:
+        return max(override, 1)
@@ -17,6 +17,7 @@ import re
 import sys
 from typing import Any
 from typing import Callable
+from typing import Dict
 from typing import Generator
 from typing import Sequence
 
@@ -59,6 +60,12 @@ def validate_context(msg: str) -> Generator[None, None, None]:
         raise ValidationError(e, ctx=msg).with_traceback(tb) from None
 
 
+def _in_context(e: ValidationError, msg: str) -> ValidationError:
+    # as `validate_context`, without entering a context manager on the path
+    # which does not fail
+    return ValidationError(e, ctx=msg).with_traceback(e.__traceback__)
+
+
 @contextlib.contextmanager
 def reraise_as(tp: type) -> Generator[None, None, None]:
     try:
@@ -72,10 +79,14 @@ def _dct_noop(self: Any, dct: dict[Any, Any]) -> None:
     pass
 
 
+def _at_key(key: Any) -> str:
+    return f'At key: {key}'
+
+
 def _check_optional(self: Any, dct: dict[Any, Any]) -> None:
     if self.key not in dct:
         return
-    with validate_context(f'At key: {self.key}'):
+    with validate_context(_at_key(self.key)):
         self.check_fn(dct[self.key])
 
 
@@ -282,14 +293,16 @@ class Map(collections.namedtuple('Map', ('object_name', 'id_key', 'items'))):
                 f'Expected a {self.object_name} map but got a '
                 f'{type(v).__name__}',
             )
+        with validate_context(self._context(v)):
+            for item in self.items:
+                item.check(v)
+
+    def _context(self, v: dict[Any, Any]) -> str:
         if self.id_key is None:
-            context = f'At {self.object_name}()'
+            return f'At {self.object_name}()'
         else:
             key_v_s = v.get(self.id_key, MISSING)
-            context = f'At {self.object_name}({self.id_key}={key_v_s!r})'
-        with validate_context(context):
-            for item in self.items:
-                item.check(v)
+            return f'At {self.object_name}({self.id_key}={key_v_s!r})'
 
     def apply_defaults(self, v: Any) -> Any:
         ret = v.copy()
@@ -408,8 +421,10 @@ def check_array(inner_check: Callable[[Any], None]) -> Callable[[Any], None]:
             )
 
         for i, val in enumerate(v):
-            with validate_context(f'At index {i}'):
+            try:
                 inner_check(val)
+            except ValidationError as e:
+                raise _in_context(e, f'At index {i}') from None
     return check_array_fn
 
 
@@ -420,13 +435,183 @@ def check_and(*fns: Callable[[Any], None]) -> Callable[[Any], None]:
     return check
 
 
+_Check = Callable[[Any], None]
+_Apply = Callable[[Any], Any]
+_DctFn = Callable[[Dict[Any, Any]], None]
+
+_REQUIRED = frozenset((
+    Required, RequiredRecurse, Conditional, ConditionalRecurse,
+))
+_RECURSE = frozenset((RequiredRecurse, OptionalRecurse, ConditionalRecurse))
+_CONDITIONAL = frozenset((
+    Conditional, ConditionalOptional, ConditionalRecurse,
+))
+_KEYED = _REQUIRED | _RECURSE | _CONDITIONAL | {Optional, OptionalNoDefault}
+_NO_DEFAULT = frozenset((
+    Required, OptionalNoDefault, Conditional, NoAdditionalKeys,
+    WarnAdditionalKeys,
+))
+
+# id(schema) -> (schema, compiled function), the schema is kept so its id is
+# not reused
+_checks: dict[int, tuple[Any, _Check]] = {}
+_appliers: dict[int, tuple[Any, _Apply]] = {}
+
+
+def _compiled(
+        cache: dict[int, tuple[Any, Any]],
+        compile_fn: Callable[[Any], Any],
+        schema: Any,
+) -> Any:
+    try:
+        return cache[id(schema)][1]
+    except KeyError:
+        ret = compile_fn(schema)
+        cache[id(schema)] = (schema, ret)
+        return ret
+
+
+def _compile_key_check(item: Any, check_fn: _Check, required: bool) -> _DctFn:
+    # the errors are those of `_check_required` and `_check_optional`
+    key = item.key
+
+    def check(dct: dict[Any, Any]) -> None:
+        if key not in dct:
+            if required:
+                _require_key(item, dct)
+            return
+        try:
+            check_fn(dct[key])
+        except ValidationError as e:
+            raise _in_context(e, _at_key(key)) from None
+    return check
+
+
+def _compile_item_check(item: Any) -> _DctFn:
+    tp = type(item)
+    if tp in {NoAdditionalKeys, WarnAdditionalKeys}:
+        keys = frozenset(item.keys)
+
+        def check_keys(dct: dict[Any, Any]) -> None:
+            if not keys.issuperset(dct):
+                item.check(dct)
+        return check_keys
+    elif tp not in _KEYED:
+        return item.check
+
+    if tp in _RECURSE:
+        check_fn = _compiled(_checks, _compile_check, item.schema)
+    else:
+        check_fn = item.check_fn
+    check = _compile_key_check(item, check_fn, tp in _REQUIRED)
+    if tp not in _CONDITIONAL:
+        return check
+
+    key, condition_key = item.key, item.condition_key
+    condition_value, ensure_absent = item.condition_value, item.ensure_absent
+
+    def check_conditional(dct: dict[Any, Any]) -> None:
+        if dct.get(condition_key, MISSING) == condition_value:
+            check(dct)
+        elif ensure_absent and condition_key in dct and key in dct:
+            item.check(dct)  # for its error
+    return check_conditional
+
+
+def _compile_check(schema: Any) -> _Check:
+    if type(schema) is Map:
+        checks = tuple(_compile_item_check(item) for item in schema.items)
+
+        def check_map(v: Any) -> None:
+            if not isinstance(v, dict):
+                schema.check(v)  # for its error
+            try:
+                for check in checks:
+                    check(v)
+            except ValidationError as e:
+                raise _in_context(e, schema._context(v)) from None
+        return check_map
+    elif type(schema) is Array:
+        check_of = _compiled(_checks, _compile_check, schema.of)
+        allow_empty = schema.allow_empty
+
+        def check_array(v: Any) -> None:
+            if not isinstance(v, (list, tuple)) or (not allow_empty and not v):
+                schema.check(v)  # for its error
+            for val in v:
+                check_of(val)
+        return check_array
+    else:
+        return lambda v: schema.check(v)
+
+
+def _compile_item_apply(item: Any) -> _DctFn | None:
+    tp = type(item)
+    if tp in _NO_DEFAULT:
+        return None
+    elif tp not in _KEYED:
+        return item.apply_default
+
+    key, default = item.key, getattr(item, 'default', None)
+    if tp in _CONDITIONAL:
+        condition_key = item.condition_key
+        condition_value = item.condition_value
+    if tp in _RECURSE:
+        apply = _compiled(_appliers, _compile_apply, item.schema)
+
+    if tp is Optional:
+        def apply_default(dct: dict[Any, Any]) -> None:
+            dct.setdefault(key, default)
+    elif tp is OptionalRecurse:
+        def apply_default(dct: dict[Any, Any]) -> None:
+            dct[key] = apply(dct.get(key, default))
+    elif tp is RequiredRecurse:
+        def apply_default(dct: dict[Any, Any]) -> None:
+            dct[key] = apply(dct[key])
+    elif tp is ConditionalOptional:
+        def apply_default(dct: dict[Any, Any]) -> None:
+            if dct.get(condition_key, MISSING) == condition_value:
+                dct.setdefault(key, default)
+    else:  # ConditionalRecurse
+        def apply_default(dct: dict[Any, Any]) -> None:
+            if dct.get(condition_key, MISSING) == condition_value:
+                dct[key] = apply(dct[key])
+    return apply_default
+
+
+def _compile_apply(schema: Any) -> _Apply:
+    if type(schema) is Map:
+        applies = tuple(
+            apply
+            for apply in map(_compile_item_apply, schema.items)
+            if apply is not None
+        )
+
+        def apply_map(v: Any) -> Any:
+            ret = v.copy()
+            for apply in applies:
+                apply(ret)
+            return ret
+        return apply_map
+    elif type(schema) is Array:
+        apply_of = _compiled(_appliers, _compile_apply, schema.of)
+        return lambda v: [apply_of(val) for val in v]
+    else:
+        return lambda v: schema.apply_defaults(v)
+
+
 def validate(v: Any, schema: Any) -> Any:
-    schema.check(v)
+    """Check `v` against `schema`, as `schema.check(v)` does.
+
+    `Map` and `Array` schemas are compiled on first use into functions which
+    only build the context of an error once it is raised.
+    """
+    _compiled(_checks, _compile_check, schema)(v)
     return v
 
 
 def apply_defaults(v: Any, schema: Any) -> Any:
-    return schema.apply_defaults(v)
+    return _compiled(_appliers, _compile_apply, schema)(v)
 
 
 def remove_defaults(v: Any, schema: Any) -> Any:
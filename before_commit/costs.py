@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import contextlib
+from typing import Any
+from typing import Generator
+from typing import Mapping
+from typing import NamedTuple
+from typing import Sequence
+from typing import TYPE_CHECKING
+
+from before_commit.hook import Hook
+
+if TYPE_CHECKING:
+    from before_commit.store import Store
+
+# previous observations are weighed down on every run so the costs follow
+# changes of the hooks and of the repository
+_DECAY = .9
+
+
+class HookCosts(NamedTuple):
+    """Sums of the observations of a hook in previous runs.
+
+    Every process (xargs partition) of the hook is observed with the cost of
+    its files `x` (see `xargs._file_cost`) and its duration `y` in seconds.
+    """
+    runs: float = 0.
+    failures: float = 0.
+    seconds: float = 0.
+    partitions: float = 0.
+    x: float = 0.
+    y: float = 0.
+    xx: float = 0.
+    xy: float = 0.
+
+    def add(self, other: HookCosts) -> HookCosts:
+        return HookCosts(*(a * _DECAY + b for a, b in zip(self, other)))
+
+    def failures_per_second(self) -> float:
+        # a hook without history is assumed to fail half of the time and to
+        # take a second
+        seconds = self.seconds / self.runs if self.runs else 1.
+        return (self.failures + 1) / (self.runs + 2) / max(seconds, .01)
+
+    def min_partition_cost(self) -> float:
+        """The cost of the files worth starting a process for, `0` when it
+        cannot be told.
+
+        This is the startup time of a process over the time taken per cost of
+        files, from a least squares fit of the observed processes.
+        """
+        n = self.partitions
+        det = n * self.xx - self.x ** 2
+        if n < 2 or det <= 1e-9 * n * self.xx:
+            return 0.
+        rate = (n * self.xy - self.x * self.y) / det
+        startup = (self.y - rate * self.x) / n
+        if rate <= 0 or startup <= 0:
+            return 0.
+        else:
+            return startup / rate
+
+
+_costs: Mapping[str, HookCosts] = {}
+
+
+@contextlib.contextmanager
+def using(costs: Mapping[str, HookCosts]) -> Generator[None, None, None]:
+    """Make `costs` available to the hooks run in the block."""
+    global _costs
+
+    _costs = costs
+    try:
+        yield
+    finally:
+        _costs = {}
+
+
+def get(hook: Hook) -> HookCosts:
+    return _costs.get(hook.key, HookCosts())
+
+
+def observe(events: Sequence[dict[str, Any]]) -> dict[str, HookCosts]:
+    """The costs observed in the trace events of hooks and their processes."""
+    ret: dict[str, HookCosts] = {}
+    for event in events:
+        args = event['args']
+        # cancelled hooks and processes did not run to completion
+        if 'key' not in args or 'returncode' not in args:
+            continue
+        seconds = event['dur'] / 1e6
+        if 'cost' in args:
+            x = args['cost']
+            observed = HookCosts(
+                partitions=1, x=x, y=seconds, xx=x * x, xy=x * seconds,
+            )
+        else:
+            observed = HookCosts(
+                runs=1, failures=bool(args['returncode']), seconds=seconds,
+            )
+        costs = ret.get(args['key'], HookCosts())
+        ret[args['key']] = HookCosts(*(a + b for a, b in zip(costs, observed)))
+    return ret
+
+
+def record(
+        store: Store,
+        hooks: Sequence[Hook],
+        events: Sequence[dict[str, Any]],
+) -> None:
+    prefixes = {hook.key: hook.prefix.prefix_dir for hook in hooks}
+    observed = {
+        key: (prefixes[key], costs)
+        for key, costs in observe(events).items()
+        if key in prefixes
+    }
+    if observed:
+        store.add_hook_costs(observed)
@@ -3,7 +3,9 @@ from __future__ import annotations
 import logging
 import os.path
 import sys
+import tempfile
 from typing import MutableMapping
+from typing import Sequence
 
 from before_commit.errors import FatalError
 from before_commit.util import CalledProcessError
@@ -168,6 +170,44 @@ def get_all_files() -> list[str]:
     return zsplit(cmd_output('git', 'ls-files', '-z')[1])
 
 
+def get_unstaged_files() -> list[str]:
+    return zsplit(
+        cmd_output(
+            'git', 'diff', '--name-only', '--no-ext-diff',
+            '--ignore-submodules', '-z',
+        )[1],
+    )
+
+
+def get_index_entries() -> dict[str, tuple[str, str]]:
+    """Returns the `(mode, object name)` of each merged path in the index"""
+    _, out, _ = cmd_output('git', 'ls-files', '--stage', '-z')
+    ret = {}
+    for line in zsplit(out):
+        info, filename = line.split('\t', 1)
+        mode, object_name, stage = info.split(' ')
+        if stage == '0':
+            ret[filename] = (mode, object_name)
+    return ret
+
+
+def hash_objects(filenames: Sequence[str]) -> list[str]:
+    """Computes the blob object names of files as `git add` would, applying
+    any filters from `.gitattributes`.
+    """
+    if not filenames:
+        return []
+    with tempfile.TemporaryFile() as paths:
+        for filename in filenames:
+            assert '\n' not in filename, filename
+            paths.write(f'{filename}\n'.encode())
+        paths.seek(0)
+        _, out, _ = cmd_output(
+            'git', 'hash-object', '--stdin-paths', stdin=paths,
+        )
+    return out.splitlines()
+
+
 def get_changed_files(old: str, new: str) -> list[str]:
     diff_cmd = ('git', 'diff', '--name-only', '--no-ext-diff', '-z')
     try:
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
 import shlex
 from typing import Any
@@ -28,12 +30,17 @@ class Hook(NamedTuple):
     args: Sequence[str]
     always_run: bool
     fail_fast: bool
-    pass_filenames: bool
+    pass_filenames: bool | str
+    read_only: bool
+    cacheable: bool
     description: str
     language_version: str
     log_file: str
     minimum_pre_commit_version: str
     require_serial: bool
+    partition_strategy: str
+    worker: bool
+    timeout: float
     stages: Sequence[str]
     verbose: bool
 
@@ -50,6 +57,16 @@ class Hook(NamedTuple):
             tuple(self.additional_dependencies),
         )
 
+    @property
+    def key(self) -> str:
+        """Identifies what the hook does, for the results of previous runs."""
+        prefix, language, language_version, deps = self.install_key
+        key = (
+            prefix.prefix_dir, language, language_version, deps,
+            self.entry, self.args,
+        )
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
     @classmethod
     def create(cls, src: str, prefix: Prefix, dct: dict[str, Any]) -> Hook:
         # TODO: have cfgv do this (?)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import re
+import select
+import sys
+import weakref
+from typing import AsyncGenerator
+from typing import Generator
+from typing import Mapping
+
+from before_commit import concurrency
+
+# `--jobserver-fds` is what make < 4.2 called `--jobserver-auth`
+_JOBSERVER_AUTH_RE = re.compile(r'--jobserver-(?:auth|fds)=(\S+)')
+
+
+class JobServer:
+    """A pool of job tokens shared by every process of a run.
+
+    Tokens are bytes in pipes, as in the GNU make jobserver: a token is taken
+    by reading a byte and given back by writing the same byte.  Processes
+    forked while the pool is active share it.  The read ends of the pipes are
+    non-blocking: a pipe seen as readable may have had its token taken by
+    another process before it is read.
+    """
+
+    def __init__(self, pipes: list[tuple[int, int]]) -> None:
+        self._pipes = dict(pipes)
+        self._locks: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Lock,
+        ] = weakref.WeakKeyDictionary()
+
+    async def acquire_async(self) -> tuple[int, bytes]:
+        loop = asyncio.get_running_loop()
+        # a file descriptor has a single reader in an event loop so the tasks
+        # of the loop wait for a token one at a time
+        async with self._locks.setdefault(loop, asyncio.Lock()):
+            while True:
+                readable: asyncio.Future[None] = loop.create_future()
+
+                def _ready() -> None:
+                    if not readable.done():
+                        readable.set_result(None)
+
+                for fd in self._pipes:
+                    loop.add_reader(fd, _ready)
+                try:
+                    await readable
+                finally:
+                    for fd in self._pipes:
+                        loop.remove_reader(fd)
+
+                for fd in self._pipes:
+                    try:
+                        token = os.read(fd, 1)
+                    except BlockingIOError:  # another process took it first
+                        continue
+                    if token:
+                        return fd, token
+
+    def acquire(self) -> tuple[int, bytes]:
+        while True:
+            readable, _, _ = select.select(tuple(self._pipes), (), ())
+            for fd in readable:
+                try:
+                    token = os.read(fd, 1)
+                except BlockingIOError:  # another process took it first
+                    continue
+                if token:
+                    return fd, token
+
+    def release(self, fd: int, token: bytes) -> None:
+        os.write(self._pipes[fd], token)
+
+
+_server: JobServer | None = None
+
+
+def _make_pipes(environ: Mapping[str, str]) -> list[tuple[int, int]]:
+    """The pipes of the jobserver of an enclosing `make -j`, if any."""
+    auths = _JOBSERVER_AUTH_RE.findall(environ.get('MAKEFLAGS', ''))
+    if not auths:
+        return []
+    auth = auths[-1]
+
+    if auth.startswith('fifo:'):
+        try:
+            fd = os.open(auth[len('fifo:'):], os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            return []
+        else:
+            return [(fd, fd)]
+
+    try:
+        read_fd, write_fd = (int(fd) for fd in auth.split(','))
+        # make does not pass its pipes to commands not marked with `+`
+        os.fstat(write_fd)
+        # the pipe is shared with the other jobs of make, which expect it to
+        # block, so it is opened again to be read without blocking.  without
+        # /proc the jobserver of make is not joined
+        nonblocking_fd = os.open(
+            f'/proc/self/fd/{read_fd}', os.O_RDONLY | os.O_NONBLOCK,
+        )
+    except (ValueError, OSError):
+        return []
+    else:
+        # hooks are not passed the pipes, even when started with `posix_spawn`
+        # (see `util._spawn_kwargs`)
+        os.set_inheritable(read_fd, False)
+        os.set_inheritable(write_fd, False)
+        return [(nonblocking_fd, write_fd)]
+
+
+@contextlib.contextmanager
+def jobs(
+        n: int | None,
+        environ: Mapping[str, str] = os.environ,
+) -> Generator[None, None, None]:
+    """Limit the number of jobs running at once to `n`.
+
+    Without `n`, the jobserver of an enclosing `make` is joined when there is
+    one, otherwise the limit is the number of CPUs.
+    """
+    global _server
+
+    if sys.platform == 'win32':  # pragma: win32 cover
+        yield
+        return
+
+    make_pipes = [] if n is not None else _make_pipes(environ)
+    if make_pipes:
+        # make already accounts for one job of ours
+        n = 1
+    elif n is None:
+        n = concurrency.cpu_count()
+    # the tokens must fit in the buffer of the pipe
+    n = min(n, 4096)
+
+    read_fd, write_fd = os.pipe()
+    try:
+        os.set_blocking(read_fd, False)
+        os.write(write_fd, b'+' * n)
+        _server = JobServer([(read_fd, write_fd), *make_pipes])
+        try:
+            yield
+        finally:
+            _server = None
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+        # the read end (which is the fifo itself) was opened by us
+        for make_read_fd, _ in make_pipes:
+            os.close(make_read_fd)
+
+
+@contextlib.contextmanager
+def token() -> Generator[None, None, None]:
+    """Hold a job token for the duration of the block, blocking the thread
+    until there is one.
+    """
+    server = _server
+    if server is None:
+        yield
+        return
+
+    fd, tok = server.acquire()
+    try:
+        yield
+    finally:
+        server.release(fd, tok)
+
+
+@contextlib.asynccontextmanager
+async def async_token() -> AsyncGenerator[None, None]:
+    """Hold a job token for the duration of the block, waiting for the token
+    in the running event loop.
+    """
+    server = _server
+    if server is None:
+        yield
+        return
+
+    fd, tok = await server.acquire_async()
+    try:
+        yield
+    finally:
+        server.release(fd, tok)
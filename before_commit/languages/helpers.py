@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import multiprocessing
 import os
 import random
 import re
@@ -10,10 +9,14 @@ from typing import Sequence
 from typing import TYPE_CHECKING
 
 import before_commit.constants as C
+from before_commit import concurrency
+from before_commit import costs
 from before_commit import parse_shebang
+from before_commit import worker
 from before_commit.hook import Hook
 from before_commit.prefix import Prefix
 from before_commit.util import cmd_output_b
+from before_commit.util import tmpdir
 from before_commit.xargs import xargs
 
 if TYPE_CHECKING:
@@ -23,6 +26,9 @@ FIXED_RANDOM_SEED = 1542676187
 
 SHIMS_RE = re.compile(r'[/\\]shims[/\\]')
 
+# `pass_filenames` modes which give every filename to a single process
+PASS_FILENAMES_MODES = ('stdin0', 'argfile')
+
 
 def exe_exists(exe: str) -> bool:
     found = parse_shebang.find_executable(exe)
@@ -108,10 +114,7 @@ def target_concurrency(hook: Hook) -> int:
         if 'TRAVIS' in os.environ:
             return 2
         else:
-            try:
-                return multiprocessing.cpu_count()
-            except NotImplementedError:
-                return 1
+            return concurrency.cpu_count()
 
 
 def _shuffled(seq: Sequence[str]) -> list[str]:
@@ -124,14 +127,64 @@ def _shuffled(seq: Sequence[str]) -> list[str]:
     return seq
 
 
+def _argfile_arg(arg: str) -> str:
+    # quoted as in the response files of gcc, also read by clang
+    return re.sub(r'([\s\'"\\])', r'\\\1', arg)
+
+
+def _run_single(
+        hook: Hook,
+        cmd: tuple[str, ...],
+        file_args: Sequence[str],
+        **kwargs: Any,
+) -> tuple[int, bytes]:
+    """Give every filename to a single process through a file, a process
+    would otherwise be started for every partition of the filenames.
+    """
+    if hook.pass_filenames == 'stdin0':
+        # NUL terminated, as `find -print0` does
+        contents = b''.join(os.fsencode(arg) + b'\0' for arg in file_args)
+    else:
+        contents = b''.join(
+            os.fsencode(_argfile_arg(arg)) + b'\n' for arg in file_args
+        )
+
+    kwargs['fail_fast'] = hook.fail_fast
+    kwargs['timeout'] = hook.timeout or None
+    with tmpdir() as directory:
+        filename = os.path.join(directory, 'filenames')
+        with open(filename, 'wb') as f:
+            f.write(contents)
+
+        if hook.pass_filenames == 'stdin0':
+            with open(filename, 'rb') as stdin:
+                return xargs(cmd, (), stdin=stdin, **kwargs)
+        else:
+            return xargs((*cmd, f'@{filename}'), (), **kwargs)
+
+
 def run_xargs(
         hook: Hook,
         cmd: tuple[str, ...],
         file_args: Sequence[str],
         **kwargs: Any,
 ) -> tuple[int, bytes]:
-    # Shuffle the files so that they more evenly fill out the xargs partitions,
-    # but do it deterministically in case a hook cares about ordering.
-    file_args = _shuffled(file_args)
+    if hook.worker:
+        kwargs['target_concurrency'] = target_concurrency(hook)
+        kwargs['partition_strategy'] = hook.partition_strategy
+        return worker.run(cmd, file_args, **kwargs)
+    elif hook.pass_filenames in PASS_FILENAMES_MODES:
+        return _run_single(hook, cmd, file_args, **kwargs)
+
+    if hook.partition_strategy == 'count':
+        # Shuffle the files so that they more evenly fill out the xargs
+        # partitions, but do it deterministically in case a hook cares about
+        # ordering.
+        file_args = _shuffled(file_args)
     kwargs['target_concurrency'] = target_concurrency(hook)
+    kwargs['partition_strategy'] = hook.partition_strategy
+    kwargs['min_partition_cost'] = costs.get(hook).min_partition_cost()
+    kwargs['cost_key'] = hook.key
+    kwargs['fail_fast'] = hook.fail_fast
+    kwargs['timeout'] = hook.timeout or None
     return xargs(cmd, file_args, **kwargs)
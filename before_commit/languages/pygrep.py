@@ -1,76 +1,240 @@
 from __future__ import annotations
 
 import argparse
+import bisect
+import concurrent.futures
+import contextlib
+import io
+import math
+import mmap
+import os
 import re
 import sys
+from typing import Any
+from typing import Callable
+from typing import Generator
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import Match
 from typing import NamedTuple
 from typing import Pattern
 from typing import Sequence
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import TypeVar
+from typing import Union
 
+from before_commit import jobserver
 from before_commit import output
+from before_commit import worker
 from before_commit.hook import Hook
 from before_commit.languages import helpers
 from before_commit.xargs import xargs
 
+if TYPE_CHECKING or sys.version_info < (3, 11):  # pragma: <3.11 cover
+    import sre_constants
+    import sre_parse
+else:  # pragma: >=3.11 cover
+    # `sre_parse` is deprecated
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+
 ENVIRONMENT_DIR = None
 get_default_version = helpers.basic_get_default_version
 health_check = helpers.basic_health_check
 install_environment = helpers.no_install
 
 
-def _process_filename_by_line(pattern: Pattern[bytes], filename: str) -> int:
-    retv = 0
-    with open(filename, 'rb') as f:
-        for line_no, line in enumerate(f, start=1):
-            if pattern.search(line):
-                retv = 1
-                output.write(f'{filename}:{line_no}:')
-                output.write_line_b(line.rstrip(b'\r\n'))
-    return retv
+# larger files are mapped rather than read into memory
+_MMAP_SIZE = 1 << 20
+# the size of the chunks of `_LineIndex`
+_CHUNK = 1 << 16
 
+Contents = Union[bytes, mmap.mmap]
+TRet = TypeVar('TRet')
 
-def _process_filename_at_once(pattern: Pattern[bytes], filename: str) -> int:
-    retv = 0
+
+@contextlib.contextmanager
+def _contents(filename: str) -> Generator[Contents, None, None]:
     with open(filename, 'rb') as f:
-        contents = f.read()
-        match = pattern.search(contents)
-        if match:
-            retv = 1
-            line_no = contents[:match.start()].count(b'\n')
-            output.write(f'{filename}:{line_no + 1}:')
+        if os.fstat(f.fileno()).st_size < _MMAP_SIZE:
+            yield f.read()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
+
+def _lines(contents: Contents) -> Iterator[bytes]:
+    """The lines of `contents`, as iterating over the file gives them."""
+    if isinstance(contents, bytes):
+        yield from io.BytesIO(contents)
+    else:
+        pos = 0
+        while pos < len(contents):
+            end = contents.find(b'\n', pos) + 1 or len(contents)
+            yield contents[pos:end]
+            pos = end
+
+
+def _literals(parsed: sre_parse.SubPattern) -> Iterator[bytes]:
+    """Literals which every match of the parsed pattern contains."""
+    run: list[int] = []
+    av: Any
+    for op, av in parsed.data:
+        if op == sre_constants.LITERAL:
+            run.append(av)
+            continue
+        elif run:
+            yield bytes(run)
+            run = []
+
+        if op == sre_constants.SUBPATTERN:
+            _, add_flags, _, p = av
+            if not add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                yield from _literals(p)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_repeat, _, p = av
+            if min_repeat > 0:
+                yield from _literals(p)
+    if run:
+        yield bytes(run)
+
+
+def _required_literal(pattern: Pattern[bytes]) -> bytes:
+    """The longest literal which every match of `pattern` contains, empty
+    when there is none which is known.
+
+    Files and lines without it are rejected without running the regex.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return b''
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)  # type: ignore
+    return max(_literals(parsed), key=len, default=b'')
+
+
+def _process_filename_by_line(
+        pattern: Pattern[bytes],
+        literal: bytes,
+        filename: str,
+        contents: Contents,
+) -> list[bytes]:
+    ret: list[bytes] = []
+    if contents.find(literal) == -1:
+        return ret
+    for line_no, line in enumerate(_lines(contents), start=1):
+        if literal in line and pattern.search(line):
+            prefix = os.fsencode(filename) + f':{line_no}:'.encode()
+            ret.append(prefix + line.rstrip(b'\r\n'))
+    return ret
+
+
+class _LineIndex:
+    """Line numbers of the offsets in `contents`.
+
+    The newlines are counted per chunk of `_CHUNK` bytes and located within
+    the chunks looked up, only as far into `contents` as needed.
+    """
+
+    def __init__(self, contents: Contents) -> None:
+        self.contents = contents
+        # the number of newlines before every chunk
+        self._counts = [0]
+        self._newlines: dict[int, list[int]] = {}
+
+    def _chunk_newlines(self, chunk: int) -> list[int]:
+        if chunk not in self._newlines:
+            start = chunk * _CHUNK
+            end = min(start + _CHUNK, len(self.contents))
+            newlines = []
+            pos = self.contents.find(b'\n', start, end)
+            while pos != -1:
+                newlines.append(pos)
+                pos = self.contents.find(b'\n', pos + 1, end)
+            self._newlines[chunk] = newlines
+        return self._newlines[chunk]
+
+    def line_no(self, pos: int) -> int:
+        chunk = pos // _CHUNK
+        while len(self._counts) <= chunk:
+            start = (len(self._counts) - 1) * _CHUNK
+            newlines = self.contents[start:start + _CHUNK].count(b'\n')
+            self._counts.append(self._counts[-1] + newlines)
+        before = bisect.bisect_left(self._chunk_newlines(chunk), pos)
+        return self._counts[chunk] + before + 1
+
+
+def _match_output(
+        filename: str,
+        lines: _LineIndex,
+        match: Match[bytes],
+) -> bytes:
+    contents = lines.contents
+    line_start = contents.rfind(b'\n', 0, match.start()) + 1
+    line_end = contents.find(b'\n', line_start)
+    if line_end == -1:
+        line_end = len(contents)
 
-            matched_lines = match[0].split(b'\n')
-            matched_lines[0] = contents.split(b'\n')[line_no]
+    matched_lines = match[0].split(b'\n')
+    matched_lines[0] = contents[line_start:line_end]
 
-            output.write_line_b(b'\n'.join(matched_lines))
-    return retv
+    line_no = lines.line_no(match.start())
+    prefix = os.fsencode(filename) + f':{line_no}:'.encode()
+    return prefix + b'\n'.join(matched_lines)
+
+
+def _process_filename_at_once(
+        pattern: Pattern[bytes],
+        literal: bytes,
+        filename: str,
+        contents: Contents,
+) -> list[bytes]:
+    match = contents.find(literal) != -1 and pattern.search(contents)
+    if match:
+        return [_match_output(filename, _LineIndex(contents), match)]
+    else:
+        return []
+
+
+def _process_filename_at_once_all(
+        pattern: Pattern[bytes],
+        literal: bytes,
+        filename: str,
+        contents: Contents,
+) -> list[bytes]:
+    if contents.find(literal) == -1:
+        return []
+    lines = _LineIndex(contents)
+    return [
+        _match_output(filename, lines, match)
+        for match in pattern.finditer(contents)
+    ]
 
 
 def _process_filename_by_line_negated(
         pattern: Pattern[bytes],
+        literal: bytes,
         filename: str,
-) -> int:
-    with open(filename, 'rb') as f:
-        for line in f:
-            if pattern.search(line):
-                return 0
-        else:
-            output.write_line(filename)
-            return 1
+        contents: Contents,
+) -> list[bytes]:
+    if contents.find(literal) != -1:
+        for line in _lines(contents):
+            if literal in line and pattern.search(line):
+                return []
+    return [os.fsencode(filename)]
 
 
 def _process_filename_at_once_negated(
         pattern: Pattern[bytes],
+        literal: bytes,
         filename: str,
-) -> int:
-    with open(filename, 'rb') as f:
-        contents = f.read()
-    match = pattern.search(contents)
+        contents: Contents,
+) -> list[bytes]:
+    match = contents.find(literal) != -1 and pattern.search(contents)
     if match:
-        return 0
+        return []
     else:
-        output.write_line(filename)
-        return 1
+        return [os.fsencode(filename)]
 
 
 class Choice(NamedTuple):
@@ -86,16 +250,7 @@ FNS = {
 }
 
 
-def run_hook(
-        hook: Hook,
-        file_args: Sequence[str],
-        color: bool,
-) -> tuple[int, bytes]:
-    exe = (sys.executable, '-m', __name__) + tuple(hook.args) + (hook.entry,)
-    return xargs(exe, file_args, color=color)
-
-
-def main(argv: Sequence[str] | None = None) -> int:
+def _parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description=(
             'grep-like finder using python regexes.  Unlike grep, this tool '
@@ -106,21 +261,223 @@ def main(argv: Sequence[str] | None = None) -> int:
     parser.add_argument('-i', '--ignore-case', action='store_true')
     parser.add_argument('--multiline', action='store_true')
     parser.add_argument('--negate', action='store_true')
+    parser.add_argument(
+        '--all-matches', action='store_true',
+        help='with --multiline, report every match rather than the first.',
+    )
     parser.add_argument('pattern', help='python regex pattern.')
     parser.add_argument('filenames', nargs='*')
-    args = parser.parse_args(argv)
+    parser.add_argument(
+        worker.WORKER_ARG, action='store_true', help=argparse.SUPPRESS,
+    )
+    return parser
+
 
+ProcessFn = Callable[[Pattern[bytes], bytes, str, Contents], List[bytes]]
+
+
+class _Grep(NamedTuple):
+    pattern: Pattern[bytes]
+    literal: bytes
+    process_fn: ProcessFn
+
+    def process(self, filename: str, contents: Contents) -> list[bytes]:
+        return self.process_fn(self.pattern, self.literal, filename, contents)
+
+
+def _grep(args: argparse.Namespace) -> _Grep:
     flags = re.IGNORECASE if args.ignore_case else 0
     if args.multiline:
         flags |= re.MULTILINE | re.DOTALL
 
     pattern = re.compile(args.pattern.encode(), flags)
 
-    retv = 0
-    process_fn = FNS[Choice(multiline=args.multiline, negate=args.negate)]
-    for filename in args.filenames:
-        retv |= process_fn(pattern, filename)
-    return retv
+    process_fn: ProcessFn
+    if args.multiline and args.all_matches and not args.negate:
+        process_fn = _process_filename_at_once_all
+    else:
+        process_fn = FNS[Choice(multiline=args.multiline, negate=args.negate)]
+    return _Grep(pattern, _required_literal(pattern), process_fn)
+
+
+def _in_process_grep(hook: Hook) -> _Grep | None:
+    """The grep of `hook` when it can run in this process, producing the
+    same output as `main` in a subprocess would.
+    """
+    if hook.worker:
+        return None
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            args = _parser().parse_args((*hook.args, hook.entry))
+        if args.filenames or args.persistent_worker:
+            return None
+        return _grep(args)
+    except (SystemExit, re.error):  # reported by the subprocess
+        return None
+
+
+def _map_files(
+        fn: Callable[[str], TRet],
+        filenames: Sequence[str],
+        threads: int,
+) -> list[TRet]:
+    """`fn` of each of `filenames`, in order.
+
+    The files are split in up to `threads` partitions which, like the
+    partitions of `xargs`, each hold a job token while they run.
+    """
+    size = max(math.ceil(len(filenames) / threads), 1)
+    partitions = [
+        filenames[i:i + size] for i in range(0, len(filenames), size)
+    ]
+
+    def run_partition(partition: Sequence[str]) -> list[TRet]:
+        with jobserver.token():
+            return [fn(filename) for filename in partition]
+
+    if not partitions:
+        return []
+    elif len(partitions) == 1:
+        return run_partition(filenames)
+    with concurrent.futures.ThreadPoolExecutor(len(partitions)) as executor:
+        return [
+            ret
+            for rets in executor.map(run_partition, partitions)
+            for ret in rets
+        ]
+
+
+def _key(hook: Hook) -> tuple[str, ...]:
+    return (*hook.args, hook.entry)
+
+
+# grep -> filename -> output
+Scanned = Mapping[Tuple[str, ...], Mapping[str, List[bytes]]]
+
+
+def scan(
+        hooks: Sequence[Hook],
+        hook_filenames: Sequence[Sequence[str]],
+) -> Scanned:
+    """Scan the files of the pygrep `hooks` once for all of them.
+
+    Every file is read once and searched for the patterns of all the hooks
+    which check it.
+    """
+    greps: dict[tuple[str, ...], _Grep] = {}
+    file_greps: dict[str, list[tuple[str, ...]]] = {}
+    threads = []
+    for hook, filenames in zip(hooks, hook_filenames):
+        if hook.language != 'pygrep' or not hook.pass_filenames:
+            continue
+        grep = _in_process_grep(hook)
+        if grep is None:
+            continue
+        greps[_key(hook)] = grep
+        threads.append(helpers.target_concurrency(hook))
+        for filename in filenames:
+            file_greps.setdefault(filename, []).append(_key(hook))
+
+    # a single hook reads its files only once anyway
+    if len(greps) < 2:
+        return {}
+
+    def scan_file(filename: str) -> dict[tuple[str, ...], list[bytes]]:
+        try:
+            with _contents(filename) as contents:
+                return {
+                    key: greps[key].process(filename, contents)
+                    for key in file_greps[filename]
+                }
+        except OSError:  # left to the hooks
+            return {}
+
+    ret: dict[tuple[str, ...], dict[str, list[bytes]]] = {
+        key: {} for key in greps
+    }
+    outputs = _map_files(scan_file, tuple(file_greps), min(threads))
+    for filename, file_outputs in zip(file_greps, outputs):
+        for key, lines in file_outputs.items():
+            ret[key][filename] = lines
+    return ret
+
+
+_scanned: Scanned = {}
+
+
+@contextlib.contextmanager
+def using(scanned: Scanned) -> Generator[None, None, None]:
+    """Make the output of `scan` available to the hooks run in the block.
+
+    The scanned files must not change in the block.
+    """
+    global _scanned
+
+    _scanned = scanned
+    try:
+        yield
+    finally:
+        _scanned = {}
+
+
+def _process_file(grep: _Grep, filename: str) -> list[bytes]:
+    with _contents(filename) as contents:
+        return grep.process(filename, contents)
+
+
+def run_hook(
+        hook: Hook,
+        file_args: Sequence[str],
+        color: bool,
+) -> tuple[int, bytes]:
+    exe = (sys.executable, '-m', __name__) + tuple(hook.args) + (hook.entry,)
+    if hook.worker:
+        return worker.run(exe, file_args, color=color)
+
+    grep = _in_process_grep(hook)
+    if grep is not None:
+        # rather than starting interpreters which import before-commit and
+        # compile the pattern again
+        scanned = _scanned.get(_key(hook), {})
+
+        def process(filename: str) -> list[bytes]:
+            if filename in scanned:
+                return scanned[filename]
+            else:
+                return _process_file(grep, filename)
+
+        threads = helpers.target_concurrency(hook)
+        try:
+            lines = [
+                line
+                for file_lines in _map_files(process, file_args, threads)
+                for line in file_lines
+            ]
+        except OSError:  # the subprocess reports the unreadable file
+            pass
+        else:
+            return int(bool(lines)), b''.join(line + b'\n' for line in lines)
+
+    return xargs(exe, file_args, color=color)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+    grep = _grep(args)
+
+    def _process_filenames(filenames: Sequence[str]) -> int:
+        retv = 0
+        for filename in filenames:
+            lines = _process_file(grep, filename)
+            for line in lines:
+                output.write_line_b(line)
+            retv |= bool(lines)
+        return retv
+
+    if args.persistent_worker:
+        return worker.serve(_process_filenames)
+    else:
+        return _process_filenames(args.filenames)
 
 
 if __name__ == '__main__':
@@ -20,6 +20,7 @@ from before_commit.util import CalledProcessError
 from before_commit.util import clean_path_on_failure
 from before_commit.util import cmd_output
 from before_commit.util import cmd_output_b
+from before_commit.util import resource_text
 from before_commit.util import win_exe
 
 ENVIRONMENT_DIR = 'py_env'
@@ -227,4 +228,19 @@ def run_hook(
         color: bool,
 ) -> tuple[int, bytes]:
     with in_env(hook.prefix, hook.language_version):
-        return helpers.run_xargs(hook, hook.cmd, file_args, color=color)
+        if hook.worker and hasattr(os, 'fork'):  # pragma: win32 no cover
+            # the tool is imported once by a worker which forks a process
+            # from it for every batch of files.  the arguments are sent with
+            # the files so the hooks using the tool share its worker
+            cmd = (
+                'python', '-c', resource_text('python_forkserver.py'),
+                hook.cmd[0],
+            )
+            return helpers.run_xargs(
+                hook, cmd, file_args, color=color, args=hook.cmd[1:],
+            )
+        else:
+            # without fork the tool is started for every batch of files
+            return helpers.run_xargs(
+                hook._replace(worker=False), hook.cmd, file_args, color=color,
+            )
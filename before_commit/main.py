@@ -56,6 +56,13 @@ def _add_hook_type_option(parser: argparse.ArgumentParser) -> None:
     )
 
 
+def _positive_int(s: str) -> int:
+    ret = int(s)
+    if ret < 1:
+        raise argparse.ArgumentTypeError(f'expected a positive integer: {s}')
+    return ret
+
+
 def _add_run_options(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('hook', nargs='?', help='A single hook-id to run')
     parser.add_argument('--verbose', '-v', action='store_true', default=False)
@@ -137,6 +144,21 @@ def _add_run_options(parser: argparse.ArgumentParser) -> None:
             'the rewrite'
         ),
     )
+    parser.add_argument(
+        '--jobs', '-j', type=_positive_int,
+        help=(
+            'Maximum number of hook processes to run at once across all '
+            'hooks.  Defaults to the jobserver of an enclosing `make -j` or '
+            'the number of CPUs.'
+        ),
+    )
+    parser.add_argument(
+        '--trace-file',
+        help=(
+            'Write a timeline of the run to this file in the Chrome trace '
+            'event format.'
+        ),
+    )
 
 
 def _guess_config_file(args: argparse.Namespace) -> None:
@@ -166,6 +188,8 @@ def _adjust_args_and_chdir(args: argparse.Namespace) -> None:
 
     if args.command in {'run', 'try-repo'}:
         args.files = [os.path.abspath(filename) for filename in args.files]
+        if args.trace_file:
+            args.trace_file = os.path.abspath(args.trace_file)
     if args.command == 'try-repo' and os.path.exists(args.repo):
         args.repo = os.path.abspath(args.repo)
 
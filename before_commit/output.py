@@ -4,6 +4,7 @@ import contextlib
 import sys
 from typing import Any
 from typing import IO
+from typing import Iterable
 
 
 def write(s: str, stream: IO[bytes] = sys.stdout.buffer) -> None:
@@ -16,15 +17,26 @@ def write_line_b(
         stream: IO[bytes] = sys.stdout.buffer,
         logfile_name: str | None = None,
 ) -> None:
+    chunks = (s,) if s is not None else ()
+    write_chunks_b(chunks, stream=stream, logfile_name=logfile_name)
+
+
+def write_chunks_b(
+        chunks: Iterable[bytes],
+        stream: IO[bytes] = sys.stdout.buffer,
+        logfile_name: str | None = None,
+) -> None:
+    """As `write_line_b`, for output which is not held in memory at once."""
     with contextlib.ExitStack() as exit_stack:
         output_streams = [stream]
         if logfile_name:
             stream = exit_stack.enter_context(open(logfile_name, 'ab'))
             output_streams.append(stream)
 
+        for chunk in chunks:
+            for output_stream in output_streams:
+                output_stream.write(chunk)
         for output_stream in output_streams:
-            if s is not None:
-                output_stream.write(s)
             output_stream.write(b'\n')
             output_stream.flush()
 
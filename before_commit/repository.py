@@ -7,6 +7,7 @@ from typing import Any
 from typing import Sequence
 
 import before_commit.constants as C
+from before_commit import trace
 from before_commit.clientlib import detect_manifest_file
 from before_commit.clientlib import load_manifest
 from before_commit.clientlib import LOCAL
@@ -52,15 +53,16 @@ def _write_state(prefix: Prefix, venv: str, state: object) -> None:
 def _hook_installed(hook: Hook) -> bool:
     lang = languages[hook.language]
     venv = environment_dir(lang.ENVIRONMENT_DIR, hook.language_version)
-    return (
-        venv is None or (
-            (
-                _read_state(hook.prefix, venv) ==
-                _state(hook.additional_dependencies)
-            ) and
-            not lang.health_check(hook.prefix, hook.language_version)
+    with trace.span('check_environment', hook=hook.src, venv=venv):
+        return (
+            venv is None or (
+                (
+                    _read_state(hook.prefix, venv) ==
+                    _state(hook.additional_dependencies)
+                ) and
+                not lang.health_check(hook.prefix, hook.language_version)
+            )
         )
-    )
 
 
 def _hook_install(hook: Hook) -> None:
@@ -221,7 +223,8 @@ def install_hook_envs(hooks: Sequence[Hook], store: Store) -> None:
     with store.exclusive_lock():
         # Another process may have already completed this work
         for hook in _need_installed():
-            _hook_install(hook)
+            with trace.span('install_environment', hook=hook.src):
+                _hook_install(hook)
 
 
 def all_hooks(root_config: dict[str, Any], store: Store) -> tuple[Hook, ...]:
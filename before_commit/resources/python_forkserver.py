@@ -0,0 +1,154 @@
+# Runs a python tool as a persistent worker (see `before_commit.worker`).
+#
+# This runs with the python of the hook's environment, which does not have
+# before-commit installed.  The console script of the tool is imported once
+# and a process is forked from it for every request as it is received:
+# before-commit sends a request once it holds a job token for it.
+#
+# usage: python -c "$(cat python_forkserver.py)" CMD... WORKER_ARG
+from __future__ import annotations
+
+import atexit
+import collections
+import contextlib
+import json
+import os
+import select
+import sys
+import tempfile
+import traceback
+from typing import Any
+from typing import Callable
+from typing import IO
+from typing import NoReturn
+
+EntryPoint = Callable[[], Any]
+
+
+def _load(name: str) -> EntryPoint | None:
+    if os.sep in name or (os.altsep and os.altsep in name):
+        return None
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # pragma: no cover (python < 3.8)
+        return None
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):  # pragma: >=3.10 cover
+        matches = list(eps.select(group='console_scripts', name=name))
+    else:  # pragma: <3.10 cover
+        scripts = eps.get('console_scripts', ())
+        matches = [ep for ep in scripts if ep.name == name]
+    if not matches:
+        return None
+    try:
+        return matches[0].load()
+    except Exception:  # the tool reports the error when it is run
+        return None
+
+
+def _exit_code(code: object) -> int:
+    # as the interpreter exits with `SystemExit(code)`
+    if code is None:
+        return 0
+    elif isinstance(code, int):
+        return code
+    else:
+        print(code, file=sys.stderr)
+        return 1
+
+
+def _exec(argv: list[str]) -> NoReturn:
+    try:
+        os.execvp(argv[0], argv)
+    except FileNotFoundError:  # as before-commit reports it
+        raise SystemExit(f'Executable `{argv[0]}` not found')
+
+
+def _run(entry_point: EntryPoint | None, argv: list[str], done: int) -> None:
+    """Run the tool in a forked process, exiting with its exit code."""
+    sys.argv = argv
+    try:
+        if entry_point is None:
+            # the pipe is closed once the command exits rather than now
+            os.set_inheritable(done, True)
+            _exec(argv)
+        sys.exit(entry_point())
+    except SystemExit as e:
+        code = _exit_code(e.code)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+
+    try:
+        atexit._run_exitfuncs()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _returncode(status: int) -> int:
+    # as `subprocess` reports it
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    else:
+        return os.WEXITSTATUS(status)
+
+
+def main() -> int:
+    cmd = sys.argv[1:-1]
+    # stdout is for the responses only
+    with contextlib.redirect_stdout(sys.stderr):
+        entry_point = _load(cmd[0])
+
+    requests: collections.deque[dict[str, Any]] = collections.deque()
+    # read end of a pipe closed by the process -> pid, request id, output
+    running: dict[int, tuple[int, int, IO[bytes]]] = {}
+    buf = b''
+    eof = False
+    while not eof or requests or running:
+        while requests:
+            request = requests.popleft()
+            out: IO[bytes] = tempfile.TemporaryFile()
+            done_r, done_w = os.pipe()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.close(done_r)
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                os.dup2(devnull, 0)
+                os.dup2(out.fileno(), 1)
+                os.dup2(out.fileno(), 2)
+                _run(entry_point, [*cmd, *request['arguments']], done_w)
+            os.close(done_w)
+            running[done_r] = (pid, request['requestId'], out)
+
+        readable = list(running) if eof else [0, *running]
+        for fd in select.select(readable, [], [])[0]:
+            if fd == 0:
+                data = os.read(0, 65536)
+                eof = not data
+                *lines, buf = (buf + data).split(b'\n')
+                requests.extend(json.loads(line) for line in lines)
+                continue
+
+            os.close(fd)
+            pid, request_id, out = running.pop(fd)
+            _, status = os.waitpid(pid, 0)
+            with out:
+                out.seek(0)
+                output = out.read().decode(errors='surrogateescape')
+            response = {
+                'requestId': request_id,
+                'exitCode': _returncode(status),
+                'output': output,
+            }
+            sys.stdout.write(f'{json.dumps(response)}\n')
+            sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -12,6 +12,8 @@ from typing import Sequence
 import before_commit.constants as C
 from before_commit import file_lock
 from before_commit import git
+from before_commit import trace
+from before_commit.costs import HookCosts
 from before_commit.util import CalledProcessError
 from before_commit.util import clean_path_on_failure
 from before_commit.util import cmd_output_b
@@ -80,6 +82,8 @@ class Store:
                     ');',
                 )
                 self._create_config_table(db)
+                self._create_hook_cache_table(db)
+                self._create_file_tags_table(db)
 
             # Atomic file move
             os.replace(tmpfile, self.db_path)
@@ -187,7 +191,8 @@ class Store:
             except CalledProcessError:
                 self._complete_clone(ref, _git_cmd)
 
-        return self._new_repo(repo, ref, deps, clone_strategy)
+        with trace.span('clone', repo=repo, ref=ref):
+            return self._new_repo(repo, ref, deps, clone_strategy)
 
     LOCAL_RESOURCES = (
         'Cargo.toml', 'main.go', 'go.mod', 'main.rs', '.npmignore',
@@ -253,6 +258,162 @@ class Store:
             rows = [(path,) for path in configs]
             db.executemany('DELETE FROM configs WHERE path = ?', rows)
 
+    def _create_hook_cache_table(self, db: sqlite3.Connection) -> None:
+        db.executescript(
+            'CREATE TABLE IF NOT EXISTS hook_cache ('
+            '   key TEXT NOT NULL,'
+            '   prefix TEXT NOT NULL,'
+            '   filename TEXT NOT NULL,'
+            '   digest TEXT NOT NULL,'
+            '   PRIMARY KEY (key, filename)'
+            ');',
+        )
+
+    def select_passed_files(
+            self,
+            key: str,
+            digests: dict[str, str],
+    ) -> set[str]:
+        """Returns the filenames which previously passed the hook identified
+        by `key` with exactly the given contents.
+        """
+        if self.readonly:  # pragma: win32 no cover
+            return set()
+        with self.connect() as db:
+            self._create_hook_cache_table(db)
+            rows = db.execute(
+                'SELECT filename, digest FROM hook_cache WHERE key = ?',
+                (key,),
+            ).fetchall()
+        return {
+            filename for filename, digest in rows
+            if digests.get(filename) == digest
+        }
+
+    def mark_files_passed(
+            self,
+            key: str,
+            prefix: str,
+            digests: dict[str, str],
+    ) -> None:
+        if self.readonly:  # pragma: win32 no cover
+            return
+        with self.connect() as db:
+            self._create_hook_cache_table(db)
+            db.executemany(
+                'INSERT OR REPLACE INTO hook_cache VALUES (?, ?, ?, ?)',
+                [
+                    (key, prefix, filename, digest)
+                    for filename, digest in digests.items()
+                ],
+            )
+
+    def _create_file_tags_table(self, db: sqlite3.Connection) -> None:
+        rows = db.execute('PRAGMA table_info(file_tags)').fetchall()
+        columns = {row[1] for row in rows}
+        # the tags are a cache: a table from before the index mode of the
+        # files was recorded is started again
+        if columns and 'index_mode' not in columns:
+            db.executescript('DROP TABLE file_tags')
+        db.executescript(
+            'CREATE TABLE IF NOT EXISTS file_tags ('
+            '   root TEXT NOT NULL,'
+            '   path TEXT NOT NULL,'
+            '   size INTEGER NOT NULL,'
+            '   mtime_ns INTEGER NOT NULL,'
+            '   mode INTEGER NOT NULL,'
+            '   index_mode TEXT,'
+            '   tags TEXT NOT NULL,'
+            '   PRIMARY KEY (root, path)'
+            ');',
+        )
+
+    def select_file_tags(
+            self,
+            root: str,
+    ) -> dict[str, tuple[int, int, int, str | None, frozenset[str]]]:
+        """Returns the `(size, mtime_ns, mode, index_mode, tags)` recorded
+        for each file of the repository at `root`.
+        """
+        if self.readonly:  # pragma: win32 no cover
+            return {}
+        with self.connect() as db:
+            self._create_file_tags_table(db)
+            rows = db.execute(
+                'SELECT path, size, mtime_ns, mode, index_mode, tags '
+                'FROM file_tags WHERE root = ?',
+                (root,),
+            ).fetchall()
+        return {
+            path: (size, mtime_ns, mode, index_mode, frozenset(tags.split()))
+            for path, size, mtime_ns, mode, index_mode, tags in rows
+        }
+
+    def mark_file_tags(
+            self,
+            root: str,
+            file_tags: dict[
+                str, tuple[int, int, int, str | None, frozenset[str]],
+            ],
+    ) -> None:
+        if self.readonly:  # pragma: win32 no cover
+            return
+        with self.connect() as db:
+            self._create_file_tags_table(db)
+            db.executemany(
+                'INSERT OR REPLACE INTO file_tags '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (root, path, *key, ' '.join(sorted(tags)))
+                    for path, (*key, tags) in file_tags.items()
+                ],
+            )
+
+    def _create_hook_costs_table(self, db: sqlite3.Connection) -> None:
+        db.executescript(
+            'CREATE TABLE IF NOT EXISTS hook_costs ('
+            '   key TEXT NOT NULL,'
+            '   prefix TEXT NOT NULL,'
+            f'   {", ".join(f"{k} REAL NOT NULL" for k in HookCosts._fields)},'
+            '   PRIMARY KEY (key)'
+            ');',
+        )
+
+    def select_hook_costs(self) -> dict[str, HookCosts]:
+        if self.readonly:  # pragma: win32 no cover
+            return {}
+        with self.connect() as db:
+            self._create_hook_costs_table(db)
+            rows = db.execute(
+                f'SELECT key, {", ".join(HookCosts._fields)} FROM hook_costs',
+            ).fetchall()
+        return {key: HookCosts(*costs) for key, *costs in rows}
+
+    def add_hook_costs(self, costs: dict[str, tuple[str, HookCosts]]) -> None:
+        """Add the costs observed in a run to those of previous runs."""
+        if self.readonly:  # pragma: win32 no cover
+            return
+        with self.connect() as db:
+            self._create_hook_costs_table(db)
+            previous = {
+                key: HookCosts(*values)
+                for key, *values in db.execute(
+                    f'SELECT key, {", ".join(HookCosts._fields)} '
+                    f'FROM hook_costs',
+                )
+            }
+            db.executemany(
+                f'INSERT OR REPLACE INTO hook_costs VALUES '
+                f'(?, ?, {", ".join("?" for _ in HookCosts._fields)})',
+                [
+                    (
+                        key, prefix,
+                        *previous.get(key, HookCosts()).add(hook_costs),
+                    )
+                    for key, (prefix, hook_costs) in costs.items()
+                ],
+            )
+
     def select_all_repos(self) -> list[tuple[str, str, str]]:
         with self.connect() as db:
             return db.execute('SELECT repo, ref, path from repos').fetchall()
@@ -263,4 +424,8 @@ class Store:
                 'DELETE FROM repos WHERE repo = ? and ref = ?',
                 (db_repo_name, ref),
             )
+            self._create_hook_cache_table(db)
+            db.execute('DELETE FROM hook_cache WHERE prefix = ?', (path,))
+            self._create_hook_costs_table(db)
+            db.execute('DELETE FROM hook_costs WHERE prefix = ?', (path,))
         rmtree(path)
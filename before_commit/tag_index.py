@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+import time
+
+from identify.identify import tags_from_path
+
+from before_commit import git
+from before_commit.store import Store
+
+# git only records the executable bit of regular files
+_REGULAR_MODES = {'100644': False, '100755': True}
+# files modified this recently may be modified again without their `stat`
+# changing, see "racy git"
+_RACY_NS = 2 * 10 ** 9
+
+
+def _tags(filename: str, index_mode: str | None) -> frozenset[str]:
+    """Same as `identify.tags_from_path` but taking the executable bit from
+    the index for tracked files.
+    """
+    tags = tags_from_path(filename)
+    if 'file' in tags and index_mode in _REGULAR_MODES:
+        executable = _REGULAR_MODES[index_mode]
+        tags -= {'executable', 'non-executable'}
+        tags.add('executable' if executable else 'non-executable')
+    return frozenset(tags)
+
+
+class TagIndex:
+    """Caches the `identify` tags of files in the store between runs.
+
+    Entries are keyed by the repository root and filename and are only used
+    while the size, mtime and mode of the file and its mode in the git index
+    are unchanged.  A warm run reads the git index once and does no more
+    than an `lstat` per file.
+    """
+
+    def __init__(self, store: Store, root: str) -> None:
+        self._store = store
+        self._root = root
+        self._start_ns = time.time_ns()
+        self._rows = store.select_file_tags(root)
+        self._index: dict[str, str] | None = None
+        self._new: dict[
+            str, tuple[int, int, int, str | None, frozenset[str]],
+        ] = {}
+
+    def _index_mode(self, filename: str) -> str | None:
+        if self._index is None:
+            self._index = {
+                filename: mode
+                for filename, (mode, _) in git.get_index_entries().items()
+            }
+        return self._index.get(filename)
+
+    def tags(self, filename: str) -> frozenset[str]:
+        try:
+            st = os.lstat(filename)
+        except (OSError, ValueError):
+            raise ValueError(f'{filename} does not exist.')
+
+        index_mode = self._index_mode(filename)
+        key = (st.st_size, st.st_mtime_ns, st.st_mode, index_mode)
+        row = self._rows.get(filename)
+        if row is not None and row[:4] == key:
+            return row[4]
+
+        tags = _tags(filename, index_mode)
+        self._rows[filename] = (*key, tags)
+        if st.st_mtime_ns < self._start_ns - _RACY_NS:
+            self._new[filename] = (*key, tags)
+        return tags
+
+    def save(self) -> None:
+        """Persist the tags computed since the index was loaded."""
+        if self._new:
+            self._store.mark_file_tags(self._root, self._new)
+            self._new = {}
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+from typing import Generator
+
+# file descriptor events are appended to while tracing.  hooks which run
+# concurrently in forked processes inherit it and append their own events
+_fd: int | None = None
+
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Generator[dict[str, Any], None, None]:
+    """Record the duration of the block as a complete event.
+
+    The `args` of the event are yielded so they can be completed with values
+    only known at the end of the block (such as a return code).
+    """
+    if _fd is None:
+        yield args
+        return
+
+    start = time.monotonic_ns()
+    try:
+        yield args
+    finally:
+        end = time.monotonic_ns()
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start / 1000,
+            'dur': (end - start) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+        # a single write of a line appended to the file does not interleave
+        # with the writes of other processes
+        os.write(_fd, f'{json.dumps(event, default=str)}\n'.encode())
+
+
+@contextlib.contextmanager
+def recording(events: list[dict[str, Any]]) -> Generator[None, None, None]:
+    """Add the events recorded by `span` in the block to `events`, including
+    the events of processes forked in the block.
+    """
+    global _fd
+
+    fd, events_filename = tempfile.mkstemp(prefix='before-commit-trace-')
+    os.close(fd)
+    _fd = events_fd = os.open(events_filename, os.O_WRONLY | os.O_APPEND)
+    try:
+        yield
+    finally:
+        _fd = None
+        os.close(events_fd)
+        # the events are kept even if the block failed
+        with open(events_filename, 'rb') as f:
+            events.extend(json.loads(line) for line in f)
+        os.remove(events_filename)
+
+
+def write(filename: str, events: list[dict[str, Any]]) -> None:
+    """Write `events` to `filename` in the Chrome trace event format
+    (viewable in `chrome://tracing` or https://ui.perfetto.dev).
+    """
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
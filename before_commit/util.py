@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import contextlib
 import errno
 import functools
 import importlib.resources
+import io
 import os.path
 import shutil
+import signal
 import stat
 import subprocess
 import sys
@@ -113,11 +116,35 @@ class CalledProcessError(RuntimeError):
         return self.__bytes__().decode()
 
 
+# as `timeout(1)` does
+TIMEOUT_RETURNCODE = 124
+
+
 def _setdefault_kwargs(kwargs: dict[str, Any]) -> None:
     for arg in ('stdin', 'stdout', 'stderr'):
         kwargs.setdefault(arg, subprocess.PIPE)
 
 
+# `subprocess` starts processes with `posix_spawn` rather than `fork` (which
+# slows down as the parent grows) only when the parent's file descriptors are
+# not closed, and without a `cwd`.  python >= 3.10 uses `vfork` either way.
+_POSIX_SPAWN = (
+    sys.version_info < (3, 10) and
+    getattr(subprocess, '_USE_POSIX_SPAWN', False)
+)
+
+
+def _spawn_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
+    # file descriptors opened by python are not inherited anyway (PEP 446)
+    if (  # pragma: <3.10 cover
+            _POSIX_SPAWN and
+            kwargs.get('cwd') is None and
+            not kwargs.get('start_new_session')
+    ):
+        kwargs.setdefault('close_fds', False)
+    return kwargs
+
+
 def _oserror_to_output(e: OSError) -> tuple[int, bytes, None]:
     return 1, force_bytes(e).rstrip(b'\n') + b'\n', None
 
@@ -135,7 +162,7 @@ def cmd_output_b(
         returncode, stdout_b, stderr_b = e.to_output()
     else:
         try:
-            proc = subprocess.Popen(cmd, **kwargs)
+            proc = subprocess.Popen(cmd, **_spawn_kwargs(kwargs))
         except OSError as e:
             returncode, stdout_b, stderr_b = _oserror_to_output(e)
         else:
@@ -148,6 +175,33 @@ def cmd_output_b(
     return returncode, stdout_b, stderr_b
 
 
+def cmd_output_stream_b(*cmd: str, out: IO[bytes], **kwargs: Any) -> int:
+    """Run `cmd`, writing its output to `out` as it arrives rather than
+    holding it in memory.  stderr is written to `out` as well.
+    """
+    try:
+        cmd = parse_shebang.normalize_cmd(cmd)
+    except parse_shebang.ExecutableNotFoundError as e:
+        returncode, stdout_b, _ = e.to_output()
+        out.write(stdout_b)
+        return returncode
+
+    kwargs.setdefault('stdin', subprocess.DEVNULL)
+    kwargs.update({'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT})
+    try:
+        proc = subprocess.Popen(cmd, **_spawn_kwargs(kwargs))
+    except OSError as e:
+        returncode, stdout_b, _ = _oserror_to_output(e)
+        out.write(stdout_b)
+        return returncode
+
+    assert proc.stdout is not None
+    with proc.stdout:
+        for bts in iter(functools.partial(proc.stdout.read, 65536), b''):
+            out.write(bts)
+    return proc.wait()
+
+
 def cmd_output(*cmd: str, **kwargs: Any) -> tuple[int, str, str | None]:
     returncode, stdout_b, stderr_b = cmd_output_b(*cmd, **kwargs)
     stdout = stdout_b.decode() if stdout_b is not None else None
@@ -194,47 +248,160 @@ if sys.platform != 'win32':  # pragma: win32 no cover
             self.close_w()
             self.close_r()
 
-    def cmd_output_p(
+    def cmd_output_stream_p(
             *cmd: str,
-            retcode: int | None = 0,
+            out: IO[bytes],
             **kwargs: Any,
-    ) -> tuple[int, bytes, bytes | None]:
-        assert retcode is None
-        assert kwargs['stderr'] == subprocess.STDOUT, kwargs['stderr']
-        _setdefault_kwargs(kwargs)
-
+    ) -> int:
         try:
             cmd = parse_shebang.normalize_cmd(cmd)
         except parse_shebang.ExecutableNotFoundError as e:
-            return e.to_output()
+            returncode, stdout_b, _ = e.to_output()
+            out.write(stdout_b)
+            return returncode
 
         with open(os.devnull) as devnull, Pty() as pty:
             assert pty.r is not None
             kwargs.update({'stdin': devnull, 'stdout': pty.w, 'stderr': pty.w})
             try:
-                proc = subprocess.Popen(cmd, **kwargs)
+                proc = subprocess.Popen(cmd, **_spawn_kwargs(kwargs))
             except OSError as e:
-                return _oserror_to_output(e)
+                returncode, stdout_b, _ = _oserror_to_output(e)
+                out.write(stdout_b)
+                return returncode
 
             pty.close_w()
 
-            buf = b''
             while True:
                 try:
-                    bts = os.read(pty.r, 4096)
+                    bts = os.read(pty.r, 65536)
                 except OSError as e:  # pragma: darwin no cover
                     if e.errno == errno.EIO:
                         bts = b''
                     else:
                         raise
                 else:
-                    buf += bts
+                    out.write(bts)
                 if not bts:
                     break
 
-        return proc.wait(), buf, None
+        return proc.wait()
+
+    def cmd_output_p(
+            *cmd: str,
+            retcode: int | None = 0,
+            **kwargs: Any,
+    ) -> tuple[int, bytes, bytes | None]:
+        assert retcode is None
+        assert kwargs['stderr'] == subprocess.STDOUT, kwargs['stderr']
+        del kwargs['stderr']
+        kwargs.pop('stdout', None)
+        out = io.BytesIO()
+        returncode = cmd_output_stream_p(*cmd, out=out, **kwargs)
+        return returncode, out.getvalue(), None
+
+    class _Pipe(Pty):
+        """A plain pipe, with the interface of `Pty`."""
+
+        def __enter__(self) -> _Pipe:
+            self.r, self.w = os.pipe()
+            return self
+
+    async def _read_fd(fd: int, out: IO[bytes]) -> None:
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                try:
+                    bts = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError as e:  # pragma: darwin no cover
+                    if e.errno == errno.EIO:
+                        return
+                    else:
+                        raise
+                if not bts:
+                    return
+                out.write(bts)
+        finally:
+            loop.remove_reader(fd)
+
+    def _kill(proc: asyncio.subprocess.Process, group: bool) -> None:
+        with contextlib.suppress(ProcessLookupError):
+            if group:
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+
+    async def cmd_output_stream_async(
+            *cmd: str,
+            out: IO[bytes],
+            pty: bool = False,
+            timeout: float | None = None,
+            kill_group: bool = False,
+            **kwargs: Any,
+    ) -> int:
+        """As `cmd_output_stream_b` (or `cmd_output_stream_p` with `pty`)
+        without blocking the running event loop.
+
+        The command is killed when the task is cancelled or when it runs
+        longer than `timeout` seconds.  Hooks frequently run their tools
+        through a shell or a wrapper: with `kill_group` (implied by
+        `timeout`) the command is started in a new session so the processes
+        it started are killed as well.  The command then no longer has the
+        controlling terminal of before-commit.
+        """
+        kill_group = kill_group or timeout is not None
+        try:
+            cmd = parse_shebang.normalize_cmd(cmd)
+        except parse_shebang.ExecutableNotFoundError as e:
+            returncode, stdout_b, _ = e.to_output()
+            out.write(stdout_b)
+            return returncode
+
+        with Pty() if pty else _Pipe() as pipe:
+            assert pipe.r is not None
+            kwargs.setdefault('stdin', subprocess.DEVNULL)
+            kwargs.update({
+                'stdout': pipe.w,
+                'stderr': pipe.w,
+                'start_new_session': kill_group,
+            })
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, **_spawn_kwargs(kwargs),
+                )
+            except OSError as e:
+                returncode, stdout_b, _ = _oserror_to_output(e)
+                out.write(stdout_b)
+                return returncode
+
+            pipe.close_w()
+
+            async def _read_and_wait() -> int:
+                assert pipe.r is not None
+                await _read_fd(pipe.r, out)
+                return await proc.wait()
+
+            try:
+                return await asyncio.wait_for(_read_and_wait(), timeout)
+            except asyncio.TimeoutError:
+                _kill(proc, kill_group)
+                await proc.wait()
+                out.write(f'\n[timed out after {timeout}s]\n'.encode())
+                return TIMEOUT_RETURNCODE
+            except BaseException:
+                _kill(proc, kill_group)
+                await proc.wait()
+                raise
 else:  # pragma: no cover
     cmd_output_p = cmd_output_b
+    cmd_output_stream_p = cmd_output_stream_b
 
 
 def rmtree(path: str) -> None:
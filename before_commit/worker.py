@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import traceback
+from typing import Any
+from typing import Callable
+from typing import Generator
+from typing import Hashable
+from typing import Mapping
+from typing import Sequence
+
+from before_commit import jobserver
+from before_commit import parse_shebang
+from before_commit import trace
+from before_commit.util import force_bytes
+from before_commit.xargs import partition
+
+# as bazel starts its persistent workers
+WORKER_ARG = '--persistent_worker'
+# a worker which exits before answering every request is started again
+_RESTARTS = 2
+# a response holds the whole output of a request on a single line
+_LINE_LIMIT = 1 << 28
+
+
+class _WorkerError(Exception):
+    pass
+
+
+class _Process:
+    """A running worker.
+
+    Its pipes outlive the event loop of a `run`, which is given copies of
+    them, so a worker kept by `persistent` answers the requests of several
+    runs.
+    """
+
+    def __init__(self, cmd: tuple[str, ...], **kwargs: Any) -> None:
+        # set while `persistent` keeps the worker
+        self.key: Hashable | None = None
+        self.stderr = tempfile.TemporaryFile()
+        try:
+            self.proc = subprocess.Popen(
+                (*cmd, WORKER_ARG),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=self.stderr,
+                **kwargs,
+            )
+        except BaseException:
+            self.stderr.close()
+            raise
+
+    def close(self, kill: bool = False) -> bytes:
+        """Stop the worker, returning what it wrote to stderr.
+
+        Unless it is killed, the worker exits once its input is closed.
+        """
+        assert self.proc.stdin is not None and self.proc.stdout is not None
+        if kill:
+            with contextlib.suppress(ProcessLookupError):
+                self.proc.kill()
+        self.proc.stdin.close()
+        self.proc.wait()
+        self.proc.stdout.close()
+        with self.stderr:
+            self.stderr.seek(0)
+            return self.stderr.read()
+
+
+# the workers kept by `persistent`, with the pid of the process they belong to
+_workers: tuple[int, dict[Hashable, _Process]] | None = None
+
+
+@contextlib.contextmanager
+def persistent() -> Generator[None, None, None]:
+    """Keep the workers running until the end of the block.
+
+    A worker then answers the requests of every `run` of its command in the
+    same environment, so it is started once even when several hooks use it.
+    Processes forked in the block (to run hooks concurrently) start their
+    own workers.
+    """
+    global _workers
+
+    workers: dict[Hashable, _Process] = {}
+    _workers = (os.getpid(), workers)
+    try:
+        yield
+    finally:
+        _workers = None
+        for process in workers.values():
+            process.close()
+
+
+def _start(cmd: tuple[str, ...], **kwargs: Any) -> _Process:
+    if _workers is None or _workers[0] != os.getpid():
+        return _Process(cmd, **kwargs)
+
+    workers = _workers[1]
+    # languages set up the environment of their hooks in `os.environ`
+    key = (
+        cmd, os.getcwd(), tuple(sorted(os.environ.items())),
+        repr(sorted(kwargs.items())),
+    )
+    process = workers.get(key)
+    if process is not None and process.proc.poll() is not None:
+        process.close()
+        process = None
+    if process is None:
+        process = workers[key] = _Process(cmd, **kwargs)
+        process.key = key
+    return process
+
+
+def _stop(process: _Process, kill: bool) -> bytes:
+    """Stop a worker unless `persistent` keeps it, returning its stderr."""
+    if process.key is not None:
+        assert _workers is not None
+        if not kill:
+            return b''
+        del _workers[1][process.key]
+    return process.close(kill=kill)
+
+
+def _response(line: bytes) -> tuple[int, int, bytes]:
+    try:
+        response = json.loads(line)
+        return (
+            int(response['requestId']),
+            int(response.get('exitCode', 0)),
+            response.get('output', '').encode(errors='surrogateescape'),
+        )
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise _WorkerError(f'invalid response: {line!r}')
+
+
+async def _exchange(
+        process: _Process,
+        requests: Mapping[int, Sequence[str]],
+        responses: dict[int, tuple[int, bytes]],
+) -> None:
+    assert process.proc.stdin is not None and process.proc.stdout is not None
+    loop = asyncio.get_running_loop()
+    stdout = asyncio.StreamReader(limit=_LINE_LIMIT)
+    # closed before the worker is, rather than once the event loop gets to it
+    read_pipe = open(os.dup(process.proc.stdout.fileno()), 'rb', buffering=0)
+    write_pipe = open(os.dup(process.proc.stdin.fileno()), 'wb', buffering=0)
+    with read_pipe, write_pipe:
+        read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stdout), read_pipe,
+        )
+        try:
+            write_transport, _ = await loop.connect_write_pipe(
+                asyncio.Protocol, write_pipe,
+            )
+            try:
+                await _send_and_receive(
+                    process, stdout, write_transport, requests, responses,
+                )
+            finally:
+                # a worker which exited closed the transport, its exit is
+                # noticed by the reader
+                if not write_transport.is_closing():
+                    write_transport.abort()
+        finally:
+            read_transport.close()
+
+
+async def _send_and_receive(
+        process: _Process,
+        stdout: asyncio.StreamReader,
+        stdin: asyncio.WriteTransport,
+        requests: Mapping[int, Sequence[str]],
+        responses: dict[int, tuple[int, bytes]],
+) -> None:
+    loop = asyncio.get_running_loop()
+    answered: dict[int, asyncio.Future[None]] = {
+        request_id: loop.create_future() for request_id in requests
+    }
+
+    async def send(request_id: int, arguments: Sequence[str]) -> None:
+        # a request holds a job token until it is answered, as the worker
+        # may run every request it is sent at once
+        async with jobserver.async_token():
+            request = {'requestId': request_id, 'arguments': arguments}
+            stdin.write(f'{json.dumps(request)}\n'.encode())
+            await answered[request_id]
+
+    # requests are written while responses are read so neither of the pipes
+    # fills up
+    senders = [
+        asyncio.ensure_future(send(request_id, arguments))
+        for request_id, arguments in requests.items()
+    ]
+    try:
+        while not requests.keys() <= responses.keys():
+            try:
+                line = await stdout.readline()
+            except ValueError:  # longer than `_LINE_LIMIT`
+                raise _WorkerError('response too long')
+            if not line:
+                returncode = await loop.run_in_executor(
+                    None, process.proc.wait,
+                )
+                raise _WorkerError(f'exited with code {returncode}')
+            request_id, returncode, output = _response(line)
+            if request_id not in requests or request_id in responses:
+                raise _WorkerError(f'unknown request id {request_id}')
+            responses[request_id] = (returncode, output)
+            answered[request_id].set_result(None)
+    finally:
+        for sender in senders:
+            sender.cancel()
+        await asyncio.gather(*senders, return_exceptions=True)
+
+
+async def _run_requests(
+        cmd: tuple[str, ...],
+        requests: Mapping[int, Sequence[str]],
+        **kwargs: Any,
+) -> dict[int, tuple[int, bytes]]:
+    responses: dict[int, tuple[int, bytes]] = {}
+    failure = b''
+    for restarts in range(_RESTARTS + 1):
+        pending = {
+            request_id: arguments
+            for request_id, arguments in requests.items()
+            if request_id not in responses
+        }
+        process = _start(cmd, **kwargs)
+        with trace.span('worker', requests=len(pending), restarts=restarts):
+            try:
+                await _exchange(process, pending, responses)
+            except _WorkerError as e:
+                stderr = _stop(process, kill=True)
+                failure = f'[worker failed: {e}]\n'.encode() + stderr
+            except BaseException:
+                _stop(process, kill=True)
+                raise
+            else:
+                _stop(process, kill=False)
+        if len(responses) == len(requests):
+            break
+
+    for request_id in requests.keys() - responses.keys():
+        responses[request_id] = (1, failure)
+    return responses
+
+
+def run(
+        cmd: tuple[str, ...],
+        varargs: Sequence[str],
+        *,
+        args: Sequence[str] = (),
+        color: bool = False,
+        target_concurrency: int = 1,
+        partition_strategy: str = 'count',
+        **kwargs: Any,
+) -> tuple[int, bytes]:
+    """Run `cmd` as a persistent worker, as bazel does with JSON workers.
+
+    The worker is started with `WORKER_ARG` (once per run, or once for the
+    block of `persistent`) and receives `args` followed by the arguments in
+    batches (as `xargs` would pass them).  Requests and responses are JSON
+    objects, one per line, on the standard input and output of the worker:
+
+        {"requestId": 1, "arguments": ["a.py", "b.py"]}
+        {"requestId": 1, "exitCode": 0, "output": "..."}
+
+    A request is sent once a job token is held for it (see `jobserver`),
+    without waiting for the other responses, which may come in any order.  A
+    worker which exits is started again and sent the requests it did not
+    answer.  The worker exits once its input is closed.
+
+    color: Ignored, the output of workers is not written to a terminal
+    """
+    try:
+        cmd = parse_shebang.normalize_cmd(cmd)
+    except parse_shebang.ExecutableNotFoundError as e:
+        returncode, out, _ = e.to_output()
+        return returncode, out
+
+    batches = partition(
+        (), varargs, target_concurrency, strategy=partition_strategy,
+    )
+    requests = {
+        request_id: (*args, *batch)
+        for request_id, batch in enumerate(batches, 1)
+    }
+    try:
+        responses = asyncio.run(_run_requests(cmd, requests, **kwargs))
+    except OSError as e:  # the worker could not be started
+        return 1, force_bytes(e).rstrip(b'\n') + b'\n'
+
+    retcode = max(returncode for returncode, _ in responses.values())
+    out = b''.join(responses[request_id][1] for request_id in requests)
+    return retcode, out
+
+
+def serve(handle: Callable[[list[str]], int]) -> int:
+    """Answer the requests sent by `run` until the input is closed.
+
+    `handle` checks the arguments of a request and returns its exit code.
+    What it writes to stdout and stderr is the output of the request.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    try:
+        with os.fdopen(os.dup(1), 'wb') as responses, \
+                tempfile.TemporaryFile() as out:
+            os.dup2(out.fileno(), 1)
+            os.dup2(out.fileno(), 2)
+            for line in sys.stdin.buffer:
+                request = json.loads(line)
+                out.seek(0)
+                out.truncate()
+                try:
+                    returncode = handle(request['arguments'])
+                except SystemExit as e:
+                    returncode = e.code if isinstance(e.code, int) else 1
+                except Exception:
+                    traceback.print_exc()
+                    returncode = 1
+                sys.stdout.flush()
+                sys.stderr.flush()
+                out.seek(0)
+                response = {
+                    'requestId': request['requestId'],
+                    'exitCode': returncode,
+                    'output': out.read().decode(errors='surrogateescape'),
+                }
+                responses.write(f'{json.dumps(response)}\n'.encode())
+                responses.flush()
+    finally:
+        os.dup2(saved_stdout, 1)
+        os.dup2(saved_stderr, 2)
+        os.close(saved_stdout)
+        os.close(saved_stderr)
+    return 0
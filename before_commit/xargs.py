@@ -1,26 +1,42 @@
 from __future__ import annotations
 
+import asyncio
 import concurrent.futures
 import contextlib
+import heapq
 import math
 import os
-import subprocess
+import shutil
 import sys
+import tempfile
 from typing import Any
 from typing import Callable
+from typing import ContextManager
 from typing import Generator
+from typing import IO
 from typing import Iterable
 from typing import MutableMapping
 from typing import Sequence
 from typing import TypeVar
 
+from before_commit import jobserver
 from before_commit import parse_shebang
-from before_commit.util import cmd_output_b
-from before_commit.util import cmd_output_p
+from before_commit import trace
+from before_commit.util import cmd_output_stream_b
+from before_commit.util import cmd_output_stream_p
+
+if sys.platform != 'win32':  # pragma: win32 no cover
+    from before_commit.util import cmd_output_stream_async
 
 TArg = TypeVar('TArg')
 TRet = TypeVar('TRet')
 
+# output of a partition held in memory before it is written to disk
+_SPOOL_SIZE = 2 ** 20
+# output of a command held in memory, the rest is written to a file (see
+# `SpilledOutput`)
+_MAX_OUTPUT = 2 ** 23
+
 
 def _environ_size(_env: MutableMapping[str, str] | None = None) -> int:
     environ = _env if _env is not None else getattr(os, 'environb', os.environ)
@@ -53,55 +69,232 @@ def _command_length(*cmd: str) -> int:
     if sys.platform == 'win32':
         return len(full_cmd.encode('utf-16le')) // 2
     else:
-        return len(full_cmd.encode(sys.getfilesystemencoding()))
+        # as `os.fsencode`, undecodable filenames are surrogate escaped
+        encoding = sys.getfilesystemencoding()
+        return len(full_cmd.encode(encoding, 'surrogateescape'))
 
 
 class ArgumentTooLongError(RuntimeError):
     pass
 
 
+def _batch_size(remaining: int, target_concurrency: int) -> int:
+    # partitions shrink as the arguments run out ("guided self-scheduling"):
+    # the partitions are picked up in order by whichever worker is free so a
+    # slow partition near the end holds up less of the work.  we don't want a
+    # bunch of tiny partitions though.
+    return max(4, math.ceil(remaining / target_concurrency))
+
+
+def _file_cost(filename: str) -> int:
+    # every file costs something to process, even an empty one
+    try:
+        return os.stat(filename).st_size + 1
+    except OSError:
+        return 1
+
+
+def _balanced(
+        groups: Sequence[Sequence[str]],
+        costs: Sequence[int],
+        target_concurrency: int,
+) -> list[list[str]]:
+    """Distribute `groups` of arguments between at most `target_concurrency`
+    bins of about equal cost (longest-processing-time-first).
+
+    The arguments of a bin keep their original order.
+    """
+    n_args = sum(len(group) for group in groups)
+    n_bins = min(target_concurrency, len(groups), math.ceil(n_args / 4))
+    if n_bins <= 1:
+        return [[arg for group in groups for arg in group]]
+
+    bins: list[list[int]] = [[] for _ in range(n_bins)]
+    heap = [(0, i) for i in range(n_bins)]
+    by_cost = sorted(range(len(groups)), key=lambda i: -costs[i])
+    for group_i in by_cost:
+        cost, bin_i = heapq.heappop(heap)
+        bins[bin_i].append(group_i)
+        heapq.heappush(heap, (cost + costs[group_i], bin_i))
+
+    return [
+        [arg for group_i in sorted(group_is) for arg in groups[group_i]]
+        for group_is in bins
+        if group_is
+    ]
+
+
+def _by_count(
+        varargs: Sequence[str],
+        target_concurrency: int,
+) -> list[list[str]]:
+    ret = []
+    varargs = list(varargs)
+    while varargs:
+        n = _batch_size(len(varargs), target_concurrency)
+        ret.append(varargs[:n])
+        del varargs[:n]
+    return ret
+
+
+def _by_size(
+        varargs: Sequence[str],
+        target_concurrency: int,
+) -> list[list[str]]:
+    groups = [(arg,) for arg in varargs]
+    costs = [_file_cost(arg) for arg in varargs]
+    return _balanced(groups, costs, target_concurrency)
+
+
+def _by_directory(
+        varargs: Sequence[str],
+        target_concurrency: int,
+) -> list[list[str]]:
+    directories: dict[str, list[str]] = {}
+    for arg in varargs:
+        directories.setdefault(os.path.dirname(arg), []).append(arg)
+
+    # a directory larger than a partition is split (in order) so a flat
+    # repository or a directory holding most of the files is still spread
+    # out
+    file_costs = {arg: _file_cost(arg) for arg in varargs}
+    target = sum(file_costs.values()) / target_concurrency
+    groups: list[list[str]] = []
+    costs: list[int] = []
+    for directory in directories.values():
+        group: list[str] = []
+        cost = 0
+        for arg in directory:
+            if group and cost + file_costs[arg] > target:
+                groups.append(group)
+                costs.append(cost)
+                group, cost = [], 0
+            group.append(arg)
+            cost += file_costs[arg]
+        groups.append(group)
+        costs.append(cost)
+    return _balanced(groups, costs, target_concurrency)
+
+
+# how the arguments are grouped before the groups are split to fit in a
+# command line:
+# - count: groups of decreasing size, in order
+# - size: groups of about equal total file size
+# - directory: as `size`, keeping the files of a directory together unless
+#   they cost more than a partition's share
+PARTITION_STRATEGIES: dict[
+    str, Callable[[Sequence[str], int], list[list[str]]],
+] = {
+    'count': _by_count,
+    'size': _by_size,
+    'directory': _by_directory,
+}
+
+
 def partition(
         cmd: Sequence[str],
         varargs: Sequence[str],
         target_concurrency: int,
         _max_length: int | None = None,
+        *,
+        strategy: str = 'count',
+        min_partition_cost: float = 0.,
 ) -> tuple[tuple[str, ...], ...]:
     _max_length = _max_length or _get_platform_max_length()
 
-    # Generally, we try to partition evenly into at least `target_concurrency`
-    # partitions, but we don't want a bunch of tiny partitions.
-    max_args = max(4, math.ceil(len(varargs) / target_concurrency))
-
     cmd = tuple(cmd)
+    if not varargs:
+        return (cmd,)
+
+    if min_partition_cost:
+        # don't start processes which take longer to start than to run
+        cost = sum(_file_cost(arg) for arg in varargs)
+        target_concurrency = max(
+            1, min(target_concurrency, int(cost / min_partition_cost)),
+        )
+
     ret = []
+    cmd_length = _command_length(*cmd) + 1
+    groups = PARTITION_STRATEGIES[strategy](varargs, target_concurrency)
+    for group in groups:
+        ret_cmd: list[str] = []
+        total_length = cmd_length
+        for arg in group:
+            arg_length = _command_length(arg) + 1
+            if total_length + arg_length <= _max_length:
+                ret_cmd.append(arg)
+                total_length += arg_length
+            elif not ret_cmd:
+                raise ArgumentTooLongError(arg)
+            else:
+                # We've exceeded the length, yield a command
+                ret.append(cmd + tuple(ret_cmd))
+                if cmd_length + arg_length > _max_length:
+                    raise ArgumentTooLongError(arg)
+                ret_cmd = [arg]
+                total_length = cmd_length + arg_length
+        ret.append(cmd + tuple(ret_cmd))
+
+    return tuple(ret)
 
-    ret_cmd: list[str] = []
-    # Reversed so arguments are in order
-    varargs = list(reversed(varargs))
 
-    total_length = _command_length(*cmd) + 1
-    while varargs:
-        arg = varargs.pop()
-
-        arg_length = _command_length(arg) + 1
-        if (
-                total_length + arg_length <= _max_length and
-                len(ret_cmd) < max_args
-        ):
-            ret_cmd.append(arg)
-            total_length += arg_length
-        elif not ret_cmd:
-            raise ArgumentTooLongError(arg)
+class SpilledOutput(bytes):
+    """The output held in memory of a command whose output did not fit.  The
+    rest of the output is in the file `filename` (see `spilled`).
+    """
+    filename: str
+
+
+class _BoundedOutput:
+    """Output which keeps at most `max_size` bytes in memory.
+
+    The rest of the output is written to a file.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._chunks: list[bytes] = []
+        self._size = 0
+        self._spill: IO[bytes] | None = None
+
+    def write(self, bts: bytes) -> None:
+        kept = bts[:max(self._max_size - self._size, 0)]
+        if kept:
+            self._chunks.append(kept)
+            self._size += len(kept)
+        if len(kept) < len(bts):
+            if self._spill is None:
+                self._spill = tempfile.NamedTemporaryFile(
+                    prefix='before-commit-', suffix='.log', delete=False,
+                )
+            self._spill.write(bts[len(kept):])
+
+    def getvalue(self) -> bytes:
+        if self._spill is None:
+            return b''.join(self._chunks)
         else:
-            # We've exceeded the length, yield a command
-            ret.append(cmd + tuple(ret_cmd))
-            ret_cmd = []
-            total_length = _command_length(*cmd) + 1
-            varargs.append(arg)
+            self._spill.close()
+            ret = SpilledOutput(b''.join(self._chunks))
+            ret.filename = self._spill.name
+            return ret
 
-    ret.append(cmd + tuple(ret_cmd))
 
-    return tuple(ret)
+@contextlib.contextmanager
+def spilled(out: bytes) -> Generator[
+    tuple[bytes, IO[bytes] | None], None, None,
+]:
+    """Split the output of `xargs` from the file holding the rest of it, if
+    any.  The file is deleted at the end of the block.
+    """
+    if not isinstance(out, SpilledOutput):
+        yield out, None
+        return
+
+    try:
+        with open(out.filename, 'rb') as f:
+            yield bytes(out), f
+    finally:
+        os.remove(out.filename)
 
 
 @contextlib.contextmanager
@@ -122,17 +315,33 @@ def xargs(
         *,
         color: bool = False,
         target_concurrency: int = 1,
+        partition_strategy: str = 'count',
+        min_partition_cost: float = 0.,
+        cost_key: str | None = None,
+        timeout: float | None = None,
+        fail_fast: bool = False,
         _max_length: int = _get_platform_max_length(),
+        _max_output: int | None = None,
         **kwargs: Any,
 ) -> tuple[int, bytes]:
     """A simplified implementation of xargs.
 
     color: Make a pty if on a platform that supports it
     target_concurrency: Target number of partitions to run concurrently
+    partition_strategy: How arguments are grouped into partitions, one of
+        `PARTITION_STRATEGIES`
+    min_partition_cost: Cost of the files (see `_file_cost`) worth starting
+        a process for
+    cost_key: Record the cost of the files of each partition with this key in
+        its trace span (see `costs.observe`)
+    timeout: Kill the partitions running for longer than this many seconds
+        (not on windows)
+    fail_fast: Cancel the other partitions once a partition fails (not on
+        windows)
     """
-    cmd_fn = cmd_output_p if color else cmd_output_b
+    cmd_fn = cmd_output_stream_p if color else cmd_output_stream_b
     retcode = 0
-    stdout = b''
+    stdout = _BoundedOutput(_max_output or _MAX_OUTPUT)
 
     try:
         cmd = parse_shebang.normalize_cmd(cmd)
@@ -152,21 +361,105 @@ def xargs(
         # expansion inside the batch file
         _max_length = 8192 - cmd_exe_len - len(' /c ') - 1024
 
-    partitions = partition(cmd, varargs, target_concurrency, _max_length)
+    partitions = partition(
+        cmd, varargs, target_concurrency, _max_length,
+        strategy=partition_strategy,
+        min_partition_cost=min_partition_cost,
+    )
 
-    def run_cmd_partition(
+    def partition_span(
             run_cmd: tuple[str, ...],
-    ) -> tuple[int, bytes, bytes | None]:
-        return cmd_fn(
-            *run_cmd, retcode=None, stderr=subprocess.STDOUT, **kwargs,
+    ) -> ContextManager[dict[str, Any]]:
+        cost_args: dict[str, Any] = {}
+        if cost_key is not None:
+            cost = sum(_file_cost(arg) for arg in run_cmd[len(cmd):])
+            cost_args = {'key': cost_key, 'cost': cost}
+        return trace.span(
+            'partition',
+            args=len(run_cmd) - len(cmd),
+            length=_command_length(*run_cmd),
+            **cost_args,
         )
 
-    threads = min(len(partitions), target_concurrency)
-    with _thread_mapper(threads) as thread_map:
-        results = thread_map(run_cmd_partition, partitions)
-
-        for proc_retcode, proc_out, _ in results:
-            retcode = max(retcode, proc_retcode)
-            stdout += proc_out
-
-    return retcode, stdout
+    # partitions run concurrently so their output is kept apart until they
+    # are combined in order.  the spans do not include the wait for a job
+    # token.
+
+    def run_cmd_partition(run_cmd: tuple[str, ...]) -> tuple[int, IO[bytes]]:
+        out = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        try:
+            with partition_span(run_cmd) as span_args:
+                returncode = cmd_fn(*run_cmd, out=out, **kwargs)
+                span_args['returncode'] = returncode
+        except BaseException:
+            out.close()
+            raise
+        return returncode, out
+
+    async def run_cmd_partition_async(
+            run_cmd: tuple[str, ...],
+            limit: asyncio.Semaphore,
+    ) -> tuple[int, IO[bytes]]:
+        out = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        try:
+            async with limit, jobserver.async_token():
+                with partition_span(run_cmd) as span_args:
+                    try:
+                        returncode = await cmd_output_stream_async(
+                            *run_cmd, out=out, pty=color, timeout=timeout,
+                            kill_group=fail_fast, **kwargs,
+                        )
+                    except asyncio.CancelledError:
+                        span_args['cancelled'] = True
+                        raise
+                    span_args['returncode'] = returncode
+        except BaseException:
+            out.close()
+            raise
+        return returncode, out
+
+    async def run_partitions_async() -> list[tuple[int, IO[bytes]] | None]:
+        limit = asyncio.Semaphore(target_concurrency)
+        tasks = [
+            asyncio.ensure_future(run_cmd_partition_async(run_cmd, limit))
+            for run_cmd in partitions
+        ]
+
+        def cancel_others(task: asyncio.Task[tuple[int, IO[bytes]]]) -> None:
+            if task.cancelled():
+                return
+            elif task.exception() is not None or (
+                    fail_fast and task.result()[0]
+            ):
+                # cancelling a running partition kills its processes
+                for other in tasks:
+                    other.cancel()
+
+        for task in tasks:
+            task.add_done_callback(cancel_others)
+        await asyncio.wait(tasks)
+        return [None if task.cancelled() else task.result() for task in tasks]
+
+    results: list[tuple[int, IO[bytes]] | None]
+    if sys.platform == 'win32':  # pragma: win32 cover
+        threads = min(len(partitions), target_concurrency)
+        with _thread_mapper(threads) as thread_map:
+            results = list(thread_map(run_cmd_partition, partitions))
+    else:  # pragma: win32 no cover
+        # the processes of every partition are driven by a single thread
+        results = asyncio.run(run_partitions_async())
+
+    for i, (run_cmd, result) in enumerate(zip(partitions, results), 1):
+        if result is None:
+            stdout.write(
+                f'[partition {i} of {len(partitions)} cancelled: '
+                f'{len(run_cmd) - len(cmd)} files not checked]\n'.encode(),
+            )
+            continue
+        proc_retcode, proc_out = result
+        retcode = max(retcode, proc_retcode)
+        with proc_out:
+            proc_out.seek(0)
+            shutil.copyfileobj(proc_out, stdout)
+
+    return retcode, stdout.getvalue()
@@ -9,8 +9,11 @@ from before_commit import git
 from before_commit.clientlib import CONFIG_SCHEMA
 from before_commit.clientlib import detect_manifest_file
 from before_commit.clientlib import load_manifest
+from before_commit.clientlib import MANIFEST_HOOK_DICT
 from before_commit.config import apply_defaults
 from before_commit.config import validate
+from before_commit.hook import Hook
+from before_commit.prefix import Prefix
 from before_commit.util import cmd_output
 from before_commit.util import yaml_dump
 from before_commit.util import yaml_load
@@ -92,6 +95,17 @@ def sample_local_config():
     }
 
 
+def make_hook(**kwargs):
+    """A hook of a local repository, with the defaults of the manifest."""
+    dct = {
+        'id': 'hook', 'name': 'hook', 'entry': 'hook', 'language': 'system',
+        **kwargs,
+    }
+    validate(dct, MANIFEST_HOOK_DICT)
+    dct = apply_defaults(dct, MANIFEST_HOOK_DICT)
+    return Hook.create('local', Prefix('.'), dct)
+
+
 def sample_meta_config():
     return {'repo': 'meta', 'hooks': [{'id': 'check-useless-excludes'}]}
 
@@ -80,6 +80,8 @@ def run_opts(
         checkout_type='',
         is_squash_merge='',
         rewrite_command='',
+        jobs=None,
+        trace_file=None,
 ):
     # These are mutually exclusive
     assert not (all_files and files)
@@ -102,6 +104,8 @@ def run_opts(
         checkout_type=checkout_type,
         is_squash_merge=is_squash_merge,
         rewrite_command=rewrite_command,
+        jobs=jobs,
+        trace_file=trace_file,
     )
 
 
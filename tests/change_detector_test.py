@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+
+from before_commit.change_detector import ChangeDetector
+from before_commit.util import cmd_output
+
+
+def _setup(in_git_dir):
+    in_git_dir.join('f').write('hello\n')
+    in_git_dir.join('g').write('hello\n')
+    cmd_output('git', 'add', 'f', 'g')
+
+
+def test_unchanged(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f', 'g'])
+    assert detector.modified(snapshot) is False
+
+
+def test_modified(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f', 'g'])
+    in_git_dir.join('g').write('world\n')
+    assert detector.modified(snapshot) is True
+    # the new content is now the baseline
+    assert detector.modified(detector.snapshot(['f', 'g'])) is False
+
+
+def test_rewritten_with_identical_contents(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f'])
+    in_git_dir.join('f').write('hello\n')
+    os.utime('f', ns=(1, 1))
+    assert detector.modified(snapshot) is False
+
+
+def test_unstaged_file_modified(in_git_dir):
+    _setup(in_git_dir)
+    in_git_dir.join('f').write('unstaged\n')
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f'])
+    in_git_dir.join('f').write('hello\n')
+    assert detector.modified(snapshot) is True
+
+
+def test_other_file_modified_after_modification(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f'])
+    in_git_dir.join('f').write('world\n')
+    in_git_dir.join('g').write('world\n')
+    assert detector.modified(snapshot) is True
+    # `g` is no longer clean: restoring it is a modification
+    snapshot = detector.snapshot(['g'])
+    in_git_dir.join('g').write('hello\n')
+    assert detector.modified(snapshot) is True
+
+
+def test_deleted(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f'])
+    os.remove('f')
+    assert detector.modified(snapshot) is True
+
+
+def test_untracked_files_are_ignored(in_git_dir):
+    _setup(in_git_dir)
+    in_git_dir.join('untracked').write('hello\n')
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['untracked'])
+    in_git_dir.join('untracked').write('world\n')
+    assert detector.modified(snapshot) is False
+
+
+def test_replaced_by_directory(in_git_dir):
+    _setup(in_git_dir)
+    detector = ChangeDetector()
+    snapshot = detector.snapshot(['f'])
+    os.remove('f')
+    in_git_dir.join('f').ensure_dir()
+    assert detector.modified(snapshot) is True
+    assert detector.modified(detector.snapshot(['f'])) is False
@@ -387,6 +387,76 @@ def test_mains_not_ok(tmpdir, fn):
             }],
             True,
         ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'partition_strategy': 'directory',
+            }],
+            True,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'partition_strategy': 'wat',
+            }],
+            False,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'timeout': 1.5,
+            }],
+            True,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'timeout': -1,
+            }],
+            False,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'timeout': '10',
+            }],
+            False,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'pass_filenames': 'stdin0',
+            }],
+            True,
+        ),
+        (
+            [{
+                'id': 'a',
+                'name': 'b',
+                'entry': 'c',
+                'language': 'python',
+                'pass_filenames': 'stdin',
+            }],
+            False,
+        ),
     ),
 )
 def test_valid_manifests(manifest_obj, expected):
@@ -507,3 +577,41 @@ def test_warn_additional(schema):
         x for x in schema.items if isinstance(x, WarnAdditionalKeys)
     )
     assert allowed_keys == set(warn_additional.keys)
+
+
+@pytest.mark.parametrize(
+    'config_obj',
+    (
+        {'repos': [{'repo': 'local', 'hooks': [{'id': 'a'}]}]},
+        {'repos': [{'repo': 'meta', 'hooks': [{'id': 'wat'}]}]},
+        {
+            'repos': [{
+                'repo': 'meta', 'hooks': [{'id': 'identity', 'entry': 'a'}],
+            }],
+        },
+        {'repos': [{'repo': 'a', 'rev': 'v1', 'hooks': [{'id': 5}]}]},
+        {'repos': [{'repo': 'a', 'rev': 'v1', 'hooks': 'a'}]},
+        {'repos': [{'repo': 'a', 'sha': 'b', 'rev': 'c', 'hooks': []}]},
+        {'repos': [], 'default_language_version': {'wat': 'a'}},
+        {'repos': [], 'default_stages': ['commit', 'wat']},
+    ),
+)
+def test_config_errors_match_schema_check(config_obj):
+    with pytest.raises(ValidationError) as compiled:
+        validate(config_obj, CONFIG_SCHEMA)
+    with pytest.raises(ValidationError) as uncompiled:
+        CONFIG_SCHEMA.check(config_obj)
+    assert str(compiled.value) == str(uncompiled.value)
+
+
+def test_config_defaults_match_schema_apply_defaults():
+    config_obj = {
+        'repos': [
+            sample_local_config(),
+            {'repo': 'a', 'sha': 'v1', 'hooks': [{'id': 'b'}]},
+            {'repo': 'meta', 'hooks': [{'id': 'check-hooks-apply'}]},
+        ],
+        'default_language_version': {'python': 'python3'},
+    }
+    expected = CONFIG_SCHEMA.apply_defaults(config_obj)
+    assert apply_defaults(config_obj, CONFIG_SCHEMA) == expected
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
 import os.path
+import re
 import shlex
 import shutil
 import sys
+import tempfile
 import time
 from typing import MutableMapping
 from unittest import mock
@@ -14,15 +17,22 @@ import pytest
 import before_commit.constants as C
 from before_commit import color
 from before_commit import main
+from before_commit import xargs
 from before_commit.commands.install_uninstall import install
 from before_commit.commands.run import _compute_cols
+from before_commit.commands.run import _fail_fast_order
 from before_commit.commands.run import _full_msg
 from before_commit.commands.run import _get_skips
 from before_commit.commands.run import _has_unmerged_paths
+from before_commit.commands.run import _literal_prefixes
+from before_commit.commands.run import _PathTable
+from before_commit.commands.run import _schedule
 from before_commit.commands.run import _start_msg
 from before_commit.commands.run import Classifier
 from before_commit.commands.run import filter_by_include_exclude
 from before_commit.commands.run import run
+from before_commit.costs import HookCosts
+from before_commit.languages import pygrep
 from before_commit.util import cmd_output
 from before_commit.util import make_executable
 from testing.auto_namedtuple import auto_namedtuple
@@ -30,6 +40,7 @@ from testing.fixtures import add_config_to_repo
 from testing.fixtures import git_dir
 from testing.fixtures import make_config_from_repo
 from testing.fixtures import make_consuming_repo
+from testing.fixtures import make_hook
 from testing.fixtures import make_repo
 from testing.fixtures import modify_config
 from testing.fixtures import read_config
@@ -486,6 +497,25 @@ def test_hook_verbose_enabled(cap_out, store, repo_with_passing_hook):
     )
 
 
+def test_spilled_output_is_printed(
+        cap_out, store, repo_with_passing_hook, tmpdir, monkeypatch,
+):
+    monkeypatch.setattr(xargs, '_MAX_OUTPUT', 8)
+    spill_dir = tmpdir.join('spill').ensure_dir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(spill_dir))
+    with modify_config() as config:
+        config['repos'][0]['hooks'][0]['always_run'] = True
+        config['repos'][0]['hooks'][0]['verbose'] = True
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(),
+    )
+    assert ret == 0
+    assert b'\nHello World\n' in printed
+    # the file is deleted once the output was printed
+    assert spill_dir.listdir() == []
+
+
 @pytest.mark.parametrize(
     ('from_ref', 'to_ref'), (('master', ''), ('', 'master')),
 )
@@ -650,6 +680,31 @@ def test_skip_bypasses_installation(cap_out, store, repo_with_passing_hook):
     assert ret == 0
 
 
+def test_no_files_bypasses_installation(
+        cap_out, store, repo_with_passing_hook,
+):
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'nofiles',
+                'name': 'nofiles',
+                'entry': 'nofiles',
+                'language': 'python',
+                'files': r'\.does-not-exist$',
+                'additional_dependencies': ['/pre-commit-does-not-exist'],
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(all_files=True),
+    )
+    assert ret == 0
+    assert b'(no files to check)' in printed
+
+
 def test_hook_id_not_in_non_verbose_output(
         cap_out, store, repo_with_passing_hook,
 ):
@@ -993,6 +1048,67 @@ def test_pass_filenames(
     assert (b'foo.py' in printed) == pass_filenames
 
 
+def test_pass_filenames_argfile(cap_out, store, repo_with_passing_hook):
+    config = {
+        'repo': 'local',
+        'hooks': [{
+            'id': 'argfile',
+            'name': 'argfile',
+            'entry': 'sh -c \'cat "${0#@}"\'',
+            'language': 'system',
+            'pass_filenames': 'argfile',
+            'verbose': True,
+        }],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file('a.txt')
+    stage_a_file('b.txt')
+
+    ret, printed = _do_run(cap_out, store, repo_with_passing_hook, run_opts())
+    assert ret == 0
+    assert b'a.txt\nb.txt\n' in printed
+
+
+def test_pygrep_hooks_scan_files_once(
+        cap_out, store, repo_with_passing_hook, concurrency_enabled,
+        monkeypatch,
+):
+    monkeypatch.setenv('BEFORE_COMMIT_CONCURRENCY', '2')
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': f'grep-{pattern}',
+                'name': f'grep {pattern}',
+                'entry': pattern,
+                'language': 'pygrep',
+                'files': r'\.txt$',
+            }
+            for pattern in ('foo', 'bar')
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    with open('a.txt', 'w') as f:
+        f.write('foo\nbar\n')
+    cmd_output('git', 'add', 'a.txt')
+
+    # the hooks (in their processes) do not read the file again
+    with mock.patch.object(
+            pygrep, '_contents', wraps=pygrep._contents,
+    ) as contents_mck, mock.patch.object(
+            pygrep, '_process_file', side_effect=AssertionError,
+    ):
+        ret, printed = _do_run(
+            cap_out, store, repo_with_passing_hook, run_opts(),
+        )
+    assert ret == 1
+    assert contents_mck.call_count == 1
+    foo_start = printed.index(b'grep foo')
+    bar_start = printed.index(b'grep bar')
+    assert b'a.txt:1:foo\n' in printed[foo_start:bar_start]
+    assert b'a.txt:2:bar\n' in printed[bar_start:]
+
+
 def test_fail_fast_config(cap_out, store, repo_with_failing_hook):
     with modify_config() as config:
         # More than one hook
@@ -1028,6 +1144,413 @@ def test_fail_fast_args(cap_out, store, repo_with_failing_hook):
     assert printed.count(b'Failing hook') == 1
 
 
+def test_schedule_read_only_hooks_share_a_batch():
+    hooks = [make_hook(read_only=True), make_hook(read_only=True)]
+    ret = _schedule(hooks, [('a',), ('a',)], set(), fail_fast=False)
+    assert ret == [[0, 1]]
+
+
+def test_schedule_pygrep_hooks_are_read_only():
+    hooks = [make_hook(language='pygrep'), make_hook(language='pygrep')]
+    ret = _schedule(hooks, [('a',), ('a',)], set(), fail_fast=False)
+    assert ret == [[0, 1]]
+
+
+def test_schedule_disjoint_hooks_share_a_batch():
+    hooks = [make_hook(), make_hook(), make_hook()]
+    hook_filenames = [('a',), ('b',), ('b', 'c')]
+    ret = _schedule(hooks, hook_filenames, set(), fail_fast=False)
+    assert ret == [[0, 1], [2]]
+
+
+def test_schedule_unknown_files_run_alone():
+    hooks = [make_hook(), make_hook(pass_filenames=False), make_hook()]
+    ret = _schedule(hooks, [('a',), ('b',), ('c',)], set(), fail_fast=False)
+    assert ret == [[0], [1], [2]]
+
+
+def test_schedule_not_executed_hooks_join_any_batch():
+    hooks = [make_hook(), make_hook(id='skipped'), make_hook()]
+    ret = _schedule(hooks, [('a',), ('a',), ()], {'skipped'}, fail_fast=False)
+    assert ret == [[0, 1, 2]]
+
+
+def test_schedule_fail_fast_only_followed_by_read_only():
+    hooks = [make_hook(), make_hook(read_only=True), make_hook()]
+    ret = _schedule(hooks, [('a',), ('b',), ('c',)], set(), fail_fast=True)
+    assert ret == [[0, 1], [2]]
+
+
+@pytest.fixture
+def concurrency_enabled(monkeypatch):
+    monkeypatch.delenv('PRE_COMMIT_NO_CONCURRENCY')
+
+
+def test_concurrent_hooks_report_in_config_order(
+        cap_out, store, repo_with_passing_hook, concurrency_enabled,
+):
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': f'lint-{i}',
+                'name': f'lint {i}',
+                'entry': f'sh -c "sleep 0.{3 - i} && echo $@" --',
+                'language': 'system',
+                'read_only': True,
+                'verbose': True,
+            }
+            for i in range(3)
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file()
+
+    ret, printed = _do_run(cap_out, store, repo_with_passing_hook, run_opts())
+    assert ret == 0
+    assert printed.index(b'lint 0') < printed.index(b'lint 1')
+    assert printed.index(b'lint 1') < printed.index(b'lint 2')
+    assert printed.count(b'foo.py') == 3
+
+
+def test_concurrent_hooks_attribute_modifications(
+        cap_out, store, repo_with_passing_hook, concurrency_enabled,
+):
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'modifies-a',
+                'name': 'modifies a',
+                'entry': 'sh -c "echo changed >> $0"',
+                'language': 'system',
+                'files': r'^a\.txt$',
+            },
+            {
+                'id': 'leaves-b',
+                'name': 'leaves b',
+                'entry': 'true',
+                'language': 'system',
+                'files': r'^b\.txt$',
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file('a.txt')
+    stage_a_file('b.txt')
+
+    ret, printed = _do_run(cap_out, store, repo_with_passing_hook, run_opts())
+    assert ret == 1
+    assert b'modifies a' in printed
+    assert printed.count(b'- files were modified by this hook') == 1
+    assert printed.index(b'- files were modified by this hook') < \
+        printed.index(b'leaves b')
+
+
+def test_fail_fast_cancels_later_concurrent_hooks(
+        cap_out, store, repo_with_passing_hook, concurrency_enabled,
+        monkeypatch,
+):
+    monkeypatch.setenv('BEFORE_COMMIT_CONCURRENCY', '2')
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'failing',
+                'name': 'failing hook',
+                'entry': 'sh -c "sleep .5; exit 1"',
+                'language': 'system',
+                'read_only': True,
+                'pass_filenames': False,
+                'always_run': True,
+            },
+            {
+                'id': 'slow',
+                'name': 'slow hook',
+                'entry': 'sh -c "sleep 10"',
+                'language': 'system',
+                'read_only': True,
+                'files': r'\.txt$',
+                'cacheable': True,
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file('a.txt')
+
+    for _ in range(2):
+        start = time.time()
+        ret, printed = _do_run(
+            cap_out, store, repo_with_passing_hook, run_opts(fail_fast=True),
+        )
+        assert time.time() - start < 5
+        assert ret == 1
+        assert b'failing hook' in printed
+        assert b'- exit code: 1' in printed
+        # a cancelled hook did not pass its files, it runs again
+        assert b'slow hook' not in printed
+
+
+def test_fail_fast_lets_earlier_concurrent_hooks_finish(
+        cap_out, store, repo_with_passing_hook, concurrency_enabled,
+        monkeypatch,
+):
+    monkeypatch.setenv('BEFORE_COMMIT_CONCURRENCY', '2')
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'earlier',
+                'name': 'earlier hook',
+                'entry': 'sh -c "sleep 1; exit 1" --',
+                'language': 'system',
+                'files': r'^a',
+                'cacheable': True,
+            },
+            {
+                'id': 'failing',
+                'name': 'failing hook',
+                'entry': 'sh -c "exit 1" --',
+                'language': 'system',
+                'read_only': True,
+                'fail_fast': True,
+                'files': r'^b',
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file('a.txt')
+    stage_a_file('b.txt')
+
+    for _ in range(2):
+        ret, printed = _do_run(
+            cap_out, store, repo_with_passing_hook, run_opts(),
+        )
+        assert ret == 1
+        assert printed.count(b'Failed') == 2
+        assert b'(cached)' not in printed
+
+
+def test_rewriting_identical_contents_is_not_a_modification(
+        cap_out, store, repo_with_passing_hook,
+):
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'rewrite',
+                'name': 'rewrite',
+                'entry': 'sh -c \'cp "$0" tmp && mv tmp "$0"\'',
+                'language': 'system',
+                'files': r'^a\.txt$',
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    stage_a_file('a.txt')
+
+    ret, printed = _do_run(cap_out, store, repo_with_passing_hook, run_opts())
+    assert ret == 0
+    assert b'files were modified by this hook' not in printed
+
+
+def _cacheable_config(entry):
+    return {
+        'repo': 'local',
+        'hooks': [{
+            'id': 'cacheable',
+            'name': 'cacheable hook',
+            'entry': entry,
+            'language': 'system',
+            'files': r'\.txt$',
+            'cacheable': True,
+        }],
+    }
+
+
+def test_cacheable_hook_skips_passed_files(
+        cap_out, store, repo_with_passing_hook,
+):
+    add_config_to_repo(repo_with_passing_hook, _cacheable_config('echo'))
+    stage_a_file('a.txt')
+    stage_a_file('b.txt')
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(verbose=True),
+    )
+    assert ret == 0
+    assert b'a.txt b.txt' in printed
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(verbose=True),
+    )
+    assert ret == 0
+    assert b'cacheable hook' in printed
+    assert b'(cached)Passed' in printed
+
+    with open('b.txt', 'w') as f:
+        f.write('changed\n')
+    cmd_output('git', 'add', 'b.txt')
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(verbose=True),
+    )
+    assert ret == 0
+    assert b'\nb.txt\n' in printed
+
+
+def test_cacheable_hook_failures_are_not_cached(
+        cap_out, store, repo_with_passing_hook,
+):
+    add_config_to_repo(repo_with_passing_hook, _cacheable_config('false'))
+    stage_a_file('a.txt')
+
+    for _ in range(2):
+        ret, printed = _do_run(
+            cap_out, store, repo_with_passing_hook, run_opts(),
+        )
+        assert ret == 1
+        assert b'(cached)' not in printed
+
+
+def test_cacheable_hook_modifications_are_not_cached(
+        cap_out, store, repo_with_passing_hook,
+):
+    entry = 'sh -c "for f; do echo x >> $f; done" --'
+    add_config_to_repo(repo_with_passing_hook, _cacheable_config(entry))
+    stage_a_file('a.txt')
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(all_files=True),
+    )
+    assert ret == 1
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(all_files=True),
+    )
+    assert ret == 1
+    assert b'(cached)' not in printed
+
+
+def test_cacheable_hook_after_fixer_does_not_cache_unchecked_contents(
+        cap_out, store, repo_with_passing_hook,
+):
+    config = {
+        'repo': 'local',
+        'hooks': [
+            {
+                'id': 'fixer',
+                'name': 'fixer',
+                'entry': 'sh -c "for f; do echo good > $f; done" --',
+                'language': 'system',
+                'files': r'\.txt$',
+            },
+            {
+                'id': 'linter',
+                'name': 'linter',
+                'entry': 'sh -c "! grep -q bad $@" --',
+                'language': 'system',
+                'files': r'\.txt$',
+                'cacheable': True,
+            },
+        ],
+    }
+    add_config_to_repo(repo_with_passing_hook, config)
+    with open('a.txt', 'w') as f:
+        f.write('bad\n')
+    cmd_output('git', 'add', 'a.txt')
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(),
+    )
+    assert ret == 1
+    assert b'- files were modified by this hook' in printed
+    # the linter checked the contents written by the fixer only
+    cmd_output('git', 'checkout', 'a.txt')
+
+    ret, printed = _do_run(
+        cap_out, store, repo_with_passing_hook, run_opts(),
+        environ={'SKIP': 'fixer'},
+    )
+    assert ret == 1
+    assert b'(cached)' not in printed
+
+
+def test_classifier_filenames_for_hooks(tmpdir):
+    with tmpdir.as_cwd():
+        for filename in ('a.py', 'b.py', 'c.txt', 'd/e.py'):
+            tmpdir.join(filename).ensure()
+        classifier = Classifier(('a.py', 'b.py', 'c.txt', 'd/e.py'))
+        hooks = [
+            make_hook(),
+            make_hook(types=['python']),
+            make_hook(types=['python'], exclude='^d/'),
+            make_hook(files=r'\.txt$'),
+            make_hook(files=r'\.txt$', exclude_types=['text']),
+            make_hook(types=['python']),
+        ]
+        ret = classifier.filenames_for_hooks(hooks)
+        assert ret == [
+            ('a.py', 'b.py', 'c.txt', 'd/e.py'),
+            ('a.py', 'b.py', 'd/e.py'),
+            ('a.py', 'b.py'),
+            ('c.txt',),
+            (),
+            ('a.py', 'b.py', 'd/e.py'),
+        ]
+        assert ret == [classifier.filenames_for_hook(hook) for hook in hooks]
+
+
+def test_trace_file(cap_out, store, repo_with_passing_hook, tmpdir):
+    trace_file = str(tmpdir.join('trace.json'))
+    stage_a_file()
+    ret, _ = _do_run(
+        cap_out, store, repo_with_passing_hook,
+        run_opts(trace_file=trace_file),
+    )
+    assert ret == 0
+    with open(trace_file) as f:
+        events = json.load(f)['traceEvents']
+    names = {event['name'] for event in events}
+    assert {
+        'load_config', 'clone', 'classify', 'install_hook_envs',
+        'run_hooks', 'bash_hook', 'partition',
+    } <= names
+    partition, = (event for event in events if event['name'] == 'partition')
+    assert partition['args']['returncode'] == 0
+    assert partition['args']['args'] == 1
+
+
+def test_hook_costs_recorded(cap_out, store, repo_with_passing_hook):
+    stage_a_file()
+    for _ in range(2):
+        ret, _ = _do_run(cap_out, store, repo_with_passing_hook, run_opts())
+        assert ret == 0
+    hook_costs, = store.select_hook_costs().values()
+    assert hook_costs.runs == 1.9
+    assert hook_costs.failures == 0
+    assert hook_costs.partitions == 1.9
+
+
+def test_fail_fast_order():
+    hooks = [
+        make_hook(id='passes', entry='passes', read_only=True),
+        make_hook(id='fails', entry='fails', read_only=True),
+        make_hook(id='modifies', entry='modifies'),
+        make_hook(id='new', entry='new', read_only=True),
+        make_hook(id='fails_slowly', entry='fails_slowly', read_only=True),
+    ]
+    passes, fails, _, _, fails_slowly = hooks
+    hook_costs = {
+        passes.key: HookCosts(runs=10, failures=0, seconds=1),
+        fails.key: HookCosts(runs=10, failures=5, seconds=1),
+        fails_slowly.key: HookCosts(runs=10, failures=10, seconds=100),
+    }
+    ret = _fail_fast_order(hooks, hook_costs)
+    assert [hook.id for hook in ret] == [
+        'fails', 'passes', 'modifies', 'new', 'fails_slowly',
+    ]
+
+
 def test_classifier_removes_dne():
     classifier = Classifier(('this_file_does_not_exist',))
     assert classifier.filenames == []
@@ -1111,6 +1634,52 @@ def test_include_exclude_exclude_removes_files(some_filenames):
     assert ret == ['.pre-commit-hooks.yaml']
 
 
+@pytest.mark.parametrize(
+    ('pattern', 'expected'),
+    (
+        ('', ([('', False)], True)),
+        ('^vendor/', ([('vendor/', False)], True)),
+        (r'^a\.b/c', ([('a.b/c', False)], True)),
+        ('^(vendor|third_party)/', (
+            [('vendor/', False), ('third_party/', False)], True,
+        )),
+        ('^a/|^(?:b|c)', ([('a/', False), ('b', False), ('c', False)], True)),
+        (r'^src/.*\.py$', ([('src/', False)], False)),
+        ('^abc?', ([('ab', False)], False)),
+        ('^$', ([('', True), ('\n', True)], True)),
+        ('^setup.py$', ([('setup', False)], False)),
+        ('^setup-py$', ([('setup-py', True), ('setup-py\n', True)], True)),
+        (r'\.py$', ([], False)),
+        ('^a|b', ([], False)),
+        ('(?x)^a', ([], False)),
+    ),
+)
+def test_literal_prefixes(pattern, expected):
+    assert _literal_prefixes(pattern) == expected
+
+
+@pytest.mark.parametrize(
+    'pattern',
+    (
+        '', '^$', '^vendor/', '^vendor', '^(vendor|third_party)/',
+        r'^vendor/.*\.py$', r'\.py$', '^v', '^vendor/a.py$', '^[tv]',
+        '^vendor/|^a', '^vendor/|a',
+    ),
+)
+def test_path_table_search_same_as_regex(pattern):
+    filenames = [
+        'vendor/b.py', 'a.py', 'vendor/a.py', 'vendorx', 'third_party/c.txt',
+        'v', 'vendor/a.py\n', 'z/vendor/a.py',
+    ]
+    table = _PathTable(filenames)
+    included = table.names(table.search(pattern, table.everything))
+    assert included == [f for f in filenames if re.search(pattern, f)]
+    excluded = table.names(
+        table.search(pattern, table.everything, exclude=True),
+    )
+    assert excluded == [f for f in filenames if not re.search(pattern, f)]
+
+
 def test_args_hook_only(cap_out, store, repo_with_passing_hook):
     config = {
         'repo': 'local',
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+from unittest import mock
+
+import pytest
+
+from before_commit import concurrency
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    concurrency._detected_cpus.cache_clear()
+    yield
+    concurrency._detected_cpus.cache_clear()
+
+
+def _write(root, path, contents):
+    root.join(path).ensure().write(contents)
+
+
+def test_cgroup_cpus_no_cgroups(tmpdir):
+    assert concurrency._cgroup_cpus(str(tmpdir)) is None
+
+
+def test_cgroup_cpus_v2(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '0::/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', '150000 100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) == 1.5
+
+
+def test_cgroup_cpus_v2_unlimited(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '0::/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', 'max 100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) is None
+
+
+def test_cgroup_cpus_v2_most_restrictive_ancestor(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '0::/a/b\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', 'max 100000\n')
+    _write(tmpdir, 'sys/fs/cgroup/a/cpu.max', '200000 100000\n')
+    _write(tmpdir, 'sys/fs/cgroup/a/b/cpu.max', '400000 100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) == 2
+
+
+def test_cgroup_cpus_v2_cgroup_mounted_as_root(tmpdir):
+    # as in a container with a private cgroup namespace
+    _write(tmpdir, 'proc/self/cgroup', '0::/docker/abc123\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', '300000 100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) == 3
+
+
+def test_cgroup_cpus_v1(tmpdir):
+    _write(
+        tmpdir, 'proc/self/cgroup',
+        '12:memory:/docker/abc123\n'
+        '4:cpu,cpuacct:/docker/abc123\n'
+        '1:name=systemd:/docker/abc123\n',
+    )
+    base = 'sys/fs/cgroup/cpu,cpuacct/docker/abc123'
+    _write(tmpdir, f'{base}/cpu.cfs_quota_us', '250000\n')
+    _write(tmpdir, f'{base}/cpu.cfs_period_us', '100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) == 2.5
+
+
+def test_cgroup_cpus_v1_unlimited(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '4:cpu,cpuacct:/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu/cpu.cfs_quota_us', '-1\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu/cpu.cfs_period_us', '100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) is None
+
+
+def test_cgroup_cpus_hybrid(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '4:cpu,cpuacct:/\n0::/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu/cpu.cfs_quota_us', '100000\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu/cpu.cfs_period_us', '100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) == 1
+
+
+def test_cgroup_cpus_unexpected_contents(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', '0::/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', 'wat\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) is None
+
+
+def test_cgroup_cpus_malformed_cgroup_file(tmpdir):
+    _write(tmpdir, 'proc/self/cgroup', 'wat\n0::/\n')
+    _write(tmpdir, 'sys/fs/cgroup/cpu.max', '200000 100000\n')
+    assert concurrency._cgroup_cpus(str(tmpdir)) is None
+
+
+@pytest.mark.parametrize(
+    ('available', 'quota', 'expected'),
+    (
+        (8, None, 8),
+        (8, 2.0, 2),
+        (8, 1.5, 2),
+        (2, 4.0, 2),
+        (8, 0.1, 1),
+    ),
+)
+def test_detected_cpus(available, quota, expected):
+    with mock.patch.object(
+            concurrency, '_available_cpus', return_value=available,
+    ), mock.patch.object(concurrency, '_cgroup_cpus', return_value=quota):
+        assert concurrency._detected_cpus() == expected
+
+
+def test_cpu_count_detected():
+    with mock.patch.dict(os.environ, {}, clear=True):
+        with mock.patch.object(concurrency, '_detected_cpus', return_value=5):
+            assert concurrency.cpu_count() == 5
+
+
+@pytest.mark.parametrize(('value', 'expected'), (('3', 3), ('0', 1)))
+def test_cpu_count_override(value, expected):
+    with mock.patch.dict(os.environ, {'BEFORE_COMMIT_CONCURRENCY': value}):
+        assert concurrency.cpu_count() == expected
+
+
+def test_cpu_count_invalid_override():
+    with mock.patch.dict(os.environ, {'BEFORE_COMMIT_CONCURRENCY': 'lots'}):
+        with mock.patch.object(concurrency, '_detected_cpus', return_value=5):
+            assert concurrency.cpu_count() == 5
@@ -16,6 +16,7 @@ from unittest import mock
 
 import pytest
 
+from before_commit import config
 from before_commit.config import apply_defaults
 from before_commit.config import Array
 from before_commit.config import check_and
@@ -713,3 +714,32 @@ def test_warn_additional_keys_when_has_extra_keys(warn_additional_keys):
 def test_warn_additional_keys_when_no_extra_keys(warn_additional_keys):
     validate({True: True}, warn_additional_keys.schema)
     assert not warn_additional_keys.record.called
+
+
+class OptionalChecked(Optional):
+    def check(self, dct):
+        if dct.get(self.key) == 'forbidden':
+            raise ValidationError('forbidden')
+
+
+map_custom_item = Map('Map', None, OptionalChecked('k', check_any, 'x'))
+
+
+def test_validate_custom_item_is_not_compiled():
+    with pytest.raises(ValidationError) as excinfo:
+        validate({'k': 'forbidden'}, map_custom_item)
+    _assert_exception_trace(excinfo.value, ('At Map()', 'forbidden'))
+
+    assert apply_defaults({}, map_custom_item) == {'k': 'x'}
+
+
+def test_validate_compiles_schema_once():
+    schema = Array(Map('foo', 'key', Optional('key', check_bool, False)))
+    with mock.patch.object(
+            config, '_compile_check', wraps=config._compile_check,
+    ) as compile_check:
+        validate([{}], schema)
+        validate([{'key': True}], schema)
+    assert [c.args for c in compile_check.call_args_list] == [
+        (schema,), (schema.of,),
+    ]
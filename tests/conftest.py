@@ -259,7 +259,13 @@ def cap_out():
     stream = FakeStream()
     write = functools.partial(output.write, stream=stream)
     write_line_b = functools.partial(output.write_line_b, stream=stream)
-    with mock.patch.multiple(output, write=write, write_line_b=write_line_b):
+    write_chunks_b = functools.partial(output.write_chunks_b, stream=stream)
+    with mock.patch.multiple(
+            output,
+            write=write,
+            write_line_b=write_line_b,
+            write_chunks_b=write_chunks_b,
+    ):
         yield Fixture(stream)
 
 
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import pytest
+
+from before_commit import costs
+from before_commit.costs import HookCosts
+from testing.auto_namedtuple import auto_namedtuple
+
+
+def _partitions(*observations):
+    ret = HookCosts()
+    for x, y in observations:
+        ret = ret._replace(
+            partitions=ret.partitions + 1,
+            x=ret.x + x,
+            y=ret.y + y,
+            xx=ret.xx + x * x,
+            xy=ret.xy + x * y,
+        )
+    return ret
+
+
+def test_hook_costs_add_decays_previous():
+    ret = HookCosts(runs=10, failures=5).add(HookCosts(runs=1))
+    assert ret == HookCosts(runs=10, failures=4.5)
+
+
+def test_failures_per_second():
+    assert HookCosts().failures_per_second() == .5
+    fails_slowly = HookCosts(runs=8, failures=8, seconds=80)
+    passes_quickly = HookCosts(runs=8, failures=0, seconds=.8)
+    assert fails_slowly.failures_per_second() == pytest.approx(.09)
+    assert passes_quickly.failures_per_second() == pytest.approx(1)
+
+
+def test_min_partition_cost():
+    # half a second to start, a second per 1000 of cost
+    hook_costs = _partitions((1000, 1.5), (3000, 3.5), (500, 1))
+    assert hook_costs.min_partition_cost() == pytest.approx(500)
+
+
+@pytest.mark.parametrize(
+    'hook_costs',
+    (
+        pytest.param(HookCosts(), id='no observations'),
+        pytest.param(_partitions((1000, 1)), id='single observation'),
+        pytest.param(_partitions((10, 1), (10, 2)), id='same cost'),
+        pytest.param(_partitions((10, 2), (20, 1)), id='negative rate'),
+        pytest.param(_partitions((10, 1), (20, 2)), id='no startup'),
+    ),
+)
+def test_min_partition_cost_unknown(hook_costs):
+    assert hook_costs.min_partition_cost() == 0
+
+
+def test_observe():
+    events = [
+        {'name': 'load_config', 'dur': 1e6, 'args': {}},
+        {'name': 'a', 'dur': 2e6, 'args': {'key': 'k', 'returncode': 1}},
+        {
+            'name': 'partition', 'dur': 5e5,
+            'args': {'key': 'k', 'cost': 3, 'returncode': 0},
+        },
+        {
+            'name': 'partition', 'dur': 1e6,
+            'args': {'key': 'k', 'cost': 4, 'returncode': 1},
+        },
+        {
+            'name': 'partition', 'dur': 1e5,
+            'args': {'key': 'k', 'cost': 9, 'cancelled': True},
+        },
+        {'name': 'b', 'dur': 1e6, 'args': {'key': 'l', 'returncode': 0}},
+    ]
+    assert costs.observe(events) == {
+        'k': HookCosts(
+            runs=1, failures=1, seconds=2,
+            partitions=2, x=7, y=1.5, xx=25, xy=5.5,
+        ),
+        'l': HookCosts(runs=1, seconds=1),
+    }
+
+
+def test_using():
+    hook = auto_namedtuple(key='k')
+    assert costs.get(hook) == HookCosts()
+    with costs.using({'k': HookCosts(runs=1)}):
+        assert costs.get(hook) == HookCosts(runs=1)
+    assert costs.get(hook) == HookCosts()
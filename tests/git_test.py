@@ -282,3 +282,38 @@ def test_no_git_env():
 def test_init_repo_no_hooks(tmpdir):
     git.init_repo(str(tmpdir), remote='dne')
     assert not tmpdir.join('.git/hooks').exists()
+
+
+def test_get_index_entries(in_git_dir):
+    in_git_dir.join('f').write('hello\n')
+    in_git_dir.join('x').write('#!/bin/sh\n')
+    os.chmod('x', 0o755)
+    cmd_output('git', 'add', 'f', 'x')
+    entries = git.get_index_entries()
+    assert entries == {
+        'f': ('100644', 'ce013625030ba8dba906f756967f9e9ca394464a'),
+        'x': ('100755', entries['x'][1]),
+    }
+
+
+def test_get_unstaged_files(in_git_dir):
+    in_git_dir.join('f').write('hello\n')
+    in_git_dir.join('g').write('hello\n')
+    cmd_output('git', 'add', 'f', 'g')
+    in_git_dir.join('g').write('world\n')
+    in_git_dir.join('untracked').write('world\n')
+    assert git.get_unstaged_files() == ['g']
+
+
+def test_hash_objects(in_git_dir):
+    in_git_dir.join('f').write('hello\n')
+    in_git_dir.join('g').write('')
+    ret = git.hash_objects(['f', 'g'])
+    assert ret == [
+        'ce013625030ba8dba906f756967f9e9ca394464a',
+        'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391',
+    ]
+
+
+def test_hash_objects_no_files(in_git_dir):
+    assert git.hash_objects([]) == []
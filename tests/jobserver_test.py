@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import select
+import sys
+import threading
+import time
+
+import pytest
+
+from before_commit import concurrency
+from before_commit import jobserver
+from before_commit import parse_shebang
+from before_commit import xargs
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='posix only')
+
+
+def _readable(fd):
+    return bool(select.select([fd], [], [], 0)[0])
+
+
+def _acquire_all():
+    server = jobserver._server
+    assert server is not None
+    tokens = []
+    while any(_readable(fd) for fd in server._pipes):
+        tokens.append(asyncio.run(server.acquire_async()))
+    return tokens
+
+
+def _release_all(tokens):
+    assert jobserver._server is not None
+    for fd, token in tokens:
+        jobserver._server.release(fd, token)
+
+
+def test_async_token_without_jobserver():
+    async def run():
+        async with jobserver.async_token():
+            pass
+
+    assert jobserver._server is None
+    asyncio.run(run())
+
+
+def test_async_tokens_wait_for_release():
+    running = most_running = 0
+
+    async def job():
+        nonlocal running, most_running
+        async with jobserver.async_token():
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(.05)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*(job() for _ in range(5)))
+
+    with jobserver.jobs(2, {}):
+        asyncio.run(run())
+        # every token was given back
+        assert len(_acquire_all()) == 2
+    assert most_running == 2
+
+
+def test_token_without_jobserver():
+    assert jobserver._server is None
+    with jobserver.token():
+        pass
+
+
+def test_tokens_wait_for_release():
+    lock = threading.Lock()
+    running = most_running = 0
+
+    def job(_):
+        nonlocal running, most_running
+        with jobserver.token():
+            with lock:
+                running += 1
+                most_running = max(most_running, running)
+            time.sleep(.05)
+            with lock:
+                running -= 1
+
+    with jobserver.jobs(2, {}):
+        with concurrent.futures.ThreadPoolExecutor(5) as executor:
+            tuple(executor.map(job, range(5)))
+        # every token was given back
+        assert len(_acquire_all()) == 2
+    assert most_running == 2
+
+
+def test_jobs():
+    with jobserver.jobs(3, {}):
+        tokens = _acquire_all()
+        assert len(tokens) == 3
+        _release_all(tokens)
+        assert len(_acquire_all()) == 3
+    assert jobserver._server is None
+
+
+def test_jobs_default_is_cpu_count():
+    with jobserver.jobs(None, {}):
+        assert len(_acquire_all()) == concurrency.cpu_count()
+
+
+@pytest.fixture
+def make_pipe():
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'ab')
+    yield read_fd, write_fd
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+@pytest.mark.parametrize('opt', ('--jobserver-auth', '--jobserver-fds'))
+def test_jobs_joins_make_jobserver(make_pipe, opt):
+    read_fd, write_fd = make_pipe
+    environ = {'MAKEFLAGS': f' -j3 {opt}={read_fd},{write_fd}'}
+    with jobserver.jobs(None, environ):
+        tokens = _acquire_all()
+        # one implicit job and the two tokens of make
+        assert len(tokens) == 3
+        assert not _readable(read_fd)
+        _release_all(tokens)
+    assert os.read(read_fd, 2) == b'ab'
+
+
+def test_jobs_make_pipe_read_without_blocking(make_pipe):
+    read_fd, write_fd = make_pipe
+    environ = {'MAKEFLAGS': f' -j3 --jobserver-auth={read_fd},{write_fd}'}
+    with jobserver.jobs(None, environ):
+        assert jobserver._server is not None
+        make_read_fd, = (
+            fd for fd, w in jobserver._server._pipes.items() if w == write_fd
+        )
+        assert make_read_fd != read_fd
+        # the pipe of make is left blocking for the other jobs of make
+        assert os.get_blocking(read_fd)
+        assert not os.get_blocking(make_read_fd)
+        # as if another job of make took the tokens first
+        assert os.read(read_fd, 2) == b'ab'
+        with pytest.raises(BlockingIOError):
+            os.read(make_read_fd, 1)
+        os.write(write_fd, b'ab')
+
+
+def test_jobs_make_pipes_not_passed_to_hooks(make_pipe):
+    read_fd, write_fd = make_pipe
+    os.set_inheritable(read_fd, True)
+    os.set_inheritable(write_fd, True)
+    environ = {'MAKEFLAGS': f' -j3 --jobserver-auth={read_fd},{write_fd}'}
+    with jobserver.jobs(None, environ):
+        assert not os.get_inheritable(read_fd)
+        assert not os.get_inheritable(write_fd)
+
+
+def test_jobs_explicit_ignores_make_jobserver(make_pipe):
+    read_fd, write_fd = make_pipe
+    environ = {'MAKEFLAGS': f' -j3 --jobserver-auth={read_fd},{write_fd}'}
+    with jobserver.jobs(1, environ):
+        assert len(_acquire_all()) == 1
+
+
+def test_jobs_make_fds_not_inherited():
+    environ = {'MAKEFLAGS': ' -j3 --jobserver-auth=998,999'}
+    with jobserver.jobs(None, environ):
+        assert len(_acquire_all()) == concurrency.cpu_count()
+
+
+def test_jobs_make_fifo(tmpdir):
+    fifo = str(tmpdir.join('fifo'))
+    os.mkfifo(fifo)
+    fd = os.open(fifo, os.O_RDWR)
+    try:
+        os.write(fd, b'x')
+        environ = {'MAKEFLAGS': f'-j2 --jobserver-auth=fifo:{fifo}'}
+        with jobserver.jobs(None, environ):
+            tokens = _acquire_all()
+            assert sorted(token for _, token in tokens) == [b'+', b'x']
+            _release_all(tokens)
+        assert os.read(fd, 1) == b'x'
+    finally:
+        os.close(fd)
+
+
+def test_xargs_partitions_share_jobs():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    sleep = ('sleep .2',)
+    start = time.time()
+    with jobserver.jobs(1, {}):
+        ret, _ = xargs.xargs(
+            bash_cmd, sleep * 3,
+            target_concurrency=3,
+            _max_length=len(' '.join(bash_cmd + sleep)) + 1,
+        )
+    assert ret == 0
+    # the partitions could not run concurrently
+    assert time.time() - start >= .6
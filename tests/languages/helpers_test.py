@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import multiprocessing
 import os.path
 import sys
 from unittest import mock
@@ -8,11 +7,13 @@ from unittest import mock
 import pytest
 
 import before_commit.constants as C
+from before_commit import concurrency
 from before_commit import parse_shebang
 from before_commit.languages import helpers
 from before_commit.prefix import Prefix
 from before_commit.util import CalledProcessError
 from testing.auto_namedtuple import auto_namedtuple
+from testing.fixtures import make_hook
 
 
 @pytest.fixture
@@ -99,7 +100,7 @@ SERIAL_TRUE = auto_namedtuple(require_serial=True)
 
 
 def test_target_concurrency_normal():
-    with mock.patch.object(multiprocessing, 'cpu_count', return_value=123):
+    with mock.patch.object(concurrency, 'cpu_count', return_value=123):
         with mock.patch.dict(os.environ, {}, clear=True):
             assert helpers.target_concurrency(SERIAL_FALSE) == 123
 
@@ -121,15 +122,55 @@ def test_target_concurrency_on_travis():
         assert helpers.target_concurrency(SERIAL_FALSE) == 2
 
 
-def test_target_concurrency_cpu_count_not_implemented():
-    with mock.patch.object(
-            multiprocessing, 'cpu_count', side_effect=NotImplementedError,
-    ):
-        with mock.patch.dict(os.environ, {}, clear=True):
-            assert helpers.target_concurrency(SERIAL_FALSE) == 1
-
-
 def test_shuffled_is_deterministic():
     seq = [str(i) for i in range(10)]
     expected = ['4', '0', '5', '1', '8', '6', '2', '3', '7', '9']
     assert helpers._shuffled(seq) == expected
+
+
+def test_argfile_arg():
+    assert helpers._argfile_arg('a/b.py') == 'a/b.py'
+    assert helpers._argfile_arg('a b\'c"d\\e') == 'a\\ b\\\'c\\"d\\\\e'
+
+
+def test_run_xargs_stdin0():
+    prog = 'import sys; print(sys.stdin.read().split("\\0"))'
+    cmd = (sys.executable, '-c', prog)
+    hook = make_hook(pass_filenames='stdin0')
+    ret, out = helpers.run_xargs(hook, cmd, ('a.py', 'b c.py'))
+    assert ret == 0
+    assert out == b"['a.py', 'b c.py', '']\n"
+
+
+def test_run_xargs_argfile():
+    prog = (
+        'import shlex, sys\n'
+        'with open(sys.argv[2][1:]) as f:\n'
+        '    print(sys.argv[1], shlex.split(f.read()))\n'
+    )
+    cmd = (sys.executable, '-c', prog, '--check')
+    hook = make_hook(pass_filenames='argfile')
+    ret, out = helpers.run_xargs(hook, cmd, ('a.py', 'b c.py', "d'.py"))
+    assert ret == 0
+    assert out == b'--check [\'a.py\', \'b c.py\', "d\'.py"]\n'
+
+
+@pytest.mark.parametrize(('timeout', 'expected'), ((0, None), (1.5, 1.5)))
+def test_run_xargs_timeout(timeout, expected):
+    hook = make_hook(timeout=timeout)
+    with mock.patch.object(helpers, 'xargs') as xargs:
+        helpers.run_xargs(hook, ('cmd',), ('a',), color=False)
+    _, kwargs = xargs.call_args
+    assert kwargs['timeout'] == expected
+
+
+def test_run_xargs_worker():
+    hook = make_hook(
+        worker=True, require_serial=True, partition_strategy='size',
+    )
+    with mock.patch.object(helpers.worker, 'run') as run:
+        helpers.run_xargs(hook, ('cmd',), ('a', 'b'), color=False)
+    run.assert_called_once_with(
+        ('cmd',), ('a', 'b'),
+        color=False, target_concurrency=1, partition_strategy='size',
+    )
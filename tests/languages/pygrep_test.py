@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+import os
+import re
+import sys
+from unittest import mock
+
 import pytest
 
+from before_commit import xargs
 from before_commit.languages import pygrep
+from testing.fixtures import make_hook
 
 
 @pytest.fixture
@@ -125,3 +132,272 @@ def test_multiline_multiline_flag_is_enabled(cap_out):
     out = cap_out.get()
     assert ret == 1
     assert out == 'f1:1:foo\nbar\n'
+
+
+@pytest.mark.usefixtures('some_files')
+def test_multiline_all_matches(cap_out):
+    ret = pygrep.main((
+        '--multiline', '--all-matches', r'pattern\nbar|\[INFO\]',
+        'f4', 'f5', 'f6',
+    ))
+    out = cap_out.get()
+    assert ret == 1
+    assert out == (
+        'f4:2:pattern\nbar\n'
+        'f5:1:[INFO] hi\n'
+        'f5:2:pattern\nbar\n'
+        'f6:1:pattern\nbar\n'
+    )
+
+
+@pytest.mark.usefixtures('some_files')
+def test_all_matches_ignored_when_negated(cap_out):
+    ret = pygrep.main((
+        '--multiline', '--negate', '--all-matches', 'INFO', 'f4', 'f5',
+    ))
+    out = cap_out.get()
+    assert ret == 1
+    assert out == 'f4\n'
+
+
+def _pygrep_hook(*args, **kwargs):
+    kwargs = {'language': 'pygrep', **kwargs}
+    return make_hook(args=args[:-1], entry=args[-1], **kwargs)
+
+
+def _run_subprocess(args, filenames):
+    cmd = (sys.executable, '-m', pygrep.__name__, *args)
+    return xargs.xargs(cmd, filenames)
+
+
+@pytest.mark.usefixtures('some_files')
+@pytest.mark.parametrize(
+    'args',
+    (
+        ('baz',),
+        ('foo',),
+        ('-i', r'\[info\]'),
+        ('--negate', 'pattern'),
+        ('--multiline', r'foo\nbar'),
+        ('--multiline', '--negate', 'pattern\nbar'),
+    ),
+)
+def test_run_hook_in_process(args):
+    filenames = ('f1', 'f2', 'f3', 'f4', 'f5', 'f6')
+    expected = _run_subprocess(args, filenames)
+    with mock.patch.object(pygrep, 'xargs') as xargs_mck:
+        ret = pygrep.run_hook(_pygrep_hook(*args), filenames, color=False)
+    assert not xargs_mck.called
+    assert ret == expected
+
+
+def test_run_hook_in_process_undecodable(tmpdir):
+    tmpdir.join('f').write_binary(b'\xff pattern\r\n')
+    with tmpdir.as_cwd():
+        ret = pygrep.run_hook(_pygrep_hook('pattern'), ('f',), color=False)
+    assert ret == (1, b'f:1:\xff pattern\n')
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='posix only')
+@pytest.mark.parametrize('args', (('foo',), ('--negate', 'bar')))
+def test_run_hook_in_process_unencodable_filename(tmpdir, args):
+    filename = os.fsdecode(b'\xff')
+    tmpdir.join(filename).write_binary(b'foo\n')
+    with tmpdir.as_cwd():
+        expected = _run_subprocess(args, (filename,))
+        ret = pygrep.run_hook(_pygrep_hook(*args), (filename,), color=False)
+    assert ret == expected
+    assert ret[1].startswith(b'\xff')
+
+
+@pytest.mark.usefixtures('some_files')
+@pytest.mark.parametrize(
+    ('env', 'threads'),
+    (({'BEFORE_COMMIT_CONCURRENCY': '2'}, 2), ({}, 1)),
+)
+def test_run_hook_in_process_threads(monkeypatch, env, threads):
+    monkeypatch.delenv('PRE_COMMIT_NO_CONCURRENCY', raising=False)
+    if not env:
+        monkeypatch.setenv('PRE_COMMIT_NO_CONCURRENCY', '1')
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    filenames = ('f1', 'f2', 'f3', 'f4', 'f5', 'f6')
+    with mock.patch.object(
+            pygrep.jobserver, 'token', wraps=pygrep.jobserver.token,
+    ) as token_mck:
+        ret = pygrep.run_hook(_pygrep_hook('foo'), filenames, color=False)
+    # every partition holds a job token
+    assert token_mck.call_count == threads
+    assert ret == _run_subprocess(('foo',), filenames)
+
+
+@pytest.mark.usefixtures('some_files')
+@pytest.mark.parametrize(
+    ('args', 'filenames'),
+    (
+        pytest.param(('(',), ('f1',), id='invalid pattern'),
+        pytest.param(('--wat', 'foo'), ('f1',), id='invalid argument'),
+        pytest.param(('f1', 'foo'), ('f2',), id='filename in args'),
+        pytest.param(('foo',), ('f1', 'dne'), id='missing file'),
+    ),
+)
+def test_run_hook_subprocess_fallback(args, filenames):
+    expected = _run_subprocess(args, filenames)
+    ret = pygrep.run_hook(_pygrep_hook(*args), filenames, color=False)
+    assert ret == expected
+
+
+@pytest.fixture
+def mmap_all(monkeypatch):
+    monkeypatch.setattr(pygrep, '_MMAP_SIZE', 1)
+
+
+@pytest.mark.usefixtures('some_files', 'mmap_all')
+@pytest.mark.parametrize(
+    'args',
+    (
+        ('foo',),
+        ('--negate', 'pattern'),
+        ('--multiline', r'foo\nbar'),
+        ('--multiline', 'bar'),
+        ('--multiline', '--negate', 'pattern\nbar'),
+    ),
+)
+def test_run_hook_mmap(args):
+    filenames = ('f1', 'f2', 'f3', 'f4', 'f5', 'f6')
+    expected = _run_subprocess(args, filenames)
+    ret = pygrep.run_hook(_pygrep_hook(*args), filenames, color=False)
+    assert ret == expected
+
+
+def test_lines_mmap(tmpdir, mmap_all):
+    f = tmpdir.join('f')
+    f.write_binary(b'a\r\n\nb\rc\nd')
+    with pygrep._contents(str(f)) as contents:
+        assert not isinstance(contents, bytes)
+        lines = list(pygrep._lines(contents))
+    assert lines == [b'a\r\n', b'\n', b'b\rc\n', b'd']
+
+
+@pytest.mark.usefixtures('some_files')
+def test_scan():
+    hooks = (
+        _pygrep_hook('foo'),
+        _pygrep_hook('--multiline', 'pattern\nbar'),
+        _pygrep_hook('--negate', 'pattern'),
+    )
+    hook_filenames = (('f1', 'f2'), ('f4', 'f5', 'f6'), ('f1', 'f4'))
+    with mock.patch.object(
+            pygrep, '_contents', wraps=pygrep._contents,
+    ) as contents_mck:
+        scanned = pygrep.scan(hooks, hook_filenames)
+    # every file is read once
+    assert sorted(call[0][0] for call in contents_mck.call_args_list) == [
+        'f1', 'f2', 'f4', 'f5', 'f6',
+    ]
+    assert scanned == {
+        ('foo',): {'f1': [b'f1:1:foo'], 'f2': []},
+        ('--multiline', 'pattern\nbar'): {
+            'f4': [b'f4:2:pattern\nbar'],
+            'f5': [b'f5:2:pattern\nbar'],
+            'f6': [b'f6:1:pattern\nbar'],
+        },
+        ('--negate', 'pattern'): {'f1': [b'f1'], 'f4': []},
+    }
+
+    with pygrep.using(scanned):
+        with mock.patch.object(pygrep, '_contents') as contents_mck:
+            ret = pygrep.run_hook(hooks[1], hook_filenames[1], color=False)
+        assert not contents_mck.called
+    args = ('--multiline', 'pattern\nbar')
+    expected = _run_subprocess(args, hook_filenames[1])
+    assert ret == expected
+
+
+@pytest.mark.usefixtures('some_files')
+def test_scan_skips():
+    hooks = (
+        _pygrep_hook('foo'),
+        _pygrep_hook('('),
+        _pygrep_hook('foo', worker=True),
+        _pygrep_hook('bar', language='python'),
+        _pygrep_hook('bar', pass_filenames=False),
+    )
+    assert pygrep.scan(hooks, (('f1',),) * len(hooks)) == {}
+
+
+@pytest.mark.usefixtures('some_files')
+def test_scan_unreadable_file():
+    hooks = (_pygrep_hook('foo'), _pygrep_hook('bar'))
+    scanned = pygrep.scan(hooks, (('f1', 'dne'), ('f1', 'dne')))
+    assert scanned == {
+        ('foo',): {'f1': [b'f1:1:foo']},
+        ('bar',): {'f1': [b'f1:2:bar']},
+    }
+    with pygrep.using(scanned):
+        ret = pygrep.run_hook(hooks[0], ('f1', 'dne'), color=False)
+    assert ret == _run_subprocess(('foo',), ('f1', 'dne'))
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'expected'),
+    (
+        (r'breakpoint\(', b'breakpoint('),
+        (r'pdb\.set_trace\(\)', b'pdb.set_trace()'),
+        (r'print\(.*\)', b'print('),
+        (r'x(abc)+y', b'abc'),
+        (r'a[bc]de', b'de'),
+        (r'(?x) f o o', b'foo'),
+        (r'a(?i:bcd)e', b'a'),
+        (r'(?i)todo', b''),
+        (r'foo|bar', b''),
+        (r'(abc)*', b''),
+        (r'\s+$', b''),
+    ),
+)
+def test_required_literal(pattern, expected):
+    assert pygrep._required_literal(re.compile(pattern.encode())) == expected
+
+
+@pytest.mark.parametrize(
+    'args',
+    (
+        ('TODO',),
+        ('--negate', 'TODO'),
+        ('--multiline', 'TODO.*end'),
+        ('--multiline', '--negate', 'TODO.*end'),
+        ('x(TO)+DO',),
+    ),
+)
+def test_literal_prefilter_does_not_change_output(args):
+    contents = b'a\nb TODO\r\nTOTODO\nc\nend\n'
+    grep = pygrep._grep(pygrep._parser().parse_args(args))
+    assert grep.literal
+    without_literal = grep._replace(literal=b'')
+    for file_contents in (contents, b'a\nb\n'):
+        assert (
+            grep.process('f', file_contents) ==
+            without_literal.process('f', file_contents)
+        )
+
+
+def test_line_index(monkeypatch):
+    monkeypatch.setattr(pygrep, '_CHUNK', 4)
+    contents = b'ab\n\ncdefgh\nij\n\n\nk'
+    lines = pygrep._LineIndex(contents)
+    # looked up out of order
+    for pos in (*range(len(contents) - 1, -1, -2), *range(len(contents))):
+        assert lines.line_no(pos) == contents[:pos].count(b'\n') + 1
+
+
+@pytest.mark.usefixtures('mmap_all')
+def test_line_index_mmap(tmpdir, monkeypatch):
+    monkeypatch.setattr(pygrep, '_CHUNK', 4)
+    f = tmpdir.join('f')
+    f.write_binary(b'a\nb\nc\nTODO\nd\nTODO')
+    grep = pygrep._grep(
+        pygrep._parser().parse_args(('--multiline', '--all-matches', 'TODO')),
+    )
+    with pygrep._contents(str(f)) as contents:
+        assert not isinstance(contents, bytes)
+        assert grep.process('f', contents) == [b'f:4:TODO', b'f:6:TODO']
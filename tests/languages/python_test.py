@@ -7,6 +7,8 @@ from unittest import mock
 import pytest
 
 import before_commit.constants as C
+import before_commit.resources
+from before_commit import worker
 from before_commit.envcontext import envcontext
 from before_commit.languages import python
 from before_commit.prefix import Prefix
@@ -210,3 +212,122 @@ def test_unhealthy_then_replaced(python_dir):
     os.replace(f'{py_exe}.tmp', py_exe)
 
     assert python.health_check(prefix, C.DEFAULT) is None
+
+
+FAKE_TOOL = """\
+import os, sys
+
+IMPORTED_BY = os.getpid()
+print('imported')
+
+def main():
+    print('forked:', os.getpid() != IMPORTED_BY, *sys.argv[1:])
+    print('err', file=sys.stderr)
+    if 'fail' in sys.argv:
+        return 3
+    elif 'message' in sys.argv:
+        sys.exit('message')
+    elif 'kill' in sys.argv:
+        os.kill(os.getpid(), 9)
+    elif 'error' in sys.argv:
+        raise ValueError('wat')
+    sys.stdout.buffer.write(b'\\xff\\n')
+"""
+
+
+@pytest.fixture
+def forkserver(tmpdir):
+    tmpdir.join('fake_tool.py').write(FAKE_TOOL)
+    dist_info = tmpdir.join('fake_tool-1.0.dist-info').ensure_dir()
+    dist_info.join('METADATA').write('Name: fake-tool\nVersion: 1.0\n')
+    dist_info.join('entry_points.txt').write(
+        '[console_scripts]\nfake-tool = fake_tool:main\n',
+    )
+    env = {**os.environ, 'PYTHONPATH': str(tmpdir)}
+    resources = os.path.dirname(before_commit.resources.__file__)
+    with open(os.path.join(resources, 'python_forkserver.py')) as f:
+        src = f.read()
+
+    def run(*cmd, files):
+        return worker.run(
+            (
+                sys.executable, '-c', src, cmd[0],
+            ),
+            files,
+            args=cmd[1:],
+            target_concurrency=2,
+            env=env,
+        )
+    return run
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+def test_forkserver_runs_console_script(forkserver):
+    ret, out = forkserver(
+        'fake-tool', '--flag', files=('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'),
+    )
+    assert ret == 0
+    assert out == (
+        b'forked: True --flag a b c d\nerr\n\xff\n'
+        b'forked: True --flag e f g h\nerr\n\xff\n'
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+@pytest.mark.parametrize(
+    ('arg', 'expected_ret', 'expected_out'),
+    (
+        ('fail', 3, b''),
+        ('message', 1, b'message\n'),
+        ('kill', -9, b''),
+    ),
+)
+def test_forkserver_exit_codes(forkserver, arg, expected_ret, expected_out):
+    ret, out = forkserver('fake-tool', files=(arg,))
+    assert ret == expected_ret
+    assert out == f'forked: True {arg}\nerr\n'.encode() + expected_out
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+def test_forkserver_console_script_raises(forkserver):
+    ret, out = forkserver('fake-tool', files=('error',))
+    assert ret == 1
+    assert out.startswith(b'forked: True error\nerr\nTraceback')
+    assert out.endswith(b'ValueError: wat\n')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+def test_forkserver_executes_other_commands(forkserver):
+    assert forkserver('echo', 'hi', files=('a',)) == (0, b'hi a\n')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+def test_forkserver_executable_not_found(forkserver):
+    ret, out = forkserver('dne', files=('a',))
+    assert (ret, out) == (1, b'Executable `dne` not found\n')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+@pytest.mark.parametrize('use_worker', (True, False))
+def test_run_hook_worker(tmp_path, use_worker):
+    hook = mock.Mock(
+        prefix=Prefix(str(tmp_path)), language_version=C.DEFAULT,
+        cmd=('fake-tool', '--flag'), worker=use_worker,
+        require_serial=False,
+    )
+    with mock.patch.object(python, 'in_env'), \
+            mock.patch.object(python, 'resource_text', return_value='src'), \
+            mock.patch.object(python.helpers, 'run_xargs') as run_xargs:
+        python.run_hook(hook, ('a',), color=False)
+
+    if use_worker:
+        run_xargs.assert_called_once_with(
+            hook, ('python', '-c', 'src', 'fake-tool'), ('a',),
+            color=False, args=('--flag',),
+        )
+    else:
+        run_xargs.assert_called_once_with(
+            hook._replace.return_value, ('fake-tool', '--flag'), ('a',),
+            color=False,
+        )
+        hook._replace.assert_called_once_with(worker=False)
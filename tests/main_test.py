@@ -26,7 +26,7 @@ def test_adjust_args_and_chdir_not_in_git_dir(in_tmpdir):
 
 
 def test_adjust_args_and_chdir_noop(in_git_dir):
-    args = _args(command='run', files=['f1', 'f2'])
+    args = _args(command='run', files=['f1', 'f2'], trace_file=None)
     main._adjust_args_and_chdir(args)
     assert os.getcwd() == in_git_dir
     assert args.config == C.DEFAULT_CONFIG_FILE
@@ -37,11 +37,15 @@ def test_adjust_args_and_chdir_relative_things(in_git_dir):
     in_git_dir.join('foo/cfg.yaml').ensure()
     in_git_dir.join('foo').chdir()
 
-    args = _args(command='run', files=['f1', 'f2'], config='cfg.yaml')
+    args = _args(
+        command='run', files=['f1', 'f2'], config='cfg.yaml',
+        trace_file='trace.json',
+    )
     main._adjust_args_and_chdir(args)
     assert os.getcwd() == in_git_dir
     assert args.config == os.path.join('foo', 'cfg.yaml')
     assert args.files == [os.path.join('foo', 'f1'), os.path.join('foo', 'f2')]
+    assert args.trace_file == str(in_git_dir.join('foo/trace.json'))
 
 
 @pytest.mark.skipif(os.name != 'nt', reason='windows feature')
@@ -67,7 +71,9 @@ def test_adjust_args_and_chdir_non_relative_config(in_git_dir):
 def test_adjust_args_try_repo_repo_relative(in_git_dir):
     in_git_dir.join('foo').ensure_dir().chdir()
 
-    args = _args(command='try-repo', repo='../foo', files=[])
+    args = _args(
+        command='try-repo', repo='../foo', files=[], trace_file=None,
+    )
     assert args.repo is not None
     assert os.path.exists(args.repo)
     main._adjust_args_and_chdir(args)
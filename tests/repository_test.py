@@ -1012,7 +1012,12 @@ def test_manifest_hooks(tempdir_factory, store):
         minimum_pre_commit_version='0',
         name='Bash hook',
         pass_filenames=True,
+        read_only=False,
+        cacheable=False,
         require_serial=False,
+        partition_strategy='count',
+        worker=False,
+        timeout=0,
         stages=(
             'commit', 'merge-commit', 'prepare-commit-msg', 'commit-msg',
             'post-commit', 'manual', 'post-checkout', 'push', 'post-merge',
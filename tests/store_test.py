@@ -8,6 +8,7 @@ from unittest import mock
 import pytest
 
 from before_commit import git
+from before_commit.costs import HookCosts
 from before_commit.store import _get_default_directory
 from before_commit.store import Store
 from before_commit.util import CalledProcessError
@@ -260,3 +261,86 @@ def test_mark_config_as_used_readonly(tmpdir):
     # should be skipped due to readonly
     store.mark_config_used(str(cfg))
     assert store.select_all_configs() == []
+
+
+def test_mark_files_passed(store):
+    store.mark_files_passed('k', '/prefix', {'a.py': 'd1', 'b.py': 'd2'})
+    digests = {'a.py': 'd1', 'b.py': 'changed', 'c.py': 'd3'}
+    assert store.select_passed_files('k', digests) == {'a.py'}
+    assert store.select_passed_files('other', digests) == set()
+
+
+def test_mark_files_passed_replaces_digest(store):
+    store.mark_files_passed('k', '/prefix', {'a.py': 'd1'})
+    store.mark_files_passed('k', '/prefix', {'a.py': 'd2'})
+    assert store.select_passed_files('k', {'a.py': 'd1'}) == set()
+    assert store.select_passed_files('k', {'a.py': 'd2'}) == {'a.py'}
+
+
+def test_select_passed_files_roll_forward(store):
+    with store.connect() as db:
+        db.executescript('DROP TABLE hook_cache')
+    assert store.select_passed_files('k', {'a.py': 'd1'}) == set()
+
+
+def test_delete_repo_removes_passed_files(store, tmpdir):
+    path = tmpdir.join('repo').ensure_dir()
+    store.mark_files_passed('k', str(path), {'a.py': 'd1'})
+    store.delete_repo('r', 'ref', str(path))
+    assert store.select_passed_files('k', {'a.py': 'd1'}) == set()
+
+
+def test_add_hook_costs(store):
+    store.add_hook_costs({'k': ('/prefix', HookCosts(runs=1, seconds=2))})
+    store.add_hook_costs({'k': ('/prefix', HookCosts(runs=1, seconds=1))})
+    assert store.select_hook_costs() == {
+        'k': HookCosts(runs=1.9, seconds=2.8),
+    }
+
+
+def test_select_hook_costs_roll_forward(store):
+    with store.connect() as db:
+        db.executescript('DROP TABLE IF EXISTS hook_costs')
+    assert store.select_hook_costs() == {}
+
+
+def test_delete_repo_removes_hook_costs(store, tmpdir):
+    path = tmpdir.join('repo').ensure_dir()
+    store.add_hook_costs({'k': (str(path), HookCosts(runs=1))})
+    store.delete_repo('r', 'ref', str(path))
+    assert store.select_hook_costs() == {}
+
+
+def test_mark_file_tags(store):
+    tags = frozenset(('file', 'python', 'text'))
+    file_tags = {'a.py': (1, 2, 3, '100644', tags), 'b': (1, 2, 3, None, tags)}
+    store.mark_file_tags('/root', file_tags)
+    assert store.select_file_tags('/root') == file_tags
+    assert store.select_file_tags('/other') == {}
+
+
+def test_select_file_tags_roll_forward(store):
+    with store.connect() as db:
+        db.executescript('DROP TABLE file_tags')
+    assert store.select_file_tags('/root') == {}
+
+
+def test_file_tags_without_index_mode(store):
+    with store.connect() as db:
+        db.executescript(
+            'DROP TABLE file_tags;'
+            'CREATE TABLE file_tags ('
+            '   root TEXT NOT NULL,'
+            '   path TEXT NOT NULL,'
+            '   size INTEGER NOT NULL,'
+            '   mtime_ns INTEGER NOT NULL,'
+            '   mode INTEGER NOT NULL,'
+            '   tags TEXT NOT NULL,'
+            '   PRIMARY KEY (root, path)'
+            ');'
+            "INSERT INTO file_tags VALUES ('/root', 'a.py', 1, 2, 3, 'file');",
+        )
+    assert store.select_file_tags('/root') == {}
+    file_tags = {'a.py': (1, 2, 3, None, frozenset(('file',)))}
+    store.mark_file_tags('/root', file_tags)
+    assert store.select_file_tags('/root') == file_tags
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+from unittest import mock
+
+import pytest
+from identify.identify import tags_from_path
+
+from before_commit import tag_index
+from before_commit.tag_index import TagIndex
+from before_commit.util import cmd_output
+
+
+def _old(filename):
+    os.utime(filename, ns=(1, 1))
+
+
+@pytest.mark.parametrize(
+    'contents',
+    (b'print("hi")\n', b'#!/usr/bin/env python3\n', b'\x00\x01'),
+)
+@pytest.mark.parametrize('executable', (True, False))
+def test_tags_match_identify(in_git_dir, store, contents, executable):
+    for filename in ('f.py', 'noext'):
+        in_git_dir.join(filename).write_binary(contents)
+        os.chmod(filename, 0o755 if executable else 0o644)
+        index = TagIndex(store, str(in_git_dir))
+        assert index.tags(filename) == tags_from_path(filename)
+
+
+def test_tags_of_symlink(in_git_dir, store):
+    os.symlink('dne', 'link')
+    assert TagIndex(store, str(in_git_dir)).tags('link') == {'symlink'}
+
+
+def test_tags_does_not_exist(in_git_dir, store):
+    with pytest.raises(ValueError):
+        TagIndex(store, str(in_git_dir)).tags('dne')
+
+
+def test_executable_bit_from_index(in_git_dir, store):
+    in_git_dir.join('f').write('#!/bin/sh\n')
+    cmd_output('git', 'add', 'f')
+    cmd_output('git', 'update-index', '--chmod=+x', 'f')
+    assert 'executable' in TagIndex(store, str(in_git_dir)).tags('f')
+
+
+def test_tags_recomputed_when_index_mode_changes(in_git_dir, store):
+    in_git_dir.join('f').write('#!/bin/sh\n')
+    _old('f')
+    cmd_output('git', 'add', 'f')
+    index = TagIndex(store, str(in_git_dir))
+    assert 'non-executable' in index.tags('f')
+    index.save()
+
+    cmd_output('git', 'update-index', '--chmod=+x', 'f')
+    assert 'executable' in TagIndex(store, str(in_git_dir)).tags('f')
+
+
+def test_tags_persisted_between_runs(in_git_dir, store):
+    in_git_dir.join('f.py').write('print("hi")\n')
+    _old('f.py')
+    index = TagIndex(store, str(in_git_dir))
+    tags = index.tags('f.py')
+    index.save()
+
+    with mock.patch.object(tag_index, '_tags') as tags_mock:
+        index = TagIndex(store, str(in_git_dir))
+        assert index.tags('f.py') == tags
+    tags_mock.assert_not_called()
+
+
+def test_tags_recomputed_when_file_changes(in_git_dir, store):
+    in_git_dir.join('f').write('print("hi")\n')
+    _old('f')
+    index = TagIndex(store, str(in_git_dir))
+    assert 'text' in index.tags('f')
+    index.save()
+
+    in_git_dir.join('f').write_binary(b'\x00\x01\x02')
+    _old('f')
+    assert 'binary' in TagIndex(store, str(in_git_dir)).tags('f')
+
+
+def test_recently_modified_files_are_not_persisted(in_git_dir, store):
+    in_git_dir.join('f.py').write('print("hi")\n')
+    index = TagIndex(store, str(in_git_dir))
+    index.tags('f.py')
+    index.save()
+    assert store.select_file_tags(str(in_git_dir)) == {}
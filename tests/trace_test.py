@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+from typing import Any
+
+import pytest
+
+from before_commit import trace
+
+
+def test_span_not_tracing():
+    with trace.span('name', x=1) as args:
+        args['y'] = 2
+    assert trace._fd is None
+
+
+def test_recording():
+    events: list[dict[str, Any]] = []
+    with trace.recording(events):
+        with trace.span('outer', x=1) as args:
+            with trace.span('inner'):
+                pass
+            args['y'] = 2
+    assert trace._fd is None
+
+    inner, outer = events
+    assert inner['name'] == 'inner'
+    assert inner['ph'] == 'X'
+    assert inner['pid'] == os.getpid()
+    assert outer['name'] == 'outer'
+    assert outer['args'] == {'x': 1, 'y': 2}
+    assert outer['ts'] <= inner['ts']
+    assert outer['dur'] >= inner['dur']
+
+
+def test_recording_kept_on_error():
+    events: list[dict[str, Any]] = []
+    with pytest.raises(ValueError):
+        with trace.recording(events):
+            with trace.span('fails'):
+                raise ValueError
+    event, = events
+    assert event['name'] == 'fails'
+
+
+def _span_in_child():
+    with trace.span('child'):
+        pass
+
+
+@pytest.mark.skipif(
+    'fork' not in multiprocessing.get_all_start_methods(),
+    reason='needs fork',
+)
+def test_recording_forked_process():
+    events: list[dict[str, Any]] = []
+    with trace.recording(events):
+        proc = multiprocessing.get_context('fork').Process(
+            target=_span_in_child,
+        )
+        proc.start()
+        proc.join()
+    event, = events
+    assert event['name'] == 'child'
+    assert event['pid'] != os.getpid()
+
+
+def test_write(tmpdir):
+    filename = str(tmpdir.join('trace.json'))
+    events = [{'name': 'a', 'ph': 'X', 'ts': 1, 'dur': 2, 'args': {}}]
+    trace.write(filename, events)
+    with open(filename) as f:
+        assert json.load(f) == {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -1,20 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import io
 import os.path
 import stat
 import subprocess
+import sys
+import time
 
 import pytest
 
+from before_commit import util
 from before_commit.util import CalledProcessError
 from before_commit.util import clean_path_on_failure
 from before_commit.util import cmd_output
 from before_commit.util import cmd_output_b
 from before_commit.util import cmd_output_p
+from before_commit.util import cmd_output_stream_async
+from before_commit.util import cmd_output_stream_b
+from before_commit.util import cmd_output_stream_p
 from before_commit.util import make_executable
 from before_commit.util import parse_version
 from before_commit.util import rmtree
 from before_commit.util import tmpdir
+from before_commit.util import TIMEOUT_RETURNCODE
+from testing.util import xfailif_windows
 
 
 def test_CalledProcessError_str():
@@ -95,6 +105,26 @@ def test_cmd_output_exe_not_found_bytes(fn):
     assert out == b'Executable `dne` not found'
 
 
+def test_spawn_kwargs(monkeypatch):
+    monkeypatch.setattr(util, '_POSIX_SPAWN', True)
+    assert util._spawn_kwargs({}) == {'close_fds': False}
+    assert util._spawn_kwargs({'close_fds': True}) == {'close_fds': True}
+    # `posix_spawn` cannot change the directory
+    assert util._spawn_kwargs({'cwd': '.'}) == {'cwd': '.'}
+    # nor start a new session
+    kwargs = {'start_new_session': True}
+    assert util._spawn_kwargs(kwargs) == {'start_new_session': True}
+
+    monkeypatch.setattr(util, '_POSIX_SPAWN', False)
+    assert util._spawn_kwargs({}) == {}
+
+
+def test_cmd_output_b_posix_spawn(monkeypatch):
+    monkeypatch.setattr(util, '_POSIX_SPAWN', True)
+    cmd = (sys.executable, '-c', 'print("hi")')
+    assert cmd_output_b(*cmd) == (0, b'hi\n', b'')
+
+
 @pytest.mark.parametrize('fn', (cmd_output_b, cmd_output_p))
 def test_cmd_output_no_shebang(tmpdir, fn):
     f = tmpdir.join('f').ensure()
@@ -107,6 +137,139 @@ def test_cmd_output_no_shebang(tmpdir, fn):
     assert out.endswith(b'\n')
 
 
+@pytest.mark.parametrize('fn', (cmd_output_stream_b, cmd_output_stream_p))
+def test_cmd_output_stream(fn):
+    out = io.BytesIO()
+    ret = fn(
+        sys.executable, '-c',
+        'import sys; print("out"); sys.stdout.flush(); '
+        'print("err", file=sys.stderr); raise SystemExit(3)',
+        out=out,
+    )
+    assert ret == 3
+    assert out.getvalue().replace(b'\r\n', b'\n') == b'out\nerr\n'
+
+
+@pytest.mark.parametrize('fn', (cmd_output_stream_b, cmd_output_stream_p))
+def test_cmd_output_stream_exe_not_found(fn):
+    out = io.BytesIO()
+    assert fn('dne', out=out) == 1
+    assert out.getvalue() == b'Executable `dne` not found'
+
+
+@xfailif_windows
+@pytest.mark.parametrize('pty', (False, True))
+def test_cmd_output_stream_async(pty):
+    out = io.BytesIO()
+    ret = asyncio.run(
+        cmd_output_stream_async(
+            sys.executable, '-c',
+            'import sys; print(sys.stdout.isatty()); sys.stdout.flush(); '
+            'print("err", file=sys.stderr); raise SystemExit(3)',
+            out=out, pty=pty,
+        ),
+    )
+    assert ret == 3
+    expected = f'{pty}\nerr\n'.encode()
+    assert out.getvalue().replace(b'\r\n', b'\n') == expected
+
+
+@xfailif_windows
+def test_cmd_output_stream_async_exe_not_found():
+    out = io.BytesIO()
+    assert asyncio.run(cmd_output_stream_async('dne', out=out)) == 1
+    assert out.getvalue() == b'Executable `dne` not found'
+
+
+@xfailif_windows
+def test_cmd_output_stream_async_timeout():
+    out = io.BytesIO()
+    start = time.monotonic()
+    # the background process keeps the output open, it is killed as well
+    ret = asyncio.run(
+        cmd_output_stream_async(
+            'bash', '-c', 'echo hi; sleep 10 & sleep 10',
+            out=out, timeout=.5,
+        ),
+    )
+    assert time.monotonic() - start < 5
+    assert ret == TIMEOUT_RETURNCODE
+    assert out.getvalue() == b'hi\n\n[timed out after 0.5s]\n'
+
+
+@xfailif_windows
+@pytest.mark.parametrize(
+    ('kwargs', 'new_session'),
+    (({}, False), ({'kill_group': True}, True), ({'timeout': 60}, True)),
+)
+def test_cmd_output_stream_async_new_session(kwargs, new_session):
+    out = io.BytesIO()
+    prog = 'import os; print(os.getsid(0))'
+    ret = asyncio.run(
+        cmd_output_stream_async(sys.executable, '-c', prog, out=out, **kwargs),
+    )
+    assert ret == 0
+    assert (int(out.getvalue()) != os.getsid(0)) is new_session
+
+
+@xfailif_windows
+@pytest.mark.parametrize(
+    ('kill_group', 'close_fds'), ((False, False), (True, True)),
+)
+def test_cmd_output_stream_async_posix_spawn(
+        monkeypatch, kill_group, close_fds,
+):
+    monkeypatch.setattr(util, '_POSIX_SPAWN', True)
+    popen = subprocess.Popen
+    calls = []
+
+    def _popen(*args, **kwargs):
+        calls.append(kwargs.get('close_fds', True))
+        return popen(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, 'Popen', _popen)
+    out = io.BytesIO()
+    prog = 'print("hi")'
+    ret = asyncio.run(
+        cmd_output_stream_async(
+            sys.executable, '-c', prog, out=out, kill_group=kill_group,
+        ),
+    )
+    assert ret == 0
+    assert out.getvalue() == b'hi\n'
+    assert calls == [close_fds]
+
+
+@xfailif_windows
+def test_cmd_output_stream_async_cancelled(tmpdir):
+    pidfile = tmpdir.join('pid')
+
+    async def run() -> None:
+        task = asyncio.create_task(
+            cmd_output_stream_async(
+                'bash', '-c', f'echo $$ > {pidfile}; sleep 10',
+                out=io.BytesIO(),
+            ),
+        )
+        while not pidfile.exists() or not pidfile.read().strip():
+            await asyncio.sleep(.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    pid = int(pidfile.read())
+    # the process is reaped by the event loop's child watcher
+    for _ in range(100):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(.01)
+    else:
+        raise AssertionError(f'{pid} is still running')
+
+
 def test_parse_version():
     assert parse_version('0.0') == parse_version('0.0')
     assert parse_version('0.0.post1') == parse_version('0.0.post1')
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from before_commit import jobserver
+from before_commit import worker
+from before_commit import xargs
+from before_commit.languages import pygrep
+from testing.fixtures import make_hook
+
+
+def _worker_cmd(prog):
+    return (sys.executable, '-c', prog)
+
+
+# answers once it received two requests, in reverse order
+REVERSED = '''\
+import json, sys
+requests = [json.loads(sys.stdin.readline()) for _ in range(2)]
+for request in reversed(requests):
+    out = ' '.join(request['arguments']) + '\\n'
+    response = {'requestId': request['requestId'], 'output': out}
+    print(json.dumps(response), flush=True)
+'''
+
+
+def test_run_responses_out_of_order():
+    ret, out = worker.run(
+        _worker_cmd(REVERSED), ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'),
+        target_concurrency=2,
+    )
+    assert ret == 0
+    assert out == b'a b c d\ne f g h\n'
+
+
+def test_run_no_arguments():
+    prog = '''\
+import json, sys
+for line in sys.stdin:
+    request = json.loads(line)
+    out = f'{request["arguments"]}\\n'
+    response = {'requestId': request['requestId'], 'output': out}
+    print(json.dumps(response), flush=True)
+'''
+    ret, out = worker.run(_worker_cmd(prog), ())
+    assert ret == 0
+    assert out == b'[]\n'
+
+
+def test_run_takes_max_exit_code():
+    prog = '''\
+import json, sys
+for line in sys.stdin:
+    request = json.loads(line)
+    code = max(int(arg) for arg in request['arguments'])
+    response = {'requestId': request['requestId'], 'exitCode': code}
+    print(json.dumps(response), flush=True)
+'''
+    ret, out = worker.run(
+        _worker_cmd(prog), ('0', '0', '0', '0', '1', '3', '2', '0'),
+        target_concurrency=2,
+    )
+    assert ret == 3
+    assert out == b''
+
+
+def test_run_restarts_crashed_worker(tmpdir):
+    crashed = tmpdir.join('crashed')
+    prog = f'''\
+import json, os, sys
+for line in sys.stdin:
+    request = json.loads(line)
+    if 'e' in request['arguments'] and not os.path.exists({str(crashed)!r}):
+        open({str(crashed)!r}, 'w').close()
+        raise SystemExit(1)
+    response = {{'requestId': request['requestId'], 'output': 'ok\\n'}}
+    print(json.dumps(response), flush=True)
+'''
+    ret, out = worker.run(
+        _worker_cmd(prog), ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'),
+        target_concurrency=2,
+    )
+    assert crashed.exists()
+    assert ret == 0
+    assert out == b'ok\nok\n'
+
+
+def test_run_worker_keeps_crashing():
+    prog = 'import sys; print("oops", file=sys.stderr); raise SystemExit(3)'
+    ret, out = worker.run(_worker_cmd(prog), ('a',))
+    assert ret == 1
+    assert out == b'[worker failed: exited with code 3]\noops\n'
+
+
+def test_run_invalid_response():
+    prog = 'import sys; sys.stdin.readline(); print("wat", flush=True)'
+    ret, out = worker.run(_worker_cmd(prog), ('a',))
+    assert ret == 1
+    assert out == b"[worker failed: invalid response: b'wat\\n']\n"
+
+
+PIDS = '''\
+import json, os, sys
+for line in sys.stdin:
+    request = json.loads(line)
+    response = {'requestId': request['requestId'], 'output': f'{os.getpid()}'}
+    print(json.dumps(response), flush=True)
+'''
+
+
+def test_run_persistent_worker():
+    with worker.persistent():
+        first = worker.run(_worker_cmd(PIDS), ('a',))
+        second = worker.run(_worker_cmd(PIDS), ('a', 'b'), args=('-v',))
+        other = worker.run(_worker_cmd(PIDS + '\n'), ('a',))
+        assert worker._workers is not None
+        processes = tuple(worker._workers[1].values())
+    assert first == second
+    assert first != other
+    # the workers exit at the end of the block
+    assert [process.proc.returncode for process in processes] == [0, 0]
+
+
+def test_run_worker_not_persistent():
+    first = worker.run(_worker_cmd(PIDS), ('a',))
+    assert worker.run(_worker_cmd(PIDS), ('a',)) != first
+
+
+# answers whether the next request was sent before it answered this one
+QUEUED = '''\
+import json, os, select, time
+def lines():  # unbuffered, so the next request is left in the pipe
+    line = b''
+    for c in iter(lambda: os.read(0, 1), b''):
+        line += c
+        if c == b'\\n':
+            yield line
+            line = b''
+for line in lines():
+    request = json.loads(line)
+    time.sleep(.1)
+    queued = bool(select.select([0], [], [], 0)[0])
+    response = {'requestId': request['requestId'], 'output': f'{queued}\\n'}
+    print(json.dumps(response), flush=True)
+'''
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='posix only')
+@pytest.mark.parametrize(
+    ('jobs', 'expected'), ((1, b'False\nFalse\n'), (2, b'True\nFalse\n')),
+)
+def test_run_request_per_job_token(jobs, expected):
+    with jobserver.jobs(jobs):
+        ret, out = worker.run(
+            _worker_cmd(QUEUED), ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'),
+            target_concurrency=2,
+        )
+    assert (ret, out) == (0, expected)
+
+
+def test_run_executable_not_found():
+    ret, out = worker.run(('dne',), ('a',))
+    assert ret == 1
+    assert out == b'Executable `dne` not found'
+
+
+SERVE = '''\
+import sys
+from before_commit import worker
+
+def handle(arguments):
+    if arguments == ['exit']:
+        raise SystemExit(4)
+    elif arguments == ['error']:
+        raise ValueError('wat')
+    print(' '.join(arguments))
+    print('err', file=sys.stderr)
+    return len(arguments)
+
+print('not a response')
+raise SystemExit(worker.serve(handle))
+'''
+
+
+def _serve(*arguments):
+    requests = b''.join(
+        f'{json.dumps({"requestId": i, "arguments": args})}\n'.encode()
+        for i, args in enumerate(arguments, 1)
+    )
+    proc = subprocess.run(
+        (sys.executable, '-c', SERVE),
+        input=requests, stdout=subprocess.PIPE, check=True,
+    )
+    lines = proc.stdout.decode().splitlines()
+    assert lines[0] == 'not a response'
+    return [json.loads(line) for line in lines[1:]]
+
+
+def test_serve():
+    assert _serve(['a'], ['b', 'c']) == [
+        {'requestId': 1, 'exitCode': 1, 'output': 'a\nerr\n'},
+        {'requestId': 2, 'exitCode': 2, 'output': 'b c\nerr\n'},
+    ]
+
+
+def test_serve_handler_errors():
+    first, second = _serve(['exit'], ['error'])
+    assert first == {'requestId': 1, 'exitCode': 4, 'output': ''}
+    assert second['exitCode'] == 1
+    assert second['output'].endswith('ValueError: wat\n')
+
+
+@pytest.mark.parametrize(
+    'args',
+    (
+        ('TODO',),
+        ('-i', 'todo'),
+        ('--negate', 'TODO'),
+        ('--multiline', 'foo\nbar'),
+        ('--multiline', '--negate', 'foo\nbar'),
+    ),
+)
+def test_pygrep_worker_conformance(tmpdir, args):
+    for i in range(20):
+        contents = 'foo\nbar\n' if i % 3 else f'# TODO: {i}\n'
+        tmpdir.join(f'f{i}.py').write(contents)
+    filenames = sorted(str(f) for f in tmpdir.listdir())
+    exe = (sys.executable, '-m', pygrep.__name__, *args)
+
+    expected = xargs.xargs(exe, filenames)
+    ret = worker.run(exe, filenames, target_concurrency=4)
+    assert ret == expected
+
+
+@pytest.mark.parametrize('use_worker', (True, False))
+def test_pygrep_run_hook(tmpdir, use_worker):
+    f = tmpdir.join('f.py')
+    f.write('# TODO\n')
+    hook = make_hook(
+        language='pygrep', args=['-i'], entry='todo', worker=use_worker,
+    )
+    ret = pygrep.run_hook(hook, (str(f),), color=False)
+    assert ret == (1, f'{f}:1:# TODO\n'.encode())
@@ -2,13 +2,17 @@ from __future__ import annotations
 
 import concurrent.futures
 import os
+import pickle
 import sys
+import tempfile
 import time
+from typing import Any
 from unittest import mock
 
 import pytest
 
 from before_commit import parse_shebang
+from before_commit import trace
 from before_commit import xargs
 
 
@@ -92,6 +96,13 @@ def test_argument_too_long_with_large_unicode(linux_mock):
         xargs.partition(cmd, varargs, 1, _max_length=20)
 
 
+def test_partition_limit_undecodable_linux(linux_mock):
+    cmd = ('ninechars',)
+    varargs = (os.fsdecode(b'\xff') * 5,)
+    ret = xargs.partition(cmd, varargs, 1, _max_length=16)
+    assert ret == (cmd + varargs,)
+
+
 def test_partition_target_concurrency():
     ret = xargs.partition(
         ('foo',), ('A',) * 22,
@@ -99,13 +110,20 @@ def test_partition_target_concurrency():
         _max_length=50,
     )
     assert ret == (
-        ('foo',) + ('A',) * 6,
-        ('foo',) + ('A',) * 6,
         ('foo',) + ('A',) * 6,
         ('foo',) + ('A',) * 4,
+        ('foo',) + ('A',) * 4,
+        ('foo',) + ('A',) * 4,
+        ('foo',) + ('A',) * 4,
     )
 
 
+def test_partition_target_concurrency_partitions_shrink():
+    ret = xargs.partition(('foo',), ('A',) * 100, 4, _max_length=4096)
+    sizes = [len(part) - 1 for part in ret]
+    assert sizes == [25, 19, 14, 11, 8, 6, 5, 4, 4, 4]
+
+
 def test_partition_target_concurrency_wont_make_tiny_partitions():
     ret = xargs.partition(
         ('foo',), ('A',) * 10,
@@ -119,6 +137,97 @@ def test_partition_target_concurrency_wont_make_tiny_partitions():
     )
 
 
+def test_partition_by_size(tmpdir):
+    sizes = {'a': 50, 'b': 10, 'c': 40, 'd': 30, 'e': 20, 'f': 0, 'g': 0}
+    files = []
+    for name, size in sizes.items():
+        tmpdir.join(name).write('x' * size)
+        files.append(str(tmpdir.join(name)))
+    ret = xargs.partition(('foo',), files, 2, strategy='size')
+    names = [[os.path.basename(f) for f in part[1:]] for part in ret]
+    # largest first, each to the partition with the smallest total
+    assert names == [['a', 'b', 'e'], ['c', 'd', 'f', 'g']]
+
+
+def test_partition_by_size_wont_make_tiny_partitions():
+    ret = xargs.partition(
+        ('foo',), ('a', 'b', 'c', 'd', 'e'), 4, strategy='size',
+    )
+    assert len(ret) == 2
+
+
+def test_partition_by_directory():
+    files = ('a/1', 'b/1', 'a/2', 'c/1', 'b/2', 'a/3', 'c/2', 'b/3')
+    ret = xargs.partition(('foo',), files, 2, strategy='directory')
+    assert ret == (
+        ('foo', 'a/1', 'a/2', 'a/3', 'c/1', 'c/2'),
+        ('foo', 'b/1', 'b/2', 'b/3'),
+    )
+
+
+@pytest.mark.parametrize(
+    ('files', 'expected'),
+    (
+        pytest.param(
+            ('1', '2', '3', '4', '5', '6', '7', '8'),
+            (('foo', '1', '2', '3', '4'), ('foo', '5', '6', '7', '8')),
+            id='flat',
+        ),
+        pytest.param(
+            ('a/1', 'a/2', 'a/3', 'a/4', 'a/5', 'a/6', 'b/1', 'c/1'),
+            (
+                ('foo', 'a/1', 'a/2', 'a/3', 'a/4'),
+                ('foo', 'a/5', 'a/6', 'b/1', 'c/1'),
+            ),
+            id='one large directory',
+        ),
+    ),
+)
+def test_partition_by_directory_splits_large_directories(files, expected):
+    ret = xargs.partition(('foo',), files, 2, strategy='directory')
+    assert ret == expected
+
+
+def test_partition_by_directory_still_limited_by_length():
+    files = ('a/1', 'a/2', 'a/3')
+    ret = xargs.partition(
+        ('foo',), files, 1, _max_length=12, strategy='directory',
+    )
+    assert ret == (('foo', 'a/1', 'a/2'), ('foo', 'a/3'))
+
+
+def test_xargs_partition_strategy():
+    ret, out = xargs.xargs(
+        ('echo',), ('a/1', 'b/1', 'a/2'), partition_strategy='directory',
+    )
+    assert ret == 0
+    assert out.replace(b'\r\n', b'\n') == b'a/1 a/2 b/1\n'
+
+
+def test_partition_min_partition_cost(tmpdir):
+    files = []
+    for i in range(20):
+        tmpdir.join(str(i)).write('x' * 99)
+        files.append(str(tmpdir.join(str(i))))
+    # the files cost 2000, worth 2 processes
+    ret = xargs.partition(
+        ('foo',), files, 8, strategy='size', min_partition_cost=1000,
+    )
+    assert len(ret) == 2
+    ret = xargs.partition(('foo',), files, 8, min_partition_cost=5000)
+    assert len(ret) == 1
+
+
+def test_xargs_cost_key(tmpdir):
+    tmpdir.join('f').write('hello')
+    events: list[dict[str, Any]] = []
+    with trace.recording(events):
+        xargs.xargs(('echo',), (str(tmpdir.join('f')),), cost_key='k')
+    event, = events
+    assert event['args']['key'] == 'k'
+    assert event['args']['cost'] == 6
+
+
 def test_argument_too_long():
     with pytest.raises(xargs.ArgumentTooLongError):
         xargs.partition(('a' * 5,), ('a' * 5,), 1, _max_length=10)
@@ -130,6 +239,80 @@ def test_xargs_smoke():
     assert out.replace(b'\r\n', b'\n') == b'hello world\n'
 
 
+def test_bounded_output_in_memory():
+    out = xargs._BoundedOutput(11)
+    out.write(b'hello ')
+    out.write(b'world')
+    assert out.getvalue() == b'hello world'
+
+
+def test_bounded_output_spills_to_file():
+    out = xargs._BoundedOutput(8)
+    out.write(b'hello ')
+    out.write(b'world')
+    out.write(b'!\n')
+    ret = out.getvalue()
+    assert ret == b'hello wo'
+
+    with xargs.spilled(ret) as (head, spill):
+        assert head == b'hello wo'
+        assert spill is not None
+        assert spill.read() == b'rld!\n'
+        filename = spill.name
+    assert not os.path.exists(filename)
+
+
+def test_spilled_output_pickles():
+    out = xargs._BoundedOutput(2)
+    out.write(b'hello')
+    ret = pickle.loads(pickle.dumps(out.getvalue()))
+    with xargs.spilled(ret) as (head, spill):
+        assert head == b'he'
+        assert spill is not None
+        assert spill.read() == b'llo'
+
+
+def test_spilled_not_spilled():
+    with xargs.spilled(b'hello world\n') as (out, spill):
+        assert (out, spill) == (b'hello world\n', None)
+
+
+@pytest.mark.parametrize('directory', ('.', tempfile.gettempdir()))
+def test_spilled_other_file(tmpdir, directory):
+    # the output of a hook looks like it names a file
+    filename = os.path.join(directory, 'before-commit-x.log')
+    out = f'hi\n[the rest of the output is in {filename}]\n'.encode()
+    with tmpdir.as_cwd():
+        open('before-commit-x.log', 'w').close()
+        with xargs.spilled(out) as ret:
+            assert ret == (out, None)
+        assert os.path.exists('before-commit-x.log')
+
+
+def test_xargs_output_grouped_by_partition():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    # the first partition finishes last
+    args = ('sleep .2; echo 1; echo 1', 'echo 2; echo 2')
+    ret, stdout = xargs.xargs(
+        bash_cmd, args,
+        target_concurrency=2,
+        _max_length=len(' '.join(bash_cmd + args[:1])) + 1,
+    )
+    assert ret == 0
+    assert stdout == b'1\n1\n2\n2\n'
+
+
+def test_xargs_output_truncated():
+    ret, stdout = xargs.xargs(
+        ('echo',), ('hello', 'world'), _max_output=5,
+    )
+    assert ret == 0
+    with xargs.spilled(stdout) as (head, spill):
+        assert head == b'hello'
+        assert spill is not None
+        assert spill.read() == b' world\n'
+
+
 exit_cmd = parse_shebang.normalize_cmd(('bash', '-c', 'exit $1', '--'))
 # Abuse max_length to control the exit code
 max_length = len(' '.join(exit_cmd)) + 3
@@ -147,6 +330,19 @@ def test_xargs_retcode_normal():
     assert ret == 5
 
 
+def test_xargs_more_partitions_than_workers_output_in_order():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    # the other partitions are picked up by a worker while the first runs
+    args = ('sleep .2; echo 1',) + ('sleep 0; echo 2',) * 4
+    ret, stdout = xargs.xargs(
+        bash_cmd, args,
+        target_concurrency=2,
+        _max_length=len(' '.join(bash_cmd + args[:1])) + 1,
+    )
+    assert ret == 0
+    assert stdout == b'1\n2\n2\n2\n2\n'
+
+
 def test_xargs_concurrency():
     bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
     print_pid = ('sleep 0.5 && echo $$',)
@@ -198,6 +394,54 @@ def test_xargs_color_true_makes_tty():
     assert out == b'True\n'
 
 
+@pytest.mark.xfail(os.name == 'nt', reason='posix only')
+def test_xargs_timeout():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    args = ('echo 1', 'echo 2; sleep 10')
+    start = time.time()
+    ret, stdout = xargs.xargs(
+        bash_cmd, args,
+        target_concurrency=2,
+        timeout=.5,
+        _max_length=len(' '.join(bash_cmd + args[1:])) + 1,
+    )
+    assert time.time() - start < 5
+    assert ret == 124
+    assert stdout == b'1\n2\n\n[timed out after 0.5s]\n'
+
+
+@pytest.mark.xfail(os.name == 'nt', reason='posix only')
+def test_xargs_fail_fast_cancels_other_partitions():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    args = ('echo 1', 'sleep .1; exit 1', 'sleep 10', 'sleep 10')
+    start = time.time()
+    ret, stdout = xargs.xargs(
+        bash_cmd, args,
+        target_concurrency=3,
+        fail_fast=True,
+        _max_length=len(' '.join(bash_cmd + args[1:2])) + 1,
+    )
+    assert time.time() - start < 5
+    assert ret == 1
+    assert stdout == (
+        b'1\n'
+        b'[partition 3 of 4 cancelled: 1 files not checked]\n'
+        b'[partition 4 of 4 cancelled: 1 files not checked]\n'
+    )
+
+
+def test_xargs_without_fail_fast_runs_every_partition():
+    bash_cmd = parse_shebang.normalize_cmd(('bash', '-c'))
+    args = ('exit 1', 'sleep .1; echo 2')
+    ret, stdout = xargs.xargs(
+        bash_cmd, args,
+        target_concurrency=2,
+        _max_length=len(' '.join(bash_cmd + args[1:])) + 1,
+    )
+    assert ret == 1
+    assert stdout == b'2\n'
+
+
 @pytest.mark.xfail(os.name == 'posix', reason='nt only')
 @pytest.mark.parametrize('filename', ('t.bat', 't.cmd', 'T.CMD'))
 def test_xargs_with_batch_files(tmpdir, filename):